@@ -7,14 +7,19 @@ from sphinx.transforms.post_transforms import SphinxPostTransform
 
 # TO DO - HTML outputs for exercise and activity
 
-from typing import Any, Dict, List
+from html import escape
+from typing import Any, Callable, Dict, List
+import json
+
 from docutils import nodes
 from docutils.parsers.rst import directives
 from sphinx.application import Sphinx
+from sphinx.config import Config
 from sphinx.util import logging
-from sphinx.util.docutils import SphinxDirective
-from sphinx_design.shared import create_component, is_component
+from sphinx.util.docutils import SphinxDirective, SphinxTranslator
 
+from sphinxcontrib_ou_media.compress import setup_precompression
+from sphinxcontrib_ou_media.inventory import ENV_VERSION, note_directive, setup_inventory
 from sphinxcontrib_ou_media.utils import hack_uuid, handle_css_js_assets
 
 __author__ = "Mark Hall & Tony Hirst"
@@ -26,6 +31,14 @@ __version__ = "0.0.1"
 
 logger = logging.getLogger(__name__)
 
+
+def create_component(*args, **kwargs) -> nodes.container:
+    """Create a sphinx-design component, importing sphinx_design on first use."""
+    from sphinx_design.shared import create_component
+
+    return create_component(*args, **kwargs)
+
+
 SUPPORTED_OPTIONS: List[str] = [
     "timing",
 ]
@@ -47,6 +60,8 @@ class OU_CustomInternalDirective(SphinxDirective):
             classes=[component_name],
             rawtext=self.content,
         )
+        self.set_source_info(component)
+        note_directive(self, component)
         self.state.nested_parse(self.content, self.content_offset, component)
         return [component]
 
@@ -59,6 +74,12 @@ class OU_AnswerDirective(OU_CustomInternalDirective):
     component_name = "ou-answer"
 
 
+class ou_interaction_choices(nodes.General, nodes.Element):
+    """Choice question options, held as a list of option dicts."""
+
+    pass
+
+
 class OU_InteractionDirective(SphinxDirective):
     """Generic components..."""
 
@@ -99,11 +120,16 @@ class OU_InteractionDirective(SphinxDirective):
             size=size,
             id=id,
         )
+        self.set_source_info(component)
+        note_directive(self, component)
         if not self.content:
             self.state.nested_parse(self.content, self.content_offset, component)
             return [component]
 
         if typ in ["multiple", "single"]:
+            # Keep the options as compact data; InteractionChoicesTransform
+            # renders them for each output format
+            options = []
             for item in self.content:
                 if not item.strip():
                     continue
@@ -114,32 +140,17 @@ class OU_InteractionDirective(SphinxDirective):
                 item_ = txt.split("::")
                 txt = item_[0].strip()
                 feedback = item_[1].strip() if len(item_) == 2 else None
-                if item[0].upper() == "T":
-                    response = create_component(
-                        "Right",
-                        rawtext=txt,
-                        children=[nodes.Text(txt, txt)],
-                    )
-                    if feedback:
-                        response += create_component(
-                            "Feedback",
-                            rawtext=feedback,
-                            children=[nodes.Text(feedback, feedback)],
-                        )
-                    component += response
-                elif item[0].upper() == "F":
-                    response = create_component(
-                        "Wrong",
-                        rawtext=txt,
-                        children=[nodes.Text(txt, txt)],
+                if item[0].upper() in ["T", "F"]:
+                    options.append(
+                        {
+                            "correct": item[0].upper() == "T",
+                            "text": txt,
+                            "feedback": feedback,
+                        }
                     )
-                    if feedback:
-                        response += create_component(
-                            "Feedback",
-                            rawtext=feedback,
-                            children=[nodes.Text(feedback, feedback)],
-                        )
-                    component += response
+            component += ou_interaction_choices(
+                interaction=id, type=typ, options=options
+            )
         else:
             self.state.nested_parse(self.content, self.content_offset, component)
         return [component]
@@ -162,6 +173,8 @@ class OU_CustomActExDirective(SphinxDirective):
     def run(self):
         component_name = self.component_name
         activity = create_component(component_name, rawtext=self.content)
+        self.set_source_info(activity)
+        note_directive(self, activity)
         heading = " ".join(self.arguments)
         activity += create_component(
             "ou-title",
@@ -188,41 +201,80 @@ class OU_ExerciseDirective(OU_CustomActExDirective):
     component_name = "ou-exercise"
 
 
-# HtmlTransform classes from Mark Hall's ou-book-theme
-class ActivityAnswerHtmlTransform(SphinxPostTransform):
-    """Transform activity containers into the HTML specific AST structures."""
+# Handlers that rewrite OU components into the HTML specific AST structures,
+# by component name. They are all applied in a single walk of the document
+# by ActivityHtmlTransform, however many component types there are.
+HTML_COMPONENT_HANDLERS: Dict[str, Callable[[nodes.Element, Config], None]] = {}
 
-    default_priority = 199
-    formats = ("html",)
 
-    def run(self):
-        """Run the transform"""
-        document: nodes.document = self.document
-        for node in document.findall(lambda node: is_component(node, "ou-answer")):
-            newnode = create_component(
-                "ou-activity-answer",
-                classes=["ou-activity-answer"],
-            )
-            newnode += nodes.raw("", "<hr/>", format="html")
-            newnode += nodes.raw(
-                "",
-                '<button class="sd-btn sd-btn-info ou-toggle ou-toggle-hidden"><span class="ou-toggle-hide">Hide answer</span><span class="ou-toggle-show">Show answer</span></button>',  # noqa: E501
-                format="html",
-            )
-            content_container = create_component(
-                "ou-activity-answer-content",
-                classes=["ou-activity-answer-content"],
-                children=node.children,
-            )
-            newnode += content_container
-            node.replace_self(newnode)
+def html_component_handler(*component_names: str):
+    """Register a function as the HTML handler for the named components."""
+
+    def register(handler: Callable[[nodes.Element, Config], None]):
+        for component_name in component_names:
+            HTML_COMPONENT_HANDLERS[component_name] = handler
+        return handler
+
+    return register
+
+
+# Handlers from Mark Hall's ou-book-theme HtmlTransform classes
+@html_component_handler("ou-answer")
+def answer_html(node: nodes.Element, config: Config) -> None:
+    """Transform an answer container into a toggled answer block.
+
+    In the "template" answer mode, the answer content is emitted inside an
+    inert <template> element, which ou_activities.js only inserts into the
+    page the first time the answer is shown.
+    """
+    newnode = create_component(
+        "ou-activity-answer",
+        classes=["ou-activity-answer"],
+    )
+    newnode += nodes.raw("", "<hr/>", format="html")
+    newnode += nodes.raw(
+        "",
+        '<button class="sd-btn sd-btn-info ou-toggle ou-toggle-hidden"><span class="ou-toggle-hide">Hide answer</span><span class="ou-toggle-show">Show answer</span></button>',  # noqa: E501
+        format="html",
+    )
+    content_container = create_component(
+        "ou-activity-answer-content",
+        classes=["ou-activity-answer-content"],
+        children=node.children,
+    )
+    if config.ou_activity_answer_mode == "template":
+        newnode += nodes.raw(
+            "", '<template class="ou-activity-answer-template">', format="html"
+        )
+        newnode += content_container
+        newnode += nodes.raw("", "</template>", format="html")
+    else:
+        newnode += content_container
+    node.replace_self(newnode)
 
 
 # TO DO - at the moment we treat exercise and activity the same way
 
 
+@html_component_handler("ou-activity", "ou-exercise")
+def activity_html(node: nodes.Element, config: Config) -> None:
+    """Transform an activity or exercise container into a titled block."""
+    newnode = create_component(
+        "ou-activity",
+        classes=["ou-activity"],
+    )
+    title_node = create_component(
+        "ou-activity-title",
+        classes=["ou-activity-title"],
+        children=node.children[0].children,
+    )
+    newnode += title_node
+    newnode += node.children[1:]
+    node.replace_self(newnode)
+
+
 class ActivityHtmlTransform(SphinxPostTransform):
-    """Transform activity containers into the HTML specific AST structures."""
+    """Transform OU component containers into the HTML specific AST structures."""
 
     default_priority = 198
     formats = ("html",)
@@ -230,22 +282,88 @@ class ActivityHtmlTransform(SphinxPostTransform):
     def run(self):
         """Run the transform"""
         document: nodes.document = self.document
-        for node in document.findall(
-            lambda node: is_component(node, "ou-activity")
-            or is_component(node, "ou-exercise")
-        ):
-            newnode = create_component(
-                "ou-activity",
-                classes=["ou-activity"],
-            )
-            title_node = create_component(
-                "ou-activity-title",
-                classes=["ou-activity-title"],
-                children=node.children[0].children,
+        # Collect matches first, since handlers replace nodes. Handlers run in
+        # document order, so containers are rewritten before their contents;
+        # the contents are moved, not copied, so nested matches stay valid.
+        matches = [
+            (node, HTML_COMPONENT_HANDLERS[node["design_component"]])
+            for node in document.findall(nodes.container)
+            if node.get("design_component") in HTML_COMPONENT_HANDLERS
+        ]
+        for node, handler in matches:
+            handler(node, self.config)
+
+
+def expand_choices(node: ou_interaction_choices) -> List[nodes.Element]:
+    """Return the Right/Wrong/Feedback components for choice options."""
+    responses = []
+    for option in node["options"]:
+        txt = option["text"]
+        response = create_component(
+            "Right" if option["correct"] else "Wrong",
+            rawtext=txt,
+            children=[nodes.Text(txt, txt)],
+        )
+        feedback = option["feedback"]
+        if feedback:
+            response += create_component(
+                "Feedback",
+                rawtext=feedback,
+                children=[nodes.Text(feedback, feedback)],
             )
-            newnode += title_node
-            newnode += node.children[1:]
-            node.replace_self(newnode)
+        responses.append(response)
+    return responses
+
+
+class InteractionChoicesTransform(SphinxPostTransform):
+    """Render compact choice question options for the output format.
+
+    For HTML, the options of every question on the page are written to a
+    single JSON island, which ou_activities.js uses to build each question
+    when it is needed. Other formats get Right/Wrong/Feedback components.
+    """
+
+    default_priority = 199
+
+    def run(self):
+        """Run the transform"""
+        document: nodes.document = self.document
+        choices = list(document.findall(ou_interaction_choices))
+        if not choices:
+            return
+        data = {}
+        for node in choices:
+            if node["interaction"] in data:
+                # The HTML placeholders and JSON island are keyed by id, so
+                # later questions would show the first one's options
+                logger.warning(
+                    f"ou-interaction: duplicate id {node['interaction']!r}; "
+                    "ids must be unique on a page",
+                    location=node.parent,
+                )
+                continue
+            data[node["interaction"]] = {"type": node["type"], "options": node["options"]}
+        if self.app.builder.format != "html":
+            for node in choices:
+                node.replace_self(expand_choices(node))
+            return
+        # Stop the JSON closing the script element early
+        data_json = json.dumps(data, separators=(",", ":")).replace("</", "<\\/")
+        document += nodes.raw(
+            "",
+            f'<script type="application/json" class="ou-interaction-data">{data_json}</script>',  # noqa: E501
+            format="html",
+        )
+
+
+def visit_ou_interaction_choices_html(
+    translator: SphinxTranslator, node: ou_interaction_choices
+) -> None:
+    """Placeholder for a choice question, built client side."""
+    translator.body.append(
+        f'<div class="ou-interaction-choices" data-ou-interaction="{escape(node["interaction"])}"></div>'  # noqa: E501
+    )
+    raise nodes.SkipNode
 
 
 # TO DO
@@ -259,7 +377,7 @@ T and F map on <Right> and <Wrong>
 """
 
 
-def setup(app: Sphinx) -> Dict[str, bool]:
+def setup(app: Sphinx) -> Dict[str, Any]:
     """Add exercise node and parameters to the Sphinx builder."""
     app.add_directive("ou-activity", OU_ActivityDirective)
     app.add_directive("ou-exercise", OU_ExerciseDirective)
@@ -267,13 +385,21 @@ def setup(app: Sphinx) -> Dict[str, bool]:
     app.add_directive("ou-discussion", OU_DiscussionDirective)
     app.add_directive("ou-interaction", OU_InteractionDirective)
 
+    app.add_node(
+        ou_interaction_choices, html=(visit_ou_interaction_choices_html, None)
+    )
     app.add_post_transform(ActivityHtmlTransform)
-    app.add_post_transform(ActivityAnswerHtmlTransform)
+    app.add_post_transform(InteractionChoicesTransform)
+    # "inline" or "template" (answer content only added to the page on demand)
+    app.add_config_value("ou_activity_answer_mode", "inline", "html")
 
     # Pass in the stub filename used in static/js/STUB.js etc
     handle_css_js_assets(app, "ou_activities")
+    setup_precompression(app)
+    setup_inventory(app)
 
     return {
+        "env_version": ENV_VERSION,
         "parallel_read_safe": True,
         "parallel_write_safe": True,
     }
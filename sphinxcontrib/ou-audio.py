@@ -4,7 +4,7 @@ Originally based on https://github.com/sphinx-contrib/video/
 """
 
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 import urllib
 
@@ -16,6 +16,11 @@ from sphinx.util import logging
 from sphinx.util.docutils import SphinxDirective, SphinxTranslator
 from sphinx.transforms.post_transforms import SphinxPostTransform
 
+from sphinxcontrib_ou_media.inventory import ENV_VERSION, note_directive, setup_inventory
+from sphinxcontrib_ou_media.media import process_media, setup_media_processing
+from sphinxcontrib_ou_media.mp3 import clip_mp3, parse_time, slim_mp3
+from sphinxcontrib_ou_media.remote import note_remote_media, setup_remote_check
+
 __author__ = "Raphael Massabot & Tony Hirst"
 __version__ = "0.0.2"
 
@@ -38,7 +43,8 @@ SUPPORTED_OPTIONS: List[str] = [
 "List of the supported options attributes"
 
 
-def get_audio(src: str, env: BuildEnvironment) -> Tuple[str, str, bool]:
+def get_audio(src: str, env: BuildEnvironment, start: Optional[float] = None,
+              end: Optional[float] = None) -> Tuple[str, str, bool]:
     """Return audio and suffix.
 
     Raise a warning if not supported but do not stop the computation.
@@ -46,6 +52,8 @@ def get_audio(src: str, env: BuildEnvironment) -> Tuple[str, str, bool]:
     Args:
         src: The source of the audio file (can be local or url)
         env: the build environment
+        start: the start of an excerpt to publish, in seconds
+        end: the end of an excerpt to publish, in seconds
 
     Returns:
         the src file, the extension suffix, and whether file is remote
@@ -64,12 +72,27 @@ def get_audio(src: str, env: BuildEnvironment) -> Tuple[str, str, bool]:
     type = SUPPORTED_MIME_TYPES.get(suffix, "")
 
     is_remote = bool(urlparse(src).netloc)
-    if not is_remote:
+    clip = start is not None or end is not None
+    if clip and (is_remote or suffix != ".mp3"):
+        logger.warning(
+            f"Only local MP3 files can be clipped; publishing all of {src}",
+            location=env.docname,
+        )
+        clip = False
+    if is_remote:
+        note_remote_media(env, src)
+    else:
         # Map video paths to unique names (so that they can be put into a single
         # directory). This copies what is done for images by the process_docs method of
         # sphinx.environment.collectors.asset.ImageCollector.
         src, fullpath = env.relfn2path(src, env.docname)
         env.note_dependency(fullpath)
+        if clip:
+            # Publish just the excerpt (which has no tags to slim)
+            src = process_media(env, src, "clip", clip_mp3, start=start or 0.0, end=end)
+        elif env.config.ou_media_slim and suffix == ".mp3":
+            # Publish a copy without embedded artwork and metadata
+            src = process_media(env, src, "slim", slim_mp3)
         env.images.add_file(env.docname, src)
 
     return (src, type, is_remote)
@@ -97,6 +120,8 @@ class Audio(SphinxDirective):
         "muted": directives.flag,
         "preload": directives.unchanged,
         "class": directives.unchanged,
+        "start": directives.unchanged,
+        "end": directives.unchanged,
     }
 
     def run(self) -> List[ou_audio]:
@@ -111,8 +136,30 @@ class Audio(SphinxDirective):
             )
             preload = "auto"
 
+        # An excerpt, e.g. :start: 1:30 and :end: 3:30
+        times: Dict[str, Optional[float]] = {}
+        for option in ("start", "end"):
+            try:
+                times[option] = (
+                    parse_time(self.options[option]) if option in self.options else None
+                )
+            except ValueError:
+                logger.warning(
+                    f'The provided {option} ("{self.options[option]}") is not a time. ignoring it'
+                )
+                times[option] = None
+        if None not in times.values() and times["start"] >= times["end"]:
+            logger.warning("The provided start is not before the end. publishing all of the audio")
+            times = {"start": None, "end": None}
+
         # Get the asset location
-        sources = [get_audio(self.arguments[0], env)]
+        sources = [get_audio(self.arguments[0], env, times["start"], times["end"])]
+        # The source file, which may be published as a processed copy
+        original = [
+            env.relfn2path(self.arguments[0], env.docname)[0]
+            for _, _, is_remote in sources
+            if not is_remote
+        ]
 
         _ou_audio = ou_audio(
             src=sources[0][0],
@@ -137,6 +184,16 @@ class Audio(SphinxDirective):
                 _ou_audio += caption
             if len(node) > 1:
                 _ou_audio += nodes.legend("", *node[1:])
+        self.set_source_info(_ou_audio)
+        note_directive(
+            self,
+            _ou_audio,
+            assets=original,
+            remote=[src for src, _, is_remote in sources if is_remote],
+            artifacts=[
+                src for src, _, is_remote in sources if not is_remote and src not in original
+            ],
+        )
         return [_ou_audio]
 
 
@@ -218,7 +275,7 @@ def visit_ou_audio_unsupported(translator: SphinxTranslator, node: ou_audio) ->
     raise nodes.SkipNode
 
 
-def setup(app: Sphinx) -> Dict[str, bool]:
+def setup(app: Sphinx) -> Dict[str, Any]:
     """Add audio node and parameters to the Sphinx builder."""
     # app.add_config_value("audio_enforce_extra_source", False, "html")
     app.add_node(
@@ -233,8 +290,12 @@ def setup(app: Sphinx) -> Dict[str, bool]:
     app.add_directive("ou-audio", Audio)
     # Cribbed from https://github.com/sphinx-contrib/video/blob/master/sphinxcontrib/video/__init__.py
     app.add_post_transform(AudioPostTransform)
+    setup_remote_check(app)
+    setup_inventory(app)
+    setup_media_processing(app)
 
     return {
+        "env_version": ENV_VERSION,
         "parallel_read_safe": True,
         "parallel_write_safe": True,
     }
@@ -3,16 +3,16 @@
 Originally based on https://github.com/sphinx-contrib/video/
 """
 
-from pathlib import Path
 from typing import Any, Dict, List, Tuple
 from urllib.parse import urlparse
 
-from sphinxcontrib_ou_media.utils import resources_path, fetch_template
+from sphinxcontrib_ou_media.utils import cached_template
+
+from html import escape
 
 import json
 import os
 import uuid
-import zipfile
 
 from docutils import nodes
 from docutils.parsers.rst import directives
@@ -20,9 +20,29 @@ from sphinx.application import Sphinx
 from sphinx.environment import BuildEnvironment
 from sphinx.util import logging
 from sphinx.util.docutils import SphinxDirective, SphinxTranslator
-from sphinx.util.osutil import copyfile
 
-from sphinxcontrib_ou_media.utils import handle_css_js_assets
+from sphinxcontrib_ou_media.utils import (
+    copy_asset,
+    draft_key,
+    frame_placeholder_close,
+    frame_placeholder_open,
+    get_activation,
+    handle_css_js_assets,
+    is_draft,
+    setup_draft_mode,
+    setup_frame_activation,
+)
+from sphinxcontrib_ou_media.artifacts import setup_artifacts, snippet_job, submit_job
+from sphinxcontrib_ou_media.compress import setup_precompression
+from sphinxcontrib_ou_media.execute import cached_output, note_snippet, setup_execution
+from sphinxcontrib_ou_media.fingerprints import uses_option, watch_resources
+from sphinxcontrib_ou_media.inventory import ENV_VERSION, note_directive, setup_inventory
+from sphinxcontrib_ou_media.runtimes import (
+    runtime_url_prefix,
+    start_draft_artifact,
+    write_draft_files,
+)
+from sphinxcontrib_ou_media.wheels import WHEEL_PREFIX, bundle_wheels
 
 __author__ = "Raphael Massabot & Tony Hirst"
 __version__ = "0.0.2"
@@ -41,28 +61,61 @@ SUPPORTED_OPTIONS: List[str] = [
 ]
 "List of the supported options attributes"
 
-CODE_TEMPLATE = fetch_template(
+# Template paths; templates are only read (once) when first used
+CODE_TEMPLATE = (
     "assets", "html-zip-resources", "templates", "ou-code-index.html"
 )
 
 # Example: https://executablebooks.github.io/thebe/
 # Cribbed from: https://github.com/stevejpurves/lite-quickstart-example/tree/gh-pages
-THEBE_LITE_TEMPLATE = fetch_template(
+THEBE_LITE_TEMPLATE = (
     "assets", "html-zip-resources", "templates", "ou-thebe-lite-index.html"
 )
 
+SHINYLITE_TEMPLATE = (
+    "assets", "html-zip-resources", "templates", "ou-shinylite-py-index.html"
+)
+
+# A terminal running bare Pyodide, based on dist/pyodide-terminal-01.zip
+PYODIDE_TERMINAL_TEMPLATE = (
+    "assets", "html-zip-resources", "templates", "ou-pyodide-terminal-index.html"
+)
+
+# Child side of the iframe resize protocol, inlined into generated pages
+RESIZE_SCRIPT = (
+    "assets", "html-zip-resources", "templates", "ou-frame-resize.js"
+)
+
+THEBELITE_RUNTIME = ("assets", "html-zip-resources", "thebelite")
+PYODIDE_TERMINAL_RUNTIME = ("assets", "html-zip-resources", "pyodide-terminal")
+
+TYPE_RESOURCES: Dict[str, List[Any]] = {
+    "code": [CODE_TEMPLATE, RESIZE_SCRIPT],
+    "thebelite": [THEBE_LITE_TEMPLATE, RESIZE_SCRIPT, THEBELITE_RUNTIME],
+    "shinylite-py": [SHINYLITE_TEMPLATE, "shinylive"],
+    "pyodide-terminal": [PYODIDE_TERMINAL_TEMPLATE, RESIZE_SCRIPT, PYODIDE_TERMINAL_RUNTIME],
+}
+"Package resources and distributions that snippets are built from, by codestyle type"
+
+FRAME_PADDING: Dict[str, int] = {
+    "code": 60,
+    "thebelite": 200,
+    "shinylite-py": 200,
+    "pyodide-terminal": 60,
+}
+"Extra height (px) allowed for frame chrome, by codestyle type"
+
+EXECUTED_TYPES: List[str] = ["thebelite", "pyodide-terminal"]
+"Codestyle types whose Python snippets can be run at build time"
 
-# Via Chatgpt:
-# function to mimic: zip -j MYZIP.zip MYDIR
-# zip files to root of zipfile, ignoring path
-def zip_directory(source_folder, output_zipfile):
-    source_path = Path(source_folder)
-    with zipfile.ZipFile(output_zipfile, "w", zipfile.ZIP_DEFLATED) as zipf:
-        for file_path in source_path.glob("**/*"):
-            if file_path.is_file():
-                arcname = file_path.relative_to(source_path)
-                print(arcname)
-                zipf.write(file_path, arcname)
+
+def initial_height(content: List[str], line_height: int, padding: int) -> str:
+    """Estimate an iframe height from the number of lines of code.
+
+    Setting the height at build time means the page does not reflow when the
+    frame loads; the resize protocol then corrects any difference.
+    """
+    return str(line_height * len(content) + padding)
 
 
 class ou_codestyle(nodes.General, nodes.Element):
@@ -89,6 +142,7 @@ class codestyle(SphinxDirective):
         "viewer": directives.unchanged,
         "theme": directives.unchanged,
         "keep": directives.unchanged,
+        "activate": directives.unchanged,
     }
 
     def run(self) -> List[ou_codestyle]:
@@ -105,40 +159,83 @@ class codestyle(SphinxDirective):
         _width = self.options.get("width", "")
         _height = self.options.get("height", "")
         _type = self.options.get("type", "code").lower()
+        _activate = get_activation(self)
+        # Draft builds write unpacked artifacts, named by content
+        _draft = is_draft(env.app)
         os.makedirs(env.app.builder.outdir, exist_ok=True)
         if _src and not bool(urlparse(_src).netloc):
             # TO DO - should we use the codesnippet,
             # and assume file is a code file to pass?
             outpath = os.path.join(env.app.builder.outdir, _src)
-            copyfile(_src, outpath)
+            copy_asset(_src, outpath)
             # TO DO what if it is a url?
         elif self.content:
-            _src_root = f"{uuid.uuid4().hex}"
+            if _draft:
+                _src_root = draft_key(
+                    env.docname, env.new_serialno("ou-codestyle"), _type, _lang, *self.content
+                )
+            else:
+                _src_root = f"{uuid.uuid4().hex}"
+            _line_height = self.config.ou_codestyle_line_height
             os.makedirs("_tmp", exist_ok=True)
             if _type == "thebelite":
-                html = THEBE_LITE_TEMPLATE.format(
-                    lang=_lang, code="\n".join(self.content)
+                # Bundle local wheels for the snippet's imports, if configured
+                _wheel_dir = self.config.ou_codestyle_wheel_dir
+                piplite_settings, wheels, wheel_index = bundle_wheels(
+                    "\n".join(self.content),
+                    os.path.join(env.app.confdir, _wheel_dir) if _wheel_dir else "",
+                    location=(env.docname, self.lineno),
                 )
                 _src_zip = f"JL-{_src_root}.zip"
-                tmp_path = os.path.join("_tmp", _src_zip)
-                jl_dir_path = resources_path().joinpath(
-                    "assets", "html-zip-resources", "thebelite"
+                if _draft:
+                    artifact_dir = os.path.join(env.app.builder.outdir, f"JL-{_src_root}")
+                    tmp_path = os.path.join("_tmp", f"JL-{_src_root}", "index.html")
+                    runtime_url = start_draft_artifact(
+                        "thebelite", self.config, env.app.builder.outdir, artifact_dir
+                    )
+                else:
+                    tmp_path = os.path.join("_tmp", _src_zip)
+                    runtime_url = runtime_url_prefix("thebelite", self.config)
+                html = cached_template(*THEBE_LITE_TEMPLATE).format(
+                    lang=_lang,
+                    code="\n".join(self.content),
+                    resize_script=cached_template(*RESIZE_SCRIPT),
+                    piplite_settings=json.dumps(piplite_settings),
+                    runtime_url=runtime_url,
                 )
-                zip_directory(jl_dir_path, tmp_path)
                 # outpath = os.path.join(env.app.builder.outdir, _src_zip)
-                with zipfile.ZipFile(tmp_path, "a", zipfile.ZIP_DEFLATED) as zipf:
-                    # Create a new file named 'index.html' and write the text to it
-                    zipf.writestr("index.html", html)
+                if _draft:
+                    files = {"index.html": html}
+                    if wheels:
+                        files.update(
+                            {f"{WHEEL_PREFIX}/{wheel.name}": wheel for wheel in wheels}
+                        )
+                        files[f"{WHEEL_PREFIX}/all.json"] = json.dumps(wheel_index)
+                    write_draft_files(artifact_dir, files)
+                else:
+                    files = {"index.html": html}
+                    stored = {}
+                    if wheels:
+                        stored = {f"{WHEEL_PREFIX}/{wheel.name}": wheel for wheel in wheels}
+                        files[f"{WHEEL_PREFIX}/all.json"] = json.dumps(wheel_index)
+                    submit_job(
+                        env,
+                        snippet_job(
+                            "thebelite", tmp_path, self.config,
+                            env.app.builder.outdir, files, stored,
+                        ),
+                    )
                 # copyfile(tmp_path, outpath)
-                # if not _height:
-                #    # TO DO - have an optional line height param?
-                #    _line_height = 15
-                #    _height = _line_height * len(self.content) + 200
+                if not _height:
+                    _height = initial_height(
+                        self.content, _line_height, FRAME_PADDING["thebelite"]
+                    )
                 _ou_codestyle = ou_codestyle(
                     src=tmp_path,
                     height=_height,
                     width=_width,
                     interactivetype="thebelite",
+                    frameid=f"ou-frame-{_src_root}",
                     keep=self.options.get("keep", "never"),
                 )
             elif _type == "shinylite-py":
@@ -150,25 +247,87 @@ class codestyle(SphinxDirective):
                     }
                 ]
                 _src_zip = f"SH-py-{_src_root}.zip"
-                tmp_path = os.path.join("_tmp", _src_zip)
-                shl_dir_path = resources_path().joinpath(
-                    "assets", "html-zip-resources", "shinylite-py"
-                )
-                zip_directory(shl_dir_path, tmp_path)
+                if _draft:
+                    artifact_dir = os.path.join(env.app.builder.outdir, f"SH-py-{_src_root}")
+                    tmp_path = os.path.join("_tmp", f"SH-py-{_src_root}", "index.html")
+                    runtime_url = start_draft_artifact(
+                        "shinylite-py", self.config, env.app.builder.outdir, artifact_dir
+                    )
+                else:
+                    tmp_path = os.path.join("_tmp", _src_zip)
+                    runtime_url = runtime_url_prefix("shinylite-py", self.config)
                 # outpath = os.path.join(env.app.builder.outdir, _src_zip)
-                with zipfile.ZipFile(tmp_path, "a", zipfile.ZIP_DEFLATED) as zipf:
-                    # Create a new file named 'index.html' and write the text to it
-                    zipf.writestr("app.json", json.dumps(shiny_app))
+                html = cached_template(*SHINYLITE_TEMPLATE).format(
+                    runtime_url=runtime_url
+                )
+                if _draft:
+                    write_draft_files(
+                        artifact_dir,
+                        {"index.html": html, "app.json": json.dumps(shiny_app)},
+                    )
+                else:
+                    submit_job(
+                        env,
+                        snippet_job(
+                            "shinylite-py", tmp_path, self.config, env.app.builder.outdir,
+                            {"index.html": html, "app.json": json.dumps(shiny_app)},
+                        ),
+                    )
                 # copyfile(tmp_path, outpath)
-                # if not _height:
-                #    # TO DO - have an optional line height param?
-                #    _line_height = 15
-                #    _height = _line_height * len(self.content) + 200
+                if not _height:
+                    _height = initial_height(
+                        self.content, _line_height, FRAME_PADDING["shinylite-py"]
+                    )
                 _ou_codestyle = ou_codestyle(
                     src=tmp_path,
                     height=_height,
                     width=_width,
                     interactivetype="shinylite-py",
+                    frameid=f"ou-frame-{_src_root}",
+                    keep=self.options.get("keep", "never"),
+                )
+            elif _type == "pyodide-terminal":
+                _src_zip = f"PT-{_src_root}.zip"
+                if _draft:
+                    artifact_dir = os.path.join(env.app.builder.outdir, f"PT-{_src_root}")
+                    tmp_path = os.path.join("_tmp", f"PT-{_src_root}", "index.html")
+                    runtime_url = start_draft_artifact(
+                        "pyodide-terminal", self.config, env.app.builder.outdir, artifact_dir
+                    )
+                else:
+                    tmp_path = os.path.join("_tmp", _src_zip)
+                    runtime_url = runtime_url_prefix("pyodide-terminal", self.config)
+                terminal_config = json.dumps(
+                    {
+                        "indexURL": self.config.ou_pyodide_index_url,
+                        "code": "\n".join(self.content),
+                    }
+                ).replace("</", "<\\/")
+                html = cached_template(*PYODIDE_TERMINAL_TEMPLATE).format(
+                    config=terminal_config,
+                    resize_script=cached_template(*RESIZE_SCRIPT),
+                    runtime_url=runtime_url,
+                )
+                if _draft:
+                    write_draft_files(artifact_dir, {"index.html": html})
+                else:
+                    submit_job(
+                        env,
+                        snippet_job(
+                            "pyodide-terminal", tmp_path, self.config,
+                            env.app.builder.outdir, {"index.html": html},
+                        ),
+                    )
+                if not _height:
+                    _height = initial_height(
+                        self.content, _line_height, FRAME_PADDING["pyodide-terminal"]
+                    )
+                _ou_codestyle = ou_codestyle(
+                    src=tmp_path,
+                    height=_height,
+                    width=_width,
+                    interactivetype="pyodide-terminal",
+                    frameid=f"ou-frame-{_src_root}",
                     keep=self.options.get("keep", "never"),
                 )
             elif _type == "Xshinylite-py":
@@ -186,10 +345,6 @@ class codestyle(SphinxDirective):
                 with open(tmp_path, "w") as f:
                     f.write(txt)
                 # copyfile(tmp_path, outpath)
-                # if not _height:
-                #    # TO DO - have an optional line height param?
-                #    _line_height = 15
-                #    _height = _line_height * len(self.content) + 200
                 _ou_codestyle = ou_codestyle(
                     src=tmp_path,
                     height=_height,
@@ -207,8 +362,10 @@ class codestyle(SphinxDirective):
                     content = "\n".join(self.content)
                     _src = f"{_src_root}.txt"
                 else:
-                    content = CODE_TEMPLATE.format(
-                        lang=_lang, code="\n".join(self.content)
+                    content = cached_template(*CODE_TEMPLATE).format(
+                        lang=_lang,
+                        code="\n".join(self.content),
+                        resize_script=cached_template(*RESIZE_SCRIPT),
                     )
                     # This uses my crude take on codesnippet
                     # May have a parameter to use codesnippet or this?
@@ -218,11 +375,11 @@ class codestyle(SphinxDirective):
                 outpath = os.path.join(env.app.builder.outdir, _src)
                 with open(tmp_path, "w") as f:
                     f.write(content)
-                copyfile(tmp_path, outpath)
-                # if not _height:
-                #    # TO DO - have an optional line height param?
-                #    _line_height = 15
-                #    _height = _line_height * len(self.content)
+                copy_asset(tmp_path, outpath)
+                if not _height:
+                    _height = initial_height(
+                        self.content, _line_height, FRAME_PADDING["code"]
+                    )
                 _ou_codestyle = ou_codestyle(
                     src=tmp_path,
                     height=_height,
@@ -230,6 +387,7 @@ class codestyle(SphinxDirective):
                     theme=_theme,
                     codetype=_lang,
                     codesnippet=_codesnippet,
+                    frameid=f"ou-frame-{_src_root}",
                     keep=self.options.get("keep", "never"),
                 )
 
@@ -245,6 +403,28 @@ class codestyle(SphinxDirective):
             _ou_codestyle += caption
         """
 
+        if (
+            self.config.ou_codestyle_execute
+            and _ou_codestyle.get("interactivetype") in EXECUTED_TYPES
+        ):
+            # Run at build time; the output is shown until the frame is loaded
+            _execute = note_snippet(env, _lang, "\n".join(self.content))
+            if _execute:
+                _ou_codestyle["execute"] = _execute
+                _ou_codestyle["codetype"] = _lang
+                _ou_codestyle["code"] = "\n".join(self.content)
+
+        if _activate != "eager" and self.content:
+            # Keep the source for the static preview shown until activation
+            _ou_codestyle["activate"] = _activate
+            _ou_codestyle["codetype"] = _lang
+            _ou_codestyle["code"] = "\n".join(self.content)
+
+        self.set_source_info(_ou_codestyle)
+        if self.content:
+            note_directive(self, _ou_codestyle, artifacts=[_ou_codestyle["src"]])
+        else:
+            note_directive(self, _ou_codestyle, assets=[self.options.get("src")])
         return [_ou_codestyle]
 
 
@@ -256,16 +436,45 @@ def visit_ou_codestyle_html(translator: SphinxTranslator, node: ou_codestyle) ->
     attr: List[str] = [
         f'{k}="{node[k]}"' for k in SUPPORTED_OPTIONS if k in node and node[k]
     ]
-    attr.append('name="expandable-code-iframe"')
-    html: str = f"<iframe {' '.join(attr)}>"
+    # The frame name lets the resize protocol find the frame directly
+    attr.append(f'name="{node.get("frameid", "expandable-code-iframe")}"')
     # TO DO - this is currently a hack
-    html = html.replace("_tmp/", "./")
+    # Only the frame's own attributes, not the code in any preview
+    attr = [a.replace("_tmp/", "./") if a.startswith("src=") else a for a in attr]
+    output = cached_output(node["execute"]) if node.get("execute") else None
+    if output is not None:
+        # Show the build-time output; the frame is only loaded to edit or re-run
+        preview = translator.highlighter.highlight_block(
+            node["code"], node["codetype"], location=node
+        )
+        preview += (
+            f'<pre class="ou-static-output ou-static-output-{output["status"]}">'
+            f'{escape(output["output"])}</pre>'
+        )
+        activate = node.get("activate", "eager")
+        html: str = frame_placeholder_open(
+            attr, "click" if activate == "eager" else activate, preview, "Edit and run"
+        )
+    elif node.get("activate", "eager") != "eager":
+        preview = translator.highlighter.highlight_block(
+            node["code"], node["codetype"], location=node
+        )
+        html = frame_placeholder_open(
+            attr, node["activate"], preview, "Load interactive code"
+        )
+    else:
+        html = f"<iframe {' '.join(attr)}>"
     translator.body.append(html)
 
 
 def depart_ou_codestyle_html(translator: SphinxTranslator, node: ou_codestyle) -> None:
     """Exit of the html iframe node."""
-    translator.body.append("</iframe>")
+    if node.get("activate", "eager") != "eager" or (
+        node.get("execute") and cached_output(node["execute"]) is not None
+    ):
+        translator.body.append(frame_placeholder_close())
+    else:
+        translator.body.append("</iframe>")
 
 
 def visit_ou_codestyle_unsupported(
@@ -276,9 +485,21 @@ def visit_ou_codestyle_unsupported(
     raise nodes.SkipNode
 
 
-def setup(app: Sphinx) -> Dict[str, bool]:
+def setup(app: Sphinx) -> Dict[str, Any]:
     """Add codestyle node and parameters to the Sphinx builder."""
     # app.add_config_value("codestyle_enforce_extra_source", False, "html")
+    # Line height (px) used to estimate initial iframe heights
+    app.add_config_value("ou_codestyle_line_height", 20, "env")
+    # Directory of Pyodide wheels to bundle with thebelite snippets
+    app.add_config_value("ou_codestyle_wheel_dir", "", "env")
+    # Base URL of runtimes hosted once per site, rather than in each snippet
+    app.add_config_value("ou_codestyle_runtime_url", "", "env")
+    # Pyodide distribution loaded by pyodide-terminal snippets
+    app.add_config_value(
+        "ou_pyodide_index_url", "https://cdn.jsdelivr.net/pyodide/v0.24.1/full/", "env"
+    )
+    # Extra packages to include in the shared shinylite-py runtime
+    app.add_config_value("ou_shinylite_packages", [], "env")
     app.add_node(
         ou_codestyle,
         html=(visit_ou_codestyle_html, depart_ou_codestyle_html),
@@ -292,8 +513,20 @@ def setup(app: Sphinx) -> Dict[str, bool]:
 
     # Pass in the stub filename used in static/js/STUB.js etc
     handle_css_js_assets(app, "ou_codestyle")
+    setup_frame_activation(app)
+    setup_precompression(app)
+    setup_draft_mode(app)
+    setup_execution(app)
+    setup_inventory(app)
+    setup_artifacts(app)
+    # Re-read snippets when the templates or runtimes they use change
+    for _type, resources in TYPE_RESOURCES.items():
+        watch_resources(
+            app, "ou-codestyle", resources, uses_option("type", _type, default="code")
+        )
 
     return {
+        "env_version": ENV_VERSION,
         "parallel_read_safe": True,
         "parallel_write_safe": True,
     }
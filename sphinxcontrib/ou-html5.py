@@ -4,17 +4,26 @@ Originally based on https://github.com/sphinx-contrib/video/
 """
 
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 
+import hashlib
 import os
+import posixpath
+import shutil
+import tempfile
+import zipfile
 from docutils import nodes
 from docutils.parsers.rst import directives
 from sphinx.application import Sphinx
 from sphinx.environment import BuildEnvironment
 from sphinx.util import logging
 from sphinx.util.docutils import SphinxDirective, SphinxTranslator
-from sphinx.util.osutil import copyfile
+from sphinx.util.osutil import relative_uri
+
+from sphinxcontrib_ou_media.inventory import ENV_VERSION, note_directive, setup_inventory
+from sphinxcontrib_ou_media.remote import note_remote_media, setup_remote_check
+from sphinxcontrib_ou_media.utils import copy_asset, setup_draft_mode
 
 __author__ = "Raphael Massabot & Tony Hirst"
 __version__ = "0.0.2"
@@ -36,9 +45,74 @@ SUPPORTED_OPTIONS: List[str] = [
 ]
 "List of the supported options attributes"
 
+ENTRY_POINTS: List[str] = ["index.html", "index.htm"]
+"Entry points looked for in zipped html5 bundles, in order of preference"
+
+BUNDLE_DIR = "_html5"
+"Output directory that zipped html5 bundles are unpacked to, by content hash"
+
+
+def inspect_bundle(path: str, env: BuildEnvironment) -> Optional[Dict[str, Any]]:
+    """Return the content hash and entry point of a zipped html5 bundle.
+
+    The results are kept in the environment, by file size and modification
+    time, so unchanged bundles are not opened again.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        logger.warning(f"html5 bundle {path} not found")
+        return None
+    bundles = env.ou_html5_bundles
+    key = (stat.st_size, stat.st_mtime_ns)
+    if path in bundles and bundles[path]["key"] == key:
+        return bundles[path]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    try:
+        with zipfile.ZipFile(path) as zf:
+            names = [name for name in zf.namelist() if not name.endswith("/")]
+    except zipfile.BadZipFile:
+        logger.warning(f"html5 bundle {path} is not a valid zip file")
+        return None
+    # Bundles are often zipped with a single top level directory
+    entry = None
+    for name in sorted(names, key=lambda name: (name.count("/"), name)):
+        if posixpath.basename(name).lower() in ENTRY_POINTS:
+            entry = name
+            break
+    if entry is None:
+        logger.warning(
+            f"html5 bundle {path} has no entry point ({', '.join(ENTRY_POINTS)})"
+        )
+    bundles[path] = {"key": key, "hash": digest.hexdigest()[:16], "entry": entry}
+    return bundles[path]
+
 
-def get_html5(src: str, env: BuildEnvironment) -> Tuple[str, str]:
-    """Return html5 and suffix.
+def unpack_bundle(path: str, target: str) -> None:
+    """Unpack a zipped html5 bundle to a directory, unless already unpacked.
+
+    The bundle is unpacked to a temporary directory and renamed into place,
+    so parallel writers never see a partly unpacked bundle.
+    """
+    if os.path.isdir(target):
+        return
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(target), suffix=".tmp")
+    with zipfile.ZipFile(path) as zf:
+        zf.extractall(tmp_dir)
+    try:
+        os.rename(tmp_dir, target)
+    except OSError:
+        # Unpacked by another process in the meantime
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def get_html5(src: str, env: BuildEnvironment) -> Tuple[str, str, Optional[Dict[str, Any]]]:
+    """Return html5, suffix and bundle details.
 
     Raise a warning if not supported but do not stop the computation.
 
@@ -47,7 +121,8 @@ def get_html5(src: str, env: BuildEnvironment) -> Tuple[str, str]:
         env: the build environment
 
     Returns:
-        the src file, the extension suffix
+        the src file, the extension suffix, and the content hash and entry
+        point if it is a local zip bundle
     """
 
     # TH: what does this do??
@@ -62,7 +137,17 @@ def get_html5(src: str, env: BuildEnvironment) -> Tuple[str, str]:
         )
     type = SUPPORTED_MIME_TYPES.get(suffix, "")
 
-    return (src, type)
+    bundle = None
+    if urlparse(src).netloc:
+        note_remote_media(env, src)
+    elif suffix == ".zip":
+        path = src if os.path.exists(src) else os.path.join(env.srcdir, src)
+        env.note_dependency(os.path.abspath(path))
+        bundle = inspect_bundle(path, env)
+        if bundle is not None:
+            bundle = {"path": path, **bundle}
+
+    return (src, type, bundle)
 
 
 class ou_html5(nodes.General, nodes.Element):
@@ -96,18 +181,20 @@ class html5(SphinxDirective):
         # Get the asset location
         _src = get_html5(self.arguments[0], env)
         # Copy the media asset over to the build directory
-        # _src[0] is the filename; _src[1] the mime type
-        if not bool(urlparse(_src[0]).netloc):
+        # _src[0] is the filename; _src[1] the mime type; _src[2] zip bundle details
+        # Zip bundles with an entry point are unpacked when HTML is written instead
+        if not bool(urlparse(_src[0]).netloc) and (_src[2] is None or not _src[2]["entry"]):
             outpath = os.path.join(env.app.builder.outdir, _src[0])
             dirpath = os.path.dirname(outpath)
             if dirpath:
                 os.makedirs(dirpath, exist_ok=True)
-            copyfile(_src[0], outpath)
+            copy_asset(_src[0], outpath)
         _ou_html5 = ou_html5(
             src=_src[0],
             height=self.options.get("height", ""),
             width=self.options.get("width", ""),
             keep=self.options.get("keep", "never"),
+            bundle=_src[2],
         )
         # The following is cribbed from Jupyter Book and adds a caption etc
         # https://github.com/executablebooks/MyST-NB/blob/9ddc821933826a7fd2ea9bbda1741f4f3977eb7e/myst_nb/ext/eval/__init__.py#L193C9-L201C39
@@ -122,6 +209,14 @@ class html5(SphinxDirective):
                 _ou_html5 += caption
             if len(node) > 1:
                 _ou_html5 += nodes.legend("", *node[1:])
+        self.set_source_info(_ou_html5)
+        is_remote = bool(urlparse(_src[0]).netloc)
+        note_directive(
+            self,
+            _ou_html5,
+            assets=[] if is_remote else [_src[0]],
+            remote=[_src[0]] if is_remote else [],
+        )
         return [_ou_html5]
 
 
@@ -131,9 +226,19 @@ def visit_ou_html5_html(translator: SphinxTranslator, node: ou_html5) -> None:
     # TO DO - if we just have a single html file,
     # or HTML text in the admonition, we could just srcdoc it?
     # If HTML in body, then call as ```{ou-html5} INLINE
-    attr: List[str] = [
-        f'{k}="{node[k]}"' for k in SUPPORTED_OPTIONS if k in node and node[k]
-    ]
+    attrs = {k: node[k] for k in SUPPORTED_OPTIONS if k in node and node[k]}
+    bundle = node.get("bundle")
+    if bundle and bundle["entry"]:
+        # Point the iframe at the unpacked bundle, relative to the page
+        builder = translator.builder
+        target = os.path.join(builder.outdir, BUNDLE_DIR, bundle["hash"])
+        unpack_bundle(bundle["path"], target)
+        attrs["src"] = posixpath.join(
+            relative_uri(builder.get_target_uri(builder.current_docname), BUNDLE_DIR),
+            bundle["hash"],
+            bundle["entry"],
+        )
+    attr: List[str] = [f'{k}="{v}"' for k, v in attrs.items()]
     html: str = f"<iframe {' '.join(attr)}>"
 
     translator.body.append(html)
@@ -150,7 +255,17 @@ def visit_ou_html5_unsupported(translator: SphinxTranslator, node: ou_html5) ->
     raise nodes.SkipNode
 
 
-def setup(app: Sphinx) -> Dict[str, bool]:
+def init_bundles(app: Sphinx, env: BuildEnvironment, docnames: List[str]) -> None:
+    if not hasattr(env, "ou_html5_bundles"):
+        env.ou_html5_bundles = {}
+
+
+def merge_bundles(app: Sphinx, env: BuildEnvironment, docnames: List[str],
+                  other: BuildEnvironment) -> None:
+    env.ou_html5_bundles.update(getattr(other, "ou_html5_bundles", {}))
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
     """Add html5 node and parameters to the Sphinx builder."""
     # app.add_config_value("html5_enforce_extra_source", False, "html")
     app.add_node(
@@ -163,8 +278,15 @@ def setup(app: Sphinx) -> Dict[str, bool]:
         text=(visit_ou_html5_unsupported, None),
     )
     app.add_directive("ou-html5", html5)
+    # Index of zip bundle hashes and entry points
+    app.connect("env-before-read-docs", init_bundles)
+    app.connect("env-merge-info", merge_bundles)
+    setup_remote_check(app)
+    setup_draft_mode(app)
+    setup_inventory(app)
 
     return {
+        "env_version": ENV_VERSION,
         "parallel_read_safe": True,
         "parallel_write_safe": True,
     }
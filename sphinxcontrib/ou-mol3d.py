@@ -5,6 +5,7 @@ Originally based on https://github.com/sphinx-contrib/video/
 
 from typing import Any, Dict, List
 
+from html import escape
 import json
 import os
 from docutils import nodes
@@ -13,7 +14,19 @@ from sphinx.application import Sphinx
 from sphinx.environment import BuildEnvironment
 from sphinx.util import logging
 from sphinx.util.docutils import SphinxDirective, SphinxTranslator
-from sphinx.util.osutil import copyfile
+
+from sphinxcontrib_ou_media.artifacts import artifact_job, setup_artifacts, submit_job
+from sphinxcontrib_ou_media.compress import setup_precompression
+from sphinxcontrib_ou_media.fingerprints import watch_resources
+from sphinxcontrib_ou_media.inventory import ENV_VERSION, note_directive, setup_inventory
+from sphinxcontrib_ou_media.utils import (
+    copy_asset,
+    frame_placeholder_close,
+    frame_placeholder_open,
+    get_activation,
+    setup_draft_mode,
+    setup_frame_activation,
+)
 
 __author__ = "Raphael Massabot & Tony Hirst"
 __version__ = "0.0.2"
@@ -53,6 +66,7 @@ class mol3d(SphinxDirective):
         "background": directives.unchanged,
         "style": directives.unchanged,
         "src": directives.unchanged,
+        "activate": directives.unchanged,
     }
 
     def run(self) -> List[ou_mol3d]:
@@ -63,31 +77,38 @@ class mol3d(SphinxDirective):
 
         # Get the molecule we want to view
         _query = self.arguments[0]
-        # Generate the asset
-        import py3Dmol
-
-        view = py3Dmol.view(query=_query)
         filename = f"{_query.replace(':','_')}_generated.html"
 
         # view.setStyle({'cartoon':{'color':'spectrum'}})
         # Style MUST be valid JSON
         style = self.options.get("style", '{"cartoon":{"color":"spectrum"}}')
-        view.setStyle(json.loads(style))
         # Background
         background = self.options.get("background", "0xeeeeee")
-        view.setBackgroundColor(background)
         os.makedirs("_tmp", exist_ok=True)
         tmp_path = os.path.join("_tmp", filename)
-        view.write_html(tmp_path)
+        # Generate the asset with py3Dmol, here or by an artifact worker
+        submit_job(
+            env,
+            artifact_job(
+                "mol3d",
+                tmp_path,
+                query=_query,
+                style=json.loads(style),
+                background=background,
+                publish=filename,
+            ),
+        )
         os.makedirs(env.app.builder.outdir, exist_ok=True)
-        # Copy the media asset over to the build directory
-        outpath = os.path.join(env.app.builder.outdir, filename)
-        copyfile(tmp_path, outpath)
+        if os.path.exists(tmp_path):
+            # Copy the media asset over to the build directory
+            outpath = os.path.join(env.app.builder.outdir, filename)
+            copy_asset(tmp_path, outpath)
         _ou_mol3d = ou_mol3d(
             query=_query,
             height=self.options.get("height", ""),
             width=self.options.get("width", ""),
             src=tmp_path,
+            activate=get_activation(self),
         )
         # TO DO - we need to define a <mol3d> tag handler for HTML
         # TO DO - or tweak this handler to render to everday HTML tags
@@ -104,6 +125,8 @@ class mol3d(SphinxDirective):
                 _ou_mol3d += caption
             if len(node) > 1:
                 _ou_mol3d += nodes.legend("", *node[1:])
+        self.set_source_info(_ou_mol3d)
+        note_directive(self, _ou_mol3d, artifacts=[tmp_path])
         return [_ou_mol3d]
 
 
@@ -116,14 +139,27 @@ def visit_ou_mol3d_html(translator: SphinxTranslator, node: ou_mol3d) -> None:
         for k in SUPPORTED_OPTIONS
         if k in node and node[k]
     ]
-    html: str = f"<iframe {' '.join(attr)}>"
+    if node.get("activate", "eager") != "eager":
+        # Static preview: the molecule query and any caption text
+        preview = f"<p>3D molecule: <code>{escape(node['query'])}</code></p>"
+        caption = node.first_child_matching_class(nodes.caption)
+        if caption is not None:
+            preview += f"<p>{escape(node[caption].astext())}</p>"
+        html: str = frame_placeholder_open(
+            attr, node["activate"], preview, "Load 3D viewer"
+        )
+    else:
+        html = f"<iframe {' '.join(attr)}>"
 
     translator.body.append(html)
 
 
 def depart_ou_mol3d_html(translator: SphinxTranslator, node: ou_mol3d) -> None:
     """Exit of the html mol3d node."""
-    translator.body.append("</iframe>")
+    if node.get("activate", "eager") != "eager":
+        translator.body.append(frame_placeholder_close())
+    else:
+        translator.body.append("</iframe>")
 
 
 def visit_ou_mol3d_unsupported(translator: SphinxTranslator, node: ou_mol3d) -> None:
@@ -132,7 +168,7 @@ def visit_ou_mol3d_unsupported(translator: SphinxTranslator, node: ou_mol3d) ->
     raise nodes.SkipNode
 
 
-def setup(app: Sphinx) -> Dict[str, bool]:
+def setup(app: Sphinx) -> Dict[str, Any]:
     """Add mol3d node and parameters to the Sphinx builder."""
     # app.add_config_value("mol3d_enforce_extra_source", False, "html")
     app.add_node(
@@ -145,8 +181,16 @@ def setup(app: Sphinx) -> Dict[str, bool]:
         text=(visit_ou_mol3d_unsupported, None),
     )
     app.add_directive("ou-mol3d", mol3d)
+    setup_frame_activation(app)
+    setup_precompression(app)
+    setup_draft_mode(app)
+    setup_inventory(app)
+    setup_artifacts(app)
+    # Viewer pages are generated by py3Dmol, so regenerate them when it is upgraded
+    watch_resources(app, "ou-mol3d", ["py3Dmol"])
 
     return {
+        "env_version": ENV_VERSION,
         "parallel_read_safe": True,
         "parallel_write_safe": True,
     }
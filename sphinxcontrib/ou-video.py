@@ -16,6 +16,11 @@ from sphinx.util import logging
 from sphinx.util.docutils import SphinxDirective, SphinxTranslator
 from sphinx.transforms.post_transforms import SphinxPostTransform
 
+from sphinxcontrib_ou_media.inventory import ENV_VERSION, note_directive, setup_inventory
+from sphinxcontrib_ou_media.media import process_media, setup_media_processing
+from sphinxcontrib_ou_media.mp4 import fragment_mp4, slim_mp4
+from sphinxcontrib_ou_media.remote import note_remote_media, setup_remote_check
+
 __author__ = "Raphael Massabot & Tony Hirst"
 __version__ = "0.0.1"
 
@@ -61,12 +66,23 @@ def get_video(src: str, env: BuildEnvironment) -> Tuple[str, str, bool]:
     type = SUPPORTED_MIME_TYPES.get(suffix, "")
 
     is_remote = bool(urlparse(src).netloc)
-    if not is_remote:
+    if is_remote:
+        note_remote_media(env, src)
+    else:
         # Map video paths to unique names (so that they can be put into a single
         # directory). This copies what is done for images by the process_docs method of
         # sphinx.environment.collectors.asset.ImageCollector.
         src, fullpath = env.relfn2path(src, env.docname)
         env.note_dependency(fullpath)
+        if env.config.ou_video_fragment and suffix == ".mp4":
+            # Publish a fragmented copy, which also drops the metadata slimming would
+            src = process_media(
+                env, src, "fragment", fragment_mp4,
+                duration=float(env.config.ou_video_fragment_duration),
+            )
+        elif env.config.ou_media_slim and suffix == ".mp4":
+            # Publish a copy without embedded artwork and metadata
+            src = process_media(env, src, "slim", slim_mp4)
         env.images.add_file(env.docname, src)
 
     return (src, type, is_remote)
@@ -113,6 +129,12 @@ class Video(SphinxDirective):
 
         # Get the asset location
         sources = [get_video(self.arguments[0], env)]
+        # The source file, which may be published as a processed copy
+        original = [
+            env.relfn2path(self.arguments[0], env.docname)[0]
+            for _, _, is_remote in sources
+            if not is_remote
+        ]
 
         _ou_video = ou_video(
             src=sources[0][0],
@@ -141,6 +163,16 @@ class Video(SphinxDirective):
                 _ou_video += caption
             if len(node) > 1:
                 _ou_video += nodes.legend("", *node[1:])
+        self.set_source_info(_ou_video)
+        note_directive(
+            self,
+            _ou_video,
+            assets=original,
+            remote=[src for src, _, is_remote in sources if is_remote],
+            artifacts=[
+                src for src, _, is_remote in sources if not is_remote and src not in original
+            ],
+        )
         return [
             _ou_video
         ]
@@ -225,9 +257,13 @@ def visit_ou_video_unsupported(translator: SphinxTranslator, node: ou_video) ->
     raise nodes.SkipNode
 
 
-def setup(app: Sphinx) -> Dict[str, bool]:
+def setup(app: Sphinx) -> Dict[str, Any]:
     """Add video node and parameters to the Sphinx builder."""
     # app.add_config_value("video_enforce_extra_source", False, "html")
+    # Remux local MP4 files as fragmented MP4, for fast start and seeking
+    app.add_config_value("ou_video_fragment", False, "env")
+    # Target length of each fragment, in seconds
+    app.add_config_value("ou_video_fragment_duration", 2.0, "env")
     app.add_node(
         ou_video,
         html=(visit_ou_video_html, depart_ou_video_html),
@@ -239,8 +275,12 @@ def setup(app: Sphinx) -> Dict[str, bool]:
     )
     app.add_directive("ou-video", Video)
     app.add_post_transform(VideoPostTransform)
+    setup_remote_check(app)
+    setup_inventory(app)
+    setup_media_processing(app)
 
     return {
+        "env_version": ENV_VERSION,
         "parallel_read_safe": True,
         "parallel_write_safe": True,
     }
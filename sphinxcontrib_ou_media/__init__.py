@@ -0,0 +1,34 @@
+"""Umbrella Sphinx extension that enables all the ou extensions.
+
+Add ``sphinxcontrib_ou_media`` to the Sphinx extensions instead of listing
+each ``sphinxcontrib.ou-*`` extension. The extensions load their templates
+and heavy dependencies (``py3Dmol``, ``sphinx_design``) on first use, so
+enabling them all adds little to Sphinx start-up time.
+"""
+
+from typing import Dict, List
+
+__version__ = "0.0.4"
+
+EXTENSIONS: List[str] = [
+    "sphinxcontrib.ou-video",
+    "sphinxcontrib.ou-audio",
+    "sphinxcontrib.ou-html5",
+    "sphinxcontrib.ou-mol3d",
+    "sphinxcontrib.ou-codestyle",
+    "sphinxcontrib.ou-activities",
+    "sphinxcontrib_ou_media.ouxml",
+]
+"The extensions enabled by the umbrella extension"
+
+
+def setup(app) -> Dict[str, object]:
+    """Set up all the ou extensions."""
+    for extension in EXTENSIONS:
+        app.setup_extension(extension)
+
+    return {
+        "version": __version__,
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
@@ -0,0 +1,274 @@
+"""Artifact jobs, to generate codestyle packages and mol3d pages elsewhere.
+
+Each interactive codestyle package (``thebelite``, ``shinylite-py``,
+``pyodide-terminal``) and each mol3d viewer page is described by a
+self-contained job, with a key that is a hash of its content (including the
+version of the runtime or package it is generated with). By default, jobs
+are run as their directives are read.
+
+When ``ou_artifact_jobs`` names a directory, jobs are not run by the build.
+Once the documents are read, the jobs whose results are not yet available
+are written to the job list, ``jobs.json``, in that directory. Workers,
+started in the book directory, on this or other hosts sharing the
+directory, each run a shard of the list::
+
+    python -m sphinxcontrib_ou_media.artifacts _tmp/jobs --shard 1/4
+
+Paths in jobs are relative to the book directory, which workers are started
+in. Results are written to the ``results`` subdirectory, named by job key, so
+workers need no coordination beyond the shared directory. The next build
+copies the results into place, and exports only the jobs still pending.
+"""
+
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import argparse
+import functools
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import weakref
+import zipfile
+
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+from sphinx.util import logging
+
+from sphinxcontrib_ou_media.fingerprints import resource_fingerprint
+from sphinxcontrib_ou_media.runtimes import RUNTIME_RESOURCES, start_artifact
+from sphinxcontrib_ou_media.utils import copy_asset
+
+logger = logging.getLogger(__name__)
+
+JOB_LIST = "jobs.json"
+"File name of the job list in the jobs directory"
+
+RESULTS_DIR = "results"
+"Subdirectory of the jobs directory that results are written to"
+
+JOBS_VERSION = 1
+
+_registered: "weakref.WeakSet" = weakref.WeakSet()
+
+
+@functools.lru_cache(maxsize=None)
+def generator_version(kind: str, runtime: str = "") -> str:
+    """Return a fingerprint of what a kind of artifact is generated with."""
+    if kind == "mol3d":
+        return resource_fingerprint("py3Dmol")
+    resource = RUNTIME_RESOURCES.get(runtime)
+    return resource_fingerprint(resource) if resource else ""
+
+
+def artifact_job(kind: str, target: str, **inputs) -> Dict[str, Any]:
+    """Return a job to generate an artifact.
+
+    Args:
+        kind: ``runtime-zip`` (a snippet archive) or ``mol3d``
+        target: the file to generate, relative to the working directory
+        inputs: what the artifact is generated from; the ``outdir`` (for
+            hosted runtimes) and ``publish`` (a copy in the output directory)
+            inputs do not change its content
+    """
+    content = {k: v for k, v in inputs.items() if k not in ("outdir", "publish", "stored")}
+    # Stored files are identified by name and size, wherever they are
+    stored = {
+        name: [Path(filename).name, os.path.getsize(filename)]
+        for name, filename in inputs.get("stored", {}).items()
+    }
+    key = hashlib.sha256(
+        json.dumps(
+            [kind, generator_version(kind, inputs.get("runtime", "")), content, stored],
+            sort_keys=True,
+        ).encode()
+    ).hexdigest()[:32]
+    return {"key": key, "kind": kind, "target": target, **inputs}
+
+
+def snippet_job(name: str, target: str, config, outdir: str, files: Dict[str, str],
+                stored: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Return a job for a codestyle snippet archive.
+
+    Args:
+        name: the codestyle type, e.g. ``thebelite``
+        target: the snippet archive to create
+        config: the Sphinx config
+        outdir: the builder output directory, inside the book directory
+        files: text files to add, by name in the archive
+        stored: files to add uncompressed (e.g. wheels), by name in the archive
+    """
+    return artifact_job(
+        "runtime-zip",
+        target,
+        runtime=name,
+        files=files,
+        # Relative to the book directory, so workers on other hosts sharing it
+        # can run the job wherever the directory is mounted
+        stored={name: os.path.relpath(path) for name, path in (stored or {}).items()},
+        config={
+            "ou_codestyle_runtime_url": config.ou_codestyle_runtime_url,
+            "ou_shinylite_packages": list(config.ou_shinylite_packages),
+        },
+        outdir=os.path.relpath(outdir),
+    )
+
+
+def run_job(job: Dict[str, Any], filename: str) -> None:
+    """Generate a job's artifact, writing it atomically to ``filename``."""
+    directory = os.path.dirname(filename) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=Path(filename).suffix)
+    os.close(fd)
+    try:
+        if job["kind"] == "runtime-zip":
+            # The shared runtime is zipped once; this copies that archive
+            start_artifact(
+                job["runtime"], SimpleNamespace(**job["config"]), job["outdir"], tmp_path
+            )
+            with zipfile.ZipFile(tmp_path, "a", zipfile.ZIP_DEFLATED) as zipf:
+                for name, text in job.get("files", {}).items():
+                    zipf.writestr(name, text)
+                # Wheels are already compressed
+                for name, stored in job.get("stored", {}).items():
+                    zipf.write(stored, name, zipfile.ZIP_STORED)
+        elif job["kind"] == "mol3d":
+            import py3Dmol
+
+            view = py3Dmol.view(query=job["query"])
+            view.setStyle(job["style"])
+            view.setBackgroundColor(job["background"])
+            view.write_html(tmp_path)
+        else:
+            raise ValueError(f"unknown artifact job kind: {job['kind']}")
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, filename)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def result_path(jobs_dir: str, job: Dict[str, Any]) -> str:
+    return os.path.join(jobs_dir, RESULTS_DIR, job["key"] + Path(job["target"]).suffix)
+
+
+def place_result(job: Dict[str, Any], jobs_dir: str) -> bool:
+    """Copy a job's result into place, if a worker has produced it."""
+    result = result_path(jobs_dir, job)
+    if not os.path.exists(result):
+        return False
+    target = job["target"]
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target) or ".", suffix=".tmp")
+    os.close(fd)
+    shutil.copyfile(result, tmp_path)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, target)
+    return True
+
+
+def submit_job(env: BuildEnvironment, job: Dict[str, Any]) -> None:
+    """Run a job now, or record it for workers if ``ou_artifact_jobs`` is set."""
+    jobs_dir = env.config.ou_artifact_jobs
+    if not jobs_dir:
+        run_job(job, job["target"])
+        return
+    if not hasattr(env, "ou_artifact_jobs"):
+        env.ou_artifact_jobs = {}
+    env.ou_artifact_jobs.setdefault(env.docname, {})[job["key"]] = job
+    if not place_result(job, jobs_dir) and os.path.exists(job["target"]):
+        # Left from an earlier version of the directive
+        os.unlink(job["target"])
+
+
+def export_jobs(app: Sphinx, env: BuildEnvironment) -> List[str]:
+    """Place the available results and write the pending jobs to the job list."""
+    jobs_dir = app.config.ou_artifact_jobs
+    if not jobs_dir:
+        return []
+    pending: Dict[str, Dict[str, Any]] = {}
+    for docname, jobs in sorted(getattr(env, "ou_artifact_jobs", {}).items()):
+        for key, job in jobs.items():
+            if not os.path.exists(job["target"]) and not place_result(job, jobs_dir):
+                pending.setdefault(key, job)
+                continue
+            if job.get("publish"):
+                # Unchanged copies are skipped; a copy of an earlier result is replaced
+                copy_asset(job["target"], os.path.join(app.outdir, job["publish"]))
+    os.makedirs(jobs_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=jobs_dir, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"version": JOBS_VERSION, "jobs": [pending[key] for key in sorted(pending)]}, f)
+    os.replace(tmp_path, os.path.join(jobs_dir, JOB_LIST))
+    if pending:
+        logger.warning(
+            f"{len(pending)} artifact jobs are pending in {jobs_dir}; run "
+            f"python -m sphinxcontrib_ou_media.artifacts {jobs_dir}, then build again"
+        )
+    return []
+
+
+def purge_jobs(app: Sphinx, env: BuildEnvironment, docname: str) -> None:
+    getattr(env, "ou_artifact_jobs", {}).pop(docname, None)
+
+
+def merge_jobs(app: Sphinx, env: BuildEnvironment, docnames: List[str],
+               other: BuildEnvironment) -> None:
+    if not hasattr(env, "ou_artifact_jobs"):
+        env.ou_artifact_jobs = {}
+    for docname, jobs in getattr(other, "ou_artifact_jobs", {}).items():
+        if docname in docnames:
+            env.ou_artifact_jobs[docname] = jobs
+
+
+def setup_artifacts(app: Sphinx) -> None:
+    """Register the artifact jobs config value and build stages.
+
+    Several extensions generate artifacts, so only register once.
+    """
+    if app in _registered:
+        return
+    _registered.add(app)
+    # Directory to export artifact jobs to, rather than running them
+    app.add_config_value("ou_artifact_jobs", "", "env")
+    app.connect("env-purge-doc", purge_jobs)
+    app.connect("env-merge-info", merge_jobs)
+    app.connect("env-updated", export_jobs)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run a shard of the exported artifact jobs.")
+    parser.add_argument("jobs_dir", help="the ou_artifact_jobs directory")
+    parser.add_argument("--shard", default="1/1",
+                        help="the shard to run, as INDEX/COUNT (default 1/1)")
+    args = parser.parse_args(argv)
+
+    index, count = (int(part) for part in args.shard.split("/"))
+    if not 1 <= index <= count:
+        parser.error("--shard must be INDEX/COUNT, with INDEX from 1 to COUNT")
+    with open(os.path.join(args.jobs_dir, JOB_LIST), encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") != JOBS_VERSION:
+        parser.error("unsupported job list version")
+    failed = 0
+    shard = data["jobs"][index - 1::count]
+    for job in shard:
+        result = result_path(args.jobs_dir, job)
+        if os.path.exists(result):
+            continue
+        try:
+            run_job(job, result)
+        except Exception as err:
+            failed += 1
+            print(f"{job['key']} ({job['target']}): {err}", file=sys.stderr)
+    print(f"shard {index}/{count}: {len(shard) - failed} of {len(shard)} jobs done")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+/**
+ * Pyodide terminal for ou-codestyle pyodide-terminal snippets.
+ *
+ * Adapted from the Pyodide console (https://pyodide.org/en/stable/console.html,
+ * dist/pyodide-terminal-01.zip). Loads bare Pyodide, without the JupyterLite
+ * service worker and kernel, runs the snippet code (loading the packages it
+ * imports) and then leaves an interactive Python prompt in the same namespace.
+ *
+ * The snippet page sets its code and the Pyodide index URL in a JSON script
+ * element with the id "ou-pyodide-config".
+ */
+(function () {
+  "use strict";
+
+  function sleep(s) {
+    return new Promise((resolve) => setTimeout(resolve, s));
+  }
+
+  async function main() {
+    const config = JSON.parse(
+      document.getElementById("ou-pyodide-config").textContent
+    );
+    const { loadPyodide } = await import(config.indexURL + "pyodide.mjs");
+
+    let term;
+    const echo = (msg, ...opts) =>
+      term.echo(
+        msg.replaceAll("]]", "&rsqb;&rsqb;").replaceAll("[[", "&lsqb;&lsqb;"),
+        ...opts
+      );
+    const pyodide = await loadPyodide({
+      indexURL: config.indexURL,
+      stdin: () => {
+        const result = prompt();
+        echo(result);
+        return result;
+      },
+      stdout: (s) => echo(s),
+      stderr: (s) => term.error(s),
+    });
+    const namespace = pyodide.globals.get("dict")();
+    pyodide.runPython(
+      `
+        from pyodide.ffi import to_js
+        from pyodide.console import PyodideConsole, repr_shorten
+        import __main__
+        pyconsole = PyodideConsole(__main__.__dict__)
+        import builtins
+        async def await_fut(fut):
+          res = await fut
+          if res is not None:
+            builtins._ = res
+          return to_js([res], depth=1)
+        def clear_console():
+          pyconsole.buffer = []
+      `,
+      { globals: namespace }
+    );
+    const repr_shorten = namespace.get("repr_shorten");
+    const await_fut = namespace.get("await_fut");
+    const pyconsole = namespace.get("pyconsole");
+    const clear_console = namespace.get("clear_console");
+    namespace.destroy();
+
+    const ps1 = ">>> ",
+      ps2 = "... ";
+
+    async function lock() {
+      let resolve;
+      const ready = term.ready;
+      term.ready = new Promise((res) => (resolve = res));
+      await ready;
+      return resolve;
+    }
+
+    async function interpreter(command) {
+      const unlock = await lock();
+      term.pause();
+      // multiline should be split (useful when pasting)
+      for (const c of command.split("\n")) {
+        const escaped = c.replaceAll(/\u00a0/g, " ");
+        const fut = pyconsole.push(escaped);
+        term.set_prompt(fut.syntax_check === "incomplete" ? ps2 : ps1);
+        switch (fut.syntax_check) {
+          case "syntax-error":
+            term.error(fut.formatted_error.trimEnd());
+            continue;
+          case "incomplete":
+            continue;
+          case "complete":
+            break;
+          default:
+            throw new Error(`Unexpected type ${fut.syntax_check}`);
+        }
+        // Wrap the result in a list so it is not awaited twice
+        const wrapped = await_fut(fut);
+        try {
+          const [value] = await wrapped;
+          if (value !== undefined) {
+            echo(
+              repr_shorten.callKwargs(value, {
+                separator: "\n<long output truncated>\n",
+              })
+            );
+          }
+          if (value instanceof pyodide.ffi.PyProxy) {
+            value.destroy();
+          }
+        } catch (e) {
+          if (e.constructor.name === "PythonError") {
+            term.error((fut.formatted_error || e.message).trimEnd());
+          } else {
+            throw e;
+          }
+        } finally {
+          fut.destroy();
+          wrapped.destroy();
+        }
+      }
+      term.resume();
+      await sleep(10);
+      unlock();
+    }
+
+    document.getElementById("loading").remove();
+    term = $("body").terminal(interpreter, {
+      greetings: false,
+      prompt: ps1,
+      completionEscape: false,
+      completion: function (command, callback) {
+        callback(pyconsole.complete(command).toJs()[0]);
+      },
+      keymap: {
+        "CTRL+C": async function () {
+          clear_console();
+          term.enter();
+          echo("KeyboardInterrupt");
+          term.set_command("");
+          term.set_prompt(ps1);
+        },
+        TAB: (event, original) => {
+          const command = term.before_cursor();
+          // Disable completion for whitespaces.
+          if (command.trim() === "") {
+            term.insert("\t");
+            return false;
+          }
+          return original(event);
+        },
+      },
+    });
+    pyconsole.stdout_callback = (s) => echo(s, { newline: false });
+    pyconsole.stderr_callback = (s) => term.error(s.trimEnd());
+    term.ready = Promise.resolve();
+
+    // Run the snippet as a whole, in the namespace the prompt uses
+    if (config.code) {
+      const unlock = await lock();
+      term.pause();
+      echo(config.code);
+      try {
+        await pyodide.loadPackagesFromImports(config.code);
+        await pyodide.runPythonAsync(config.code, {
+          globals: pyodide.globals,
+        });
+      } catch (e) {
+        term.error(e.message.trimEnd());
+      }
+      term.resume();
+      unlock();
+    }
+  }
+
+  window.console_ready = main();
+})();
@@ -0,0 +1,73 @@
+/**
+ * Child side of the ou-frame resize protocol.
+ *
+ * Reports the height of this document to the parent page with postMessage.
+ * ResizeObserver notifications are batched so that at most one message is
+ * sent per animation frame, and only when the height has actually changed.
+ * The parent side listener lives in static/js/ou_codestyle.js.
+ *
+ * If the parent page does not run that listener but is same-origin (for
+ * example, a VLE page hosting the zipped HTML5 bundle), the containing
+ * iframe is resized directly via window.frameElement.
+ */
+(function () {
+  if (window.parent === window) {
+    return;
+  }
+  var lastHeight = -1;
+  var scheduled = false;
+
+  function documentHeight() {
+    // Calculate body height including margins.
+    var html = document.documentElement;
+    var styles = getComputedStyle(html);
+    return Math.ceil(
+      parseFloat(styles.marginTop) +
+        parseFloat(styles.marginBottom) +
+        html.offsetHeight
+    );
+  }
+
+  function sendHeight() {
+    scheduled = false;
+    var height = documentHeight();
+    if (height === lastHeight) {
+      return;
+    }
+    lastHeight = height;
+    var frame = null;
+    try {
+      if (!window.parent.ouFrameResizer) {
+        frame = window.frameElement;
+      }
+    } catch (error) {
+      // Cross-origin parent: fall through to postMessage.
+    }
+    if (frame) {
+      frame.height = height;
+      return;
+    }
+    window.parent.postMessage(
+      { type: "ou-frame-resize", name: window.name, height: height },
+      "*"
+    );
+  }
+
+  function scheduleResize() {
+    if (scheduled) {
+      return;
+    }
+    scheduled = true;
+    window.requestAnimationFrame(sendHeight);
+  }
+
+  // Kept under the old name so existing "Resize" buttons keep working.
+  window.resize_iframe = scheduleResize;
+
+  if (window.ResizeObserver) {
+    new ResizeObserver(scheduleResize).observe(document.documentElement);
+  } else {
+    window.addEventListener("resize", scheduleResize);
+  }
+  window.addEventListener("load", scheduleResize);
+})();
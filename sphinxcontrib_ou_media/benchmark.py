@@ -0,0 +1,77 @@
+"""Import-time benchmark for the ou extensions.
+
+Run as::
+
+    python -m sphinxcontrib_ou_media.benchmark [--runs N]
+
+For each extension, reports the time to import its module and the time it
+adds to setting up a Sphinx application, over and above Sphinx itself.
+Every measurement runs in a fresh interpreter, so module caching does not
+hide import costs; the best of N runs is reported.
+"""
+
+from typing import List, Optional
+
+import argparse
+import subprocess
+import sys
+import tempfile
+
+from sphinxcontrib_ou_media import EXTENSIONS
+
+# Sphinx itself is imported before timing starts
+IMPORT_SNIPPET = """
+import importlib, time
+import sphinx.application, sphinx.util.docutils
+start = time.perf_counter()
+importlib.import_module({module!r})
+print(time.perf_counter() - start)
+"""
+
+SETUP_SNIPPET = """
+import io, time
+from sphinx.application import Sphinx
+start = time.perf_counter()
+Sphinx({srcdir!r}, {srcdir!r}, {srcdir!r} + "/_build", {srcdir!r} + "/_doctrees",
+       "html", status=io.StringIO(), warning=io.StringIO(),
+       confoverrides={{"extensions": {extensions!r}}})
+print(time.perf_counter() - start)
+"""
+
+
+def best_of(snippet: str, runs: int) -> float:
+    """Return the best time printed by a snippet over several fresh runs."""
+    times = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", snippet], capture_output=True, text=True, check=True
+        )
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+    return min(times)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="runs per measurement")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as srcdir:
+        open(f"{srcdir}/conf.py", "w").close()
+        baseline = best_of(
+            SETUP_SNIPPET.format(srcdir=srcdir, extensions=[]), args.runs
+        )
+        print(f"{'extension':<32}{'import (ms)':>12}{'setup (ms)':>12}")
+        for extension in EXTENSIONS + ["sphinxcontrib_ou_media"]:
+            import_time = best_of(IMPORT_SNIPPET.format(module=extension), args.runs)
+            setup_time = best_of(
+                SETUP_SNIPPET.format(srcdir=srcdir, extensions=[extension]),
+                args.runs,
+            )
+            print(
+                f"{extension:<32}{import_time * 1000:>12.1f}"
+                f"{(setup_time - baseline) * 1000:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
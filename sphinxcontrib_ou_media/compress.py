@@ -0,0 +1,155 @@
+"""Write precompressed siblings for the static files these extensions produce.
+
+When ``ou_precompress`` is set, a ``build-finished`` stage writes a ``.gz``
+(and, with ``ou_precompress_brotli``, a ``.br``) copy next to each text
+asset produced or copied by the ou extensions in an HTML build, so a web
+server can serve them directly (e.g. nginx ``gzip_static``). Files are
+compressed in parallel and skipped if their compressed copy is up to date.
+Nothing is compressed in draft builds.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import gzip
+import hashlib
+import os
+import re
+
+from sphinx.application import Sphinx
+from sphinx.util import logging
+
+from sphinxcontrib_ou_media.utils import is_draft
+
+logger = logging.getLogger(__name__)
+
+PRECOMPRESS_PATTERNS: List[str] = [
+    # Asset bundles written by write_asset_bundles
+    r"_static/ou_[^/]+\.(js|css)$",
+    # Runtimes hosted once per site
+    r"_ou_runtimes/.+\.(js|css|html|json|svg|map|txt)$",
+    # ou-codestyle pages
+    r"[0-9a-f]{32}\.(html|txt)$",
+    # ou-mol3d pages
+    r"[^/]+_generated\.html$",
+]
+"Patterns (on output-relative posix paths) of the files to precompress"
+
+
+PRECOMPRESS_CACHE = os.path.join("_tmp", "precompress")
+"Directory of markers for files that are not made smaller by compressing them"
+
+
+def _skip_marker(target: Path) -> Path:
+    """Return the marker recording that a compressed copy was not worth writing."""
+    digest = hashlib.sha256(str(target.resolve()).encode()).hexdigest()[:32]
+    return Path(PRECOMPRESS_CACHE, digest)
+
+
+def _is_fresh(source: Path, target: Path) -> bool:
+    """Whether the compressed copy, or the decision to skip it, is newer than its source."""
+    mtime = source.stat().st_mtime
+    return any(
+        path.exists() and path.stat().st_mtime >= mtime
+        for path in (target, _skip_marker(target))
+    )
+
+
+def _write_compressed(target: Path, data: bytes, compressed: bytes) -> bool:
+    """Write a compressed copy if it is smaller than the original."""
+    marker = _skip_marker(target)
+    if len(compressed) < len(data):
+        target.write_bytes(compressed)
+        marker.unlink(missing_ok=True)
+        return True
+    # Don't leave a copy from an earlier build for the server to find
+    target.unlink(missing_ok=True)
+    marker.parent.mkdir(parents=True, exist_ok=True)
+    marker.touch()
+    return False
+
+
+def compress_file(path: Path, brotli=None) -> Tuple[int, int]:
+    """Write the compressed siblings of a file, if out of date.
+
+    Args:
+        path: the file to compress
+        brotli: the brotli module, or None to only write ``.gz``
+
+    Returns:
+        the original size and the gzipped size (0 if not written)
+    """
+    data = None
+    written = 0
+    gz_path = path.with_name(path.name + ".gz")
+    if not _is_fresh(path, gz_path):
+        data = path.read_bytes()
+        # mtime=0 keeps the output reproducible
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if _write_compressed(gz_path, data, compressed):
+            written = len(compressed)
+    if brotli is not None:
+        br_path = path.with_name(path.name + ".br")
+        if not _is_fresh(path, br_path):
+            data = path.read_bytes() if data is None else data
+            _write_compressed(br_path, data, brotli.compress(data, quality=11))
+    return path.stat().st_size, written
+
+
+def find_assets(outdir: str, patterns: List[str], min_size: int) -> List[Path]:
+    """Return the files in the output directory to precompress."""
+    matchers = [re.compile(pattern) for pattern in patterns]
+    assets = []
+    for root, _, files in os.walk(outdir):
+        for name in files:
+            path = Path(root, name)
+            relpath = path.relative_to(outdir).as_posix()
+            if any(m.match(relpath) for m in matchers) and path.stat().st_size >= min_size:
+                assets.append(path)
+    return assets
+
+
+def precompress_assets(app: Sphinx, exception: Optional[Exception]) -> None:
+    """Write precompressed siblings of static assets once the build is done."""
+    if exception is not None or not app.config.ou_precompress:
+        return
+    if app.builder.format != "html" or is_draft(app):
+        return
+    brotli = None
+    if app.config.ou_precompress_brotli:
+        try:
+            import brotli
+        except ImportError:
+            logger.warning(
+                "ou_precompress_brotli needs the brotli package; only writing .gz files"
+            )
+    assets = find_assets(
+        app.outdir,
+        PRECOMPRESS_PATTERNS + list(app.config.ou_precompress_patterns),
+        app.config.ou_precompress_min_size,
+    )
+    # zlib and brotli release the GIL, so threads compress in parallel
+    with ThreadPoolExecutor() as pool:
+        results = list(pool.map(lambda path: compress_file(path, brotli), assets))
+    compressed = [(size, gz_size) for size, gz_size in results if gz_size]
+    if compressed:
+        logger.info(
+            f"precompressed {len(compressed)} files: "
+            f"{sum(s for s, _ in compressed)} -> {sum(g for _, g in compressed)} bytes"
+        )
+
+
+def setup_precompression(app: Sphinx) -> None:
+    """Register the precompression config values and build stage.
+
+    Several extensions produce static assets, so only register once.
+    """
+    if "ou_precompress" in app.config:
+        return
+    app.add_config_value("ou_precompress", False, "")
+    app.add_config_value("ou_precompress_brotli", False, "")
+    app.add_config_value("ou_precompress_min_size", 1024, "")
+    # Extra patterns, e.g. r".+\.html$" to compress every page
+    app.add_config_value("ou_precompress_patterns", [], "")
+    app.connect("build-finished", precompress_assets)
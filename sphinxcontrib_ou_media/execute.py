@@ -0,0 +1,172 @@
+"""Run interactive code snippets at build time and cache their output.
+
+When ``ou_codestyle_execute`` is set, each Python ``thebelite`` and
+``pyodide-terminal`` snippet is recorded as it is read. Once every document
+has been read, the snippets without a cached output are run, each in its own
+Python subprocess with a timeout, a few at a time. The output (stdout and stderr, interleaved) is
+cached in ``OUTPUT_CACHE`` by the snippet's language and code and a
+fingerprint of the Python environment, so a snippet only runs again when its
+code or the installed packages change.
+
+The output is shown in the page as a static preview, with the interactive
+frame only loaded when the learner chooses to edit or run the code.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import functools
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_CACHE = os.path.join("_tmp", "outputs")
+"Directory that snippet outputs are cached in"
+
+EXECUTABLE_LANGUAGES = ("python", "python3", "py", "ipython", "ipython3")
+"Snippet languages that are run with the local Python"
+
+
+@functools.lru_cache(maxsize=None)
+def environment_fingerprint() -> str:
+    """Return a fingerprint of the Python version and installed packages."""
+    from importlib.metadata import distributions
+
+    packages = sorted(
+        f"{dist.metadata['Name']}=={dist.version}" for dist in distributions()
+    )
+    return hashlib.sha256(
+        "\n".join([sys.version] + packages).encode()
+    ).hexdigest()[:16]
+
+
+def snippet_key(lang: str, code: str) -> str:
+    """Return the key a snippet's output is recorded under."""
+    return hashlib.sha256(f"{lang.lower()}\0{code}".encode()).hexdigest()[:32]
+
+
+def output_path(key: str) -> str:
+    return os.path.join(OUTPUT_CACHE, f"{key}-{environment_fingerprint()}.json")
+
+
+def cached_output(key: str) -> Optional[Dict[str, object]]:
+    """Return the cached output of a snippet, if it has been run."""
+    try:
+        with open(output_path(key), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def run_snippet(code: str, timeout: float, cwd: str) -> Dict[str, object]:
+    """Run a snippet in a Python subprocess and return its output."""
+    try:
+        result = subprocess.run(
+            [sys.executable, "-"],
+            input=code,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            timeout=timeout,
+            cwd=cwd,
+        )
+    except subprocess.TimeoutExpired as err:
+        output = err.stdout or ""
+        if isinstance(output, bytes):
+            output = output.decode("utf-8", "replace")
+        return {
+            "output": output + f"\n[Timed out after {timeout} seconds]",
+            "status": "timeout",
+        }
+    return {
+        "output": result.stdout,
+        "status": "ok" if result.returncode == 0 else "error",
+    }
+
+
+def save_output(key: str, output: Dict[str, object]) -> None:
+    os.makedirs(OUTPUT_CACHE, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=OUTPUT_CACHE, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(output, f)
+    os.replace(tmp_path, output_path(key))
+
+
+def note_snippet(env: BuildEnvironment, lang: str, code: str) -> Optional[str]:
+    """Record a snippet to run, returning its key if it can be run."""
+    if lang.lower() not in EXECUTABLE_LANGUAGES:
+        return None
+    if not hasattr(env, "ou_snippets"):
+        env.ou_snippets = {}
+    key = snippet_key(lang, code)
+    env.ou_snippets.setdefault(env.docname, {})[key] = code
+    return key
+
+
+def execute_snippets(app: Sphinx, env: BuildEnvironment) -> List[str]:
+    """Run the snippets that have no cached output, once reading is done.
+
+    Returns the documents that use them, so pages that were not read again
+    (e.g. after the Python environment changed) are written with the output.
+    """
+    if not app.config.ou_codestyle_execute:
+        return []
+    pending: Dict[str, Tuple[str, str]] = {}
+    docnames = set()
+    for docname, snippets in sorted(getattr(env, "ou_snippets", {}).items()):
+        for key, code in snippets.items():
+            if key in pending or not os.path.exists(output_path(key)):
+                pending.setdefault(key, (code, docname))
+                docnames.add(docname)
+    if not pending:
+        return []
+    logger.info(f"codestyle: running {len(pending)} snippets")
+    timeout = app.config.ou_codestyle_execute_timeout
+    workers = app.config.ou_codestyle_execute_workers or os.cpu_count() or 1
+    # Threads only wait on the subprocesses, which run in parallel
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        outputs = pool.map(
+            lambda key: (key, run_snippet(pending[key][0], timeout, str(app.srcdir))),
+            pending,
+        )
+        for key, output in outputs:
+            if output["status"] != "ok":
+                logger.warning(
+                    f"codestyle: snippet failed at build time ({output['status']})",
+                    location=pending[key][1],
+                )
+            save_output(key, output)
+    return sorted(docnames)
+
+
+def purge_snippets(app: Sphinx, env: BuildEnvironment, docname: str) -> None:
+    getattr(env, "ou_snippets", {}).pop(docname, None)
+
+
+def merge_snippets(app: Sphinx, env: BuildEnvironment, docnames: List[str],
+                   other: BuildEnvironment) -> None:
+    if not hasattr(env, "ou_snippets"):
+        env.ou_snippets = {}
+    for docname, snippets in getattr(other, "ou_snippets", {}).items():
+        if docname in docnames:
+            env.ou_snippets[docname] = snippets
+
+
+def setup_execution(app: Sphinx) -> None:
+    """Register the snippet execution config values and build stage."""
+    app.add_config_value("ou_codestyle_execute", False, "env")
+    app.add_config_value("ou_codestyle_execute_timeout", 30, "")
+    # None uses the number of processors
+    app.add_config_value("ou_codestyle_execute_workers", None, "")
+    app.connect("env-purge-doc", purge_snippets)
+    app.connect("env-merge-info", merge_snippets)
+    app.connect("env-updated", execute_snippets)
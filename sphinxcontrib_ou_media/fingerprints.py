@@ -0,0 +1,147 @@
+"""Re-read documents when the templates or runtimes they were built with change.
+
+Directive output depends on files shipped in this package (page templates,
+scripts and interactive runtimes) and on some third party packages, none of
+which Sphinx tracks. Each extension declares the resources its directives
+use with :func:`watch_resources`. When the environment is checked for
+outdated documents, the resources are fingerprinted by content (package
+reinstalls change file times, not content) and compared with the
+fingerprints recorded on the previous build; the documents that use the
+affected directives, as recorded in the inventory, are read again.
+Everything else stays cached.
+"""
+
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+
+import hashlib
+import weakref
+
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+from sphinx.util import logging
+
+from sphinxcontrib_ou_media.utils import resources_path
+
+logger = logging.getLogger(__name__)
+
+Resource = Union[Tuple[str, ...], str]
+"A package resource path, as a tuple of parts, or a distribution name"
+
+Selector = Callable[[Dict], bool]
+"Selects the inventory entries that use a set of resources"
+
+_watched: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def uses_option(name: str, value: str, default: str = "") -> Selector:
+    """Select the uses of a directive with an option value, e.g. a codestyle type."""
+
+    def select(entry: Dict) -> bool:
+        return str(entry["options"].get(name, default)).lower() == value
+
+    return select
+
+
+def resource_key(resource: Resource) -> str:
+    if isinstance(resource, str):
+        return f"dist:{resource}"
+    return "/".join(resource)
+
+
+def resource_fingerprint(resource: Resource) -> str:
+    """Return a fingerprint of a package file or directory, or a distribution version."""
+    if isinstance(resource, str):
+        from importlib.metadata import PackageNotFoundError, version
+
+        try:
+            return version(resource)
+        except PackageNotFoundError:
+            return ""
+    path = resources_path().joinpath(*resource)
+    digest = hashlib.sha256()
+    if path.is_file():
+        digest.update(path.read_bytes())
+    elif path.is_dir():
+        stack = [(path, "")]
+        files = []
+        while stack:
+            directory, prefix = stack.pop()
+            for child in directory.iterdir():
+                if child.is_dir():
+                    stack.append((child, f"{prefix}{child.name}/"))
+                else:
+                    files.append((f"{prefix}{child.name}", child))
+        for name, child in sorted(files):
+            digest.update(f"{name}\0".encode())
+            digest.update(hashlib.sha256(child.read_bytes()).digest())
+    else:
+        return ""
+    return digest.hexdigest()[:16]
+
+
+def watch_resources(app: Sphinx, directive: str, resources: List[Resource],
+                    select: Optional[Selector] = None) -> None:
+    """Re-read the documents using a directive when any of its resources change.
+
+    Args:
+        app: the Sphinx application
+        directive: the directive name, e.g. ``ou-codestyle``
+        resources: the package files and directories, and distributions, used
+        select: limits the uses affected, e.g. to one codestyle type
+    """
+    setup_fingerprints(app)
+    _watched[app].append((directive, list(resources), select))
+
+
+def outdated_docs(app: Sphinx, env: BuildEnvironment, added: Set[str],
+                  changed: Set[str], removed: Set[str]) -> List[str]:
+    """Return the documents using resources changed since the last build."""
+    watched = _watched.get(app, [])
+    current = {}
+    for _, resources, _ in watched:
+        for resource in resources:
+            key = resource_key(resource)
+            if key not in current:
+                current[key] = resource_fingerprint(resource)
+    previous: Optional[Dict[str, str]] = getattr(env, "ou_fingerprints", None)
+    env.ou_fingerprints = current
+    if previous is None:
+        # A fresh environment, so every document is read anyway
+        return []
+    stale = {key for key, value in current.items() if previous.get(key) != value}
+    if not stale:
+        return []
+    affected = [
+        (directive, select)
+        for directive, resources, select in watched
+        if stale.intersection(resource_key(resource) for resource in resources)
+    ]
+    docnames = set()
+    for docname, entries in getattr(env, "ou_inventory", {}).items():
+        if docname in removed:
+            continue
+        for entry in entries:
+            if any(
+                entry["directive"] == directive and (select is None or select(entry))
+                for directive, select in affected
+            ):
+                docnames.add(docname)
+                break
+    docnames -= added | changed
+    if docnames:
+        logger.info(
+            f"ou: {len(docnames)} documents use changed templates or runtimes "
+            f"({', '.join(sorted(stale))})"
+        )
+    return sorted(docnames)
+
+
+def setup_fingerprints(app: Sphinx) -> None:
+    """Register the outdated document check.
+
+    Several ou extensions watch resources, so only register once.
+    """
+    if app in _watched:
+        return
+    _watched[app] = []
+    app.connect("env-get-outdated", outdated_docs)
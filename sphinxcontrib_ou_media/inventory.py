@@ -0,0 +1,173 @@
+"""Inventory of the ou directives used in a book.
+
+Each ou directive records where it is used (document and line), its options,
+the local and remote assets it uses and the artifacts it generates, in the
+build environment. The inventory is kept up to date as documents are read
+(and merged after parallel reads), and written to ``ou-inventory.json`` in the
+output directory when the build finishes, with indexes by document,
+directive and asset.
+
+Downstream tools can then look things up without re-parsing the output::
+
+    from sphinxcontrib_ou_media.inventory import Inventory
+
+    inventory = Inventory.load("_build/html/ou-inventory.json")
+    inventory.by_directive("ou-video")
+    inventory.using_asset("media/intro.mp4")
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+
+import json
+import os
+import tempfile
+import weakref
+
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+
+INVENTORY = "ou-inventory.json"
+"File name of the inventory in the output directory"
+
+INVENTORY_VERSION = 1
+
+ENV_VERSION = 3
+"""Version of the data the ou extensions keep in the build environment.
+
+Every ou extension returns it as its ``env_version``; bump it when that data
+changes, so Sphinx discards environments pickled by earlier versions.
+"""
+
+_registered: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def note_directive(directive, node=None, assets: Iterable[str] = (),
+                   remote: Iterable[str] = (), artifacts: Iterable[str] = ()) -> None:
+    """Record a use of an ou directive in the inventory.
+
+    Args:
+        directive: the directive being run
+        node: the node it produced, for its source line
+        assets: local files used, relative to the source directory
+        remote: remote URLs used
+        artifacts: files generated for the directive
+    """
+    env = directive.env
+    if not hasattr(env, "ou_inventory"):
+        env.ou_inventory = {}
+    line = getattr(node, "line", None) or directive.lineno
+    options = {}
+    for key, value in directive.options.items():
+        # Flag options are None
+        if value is None:
+            value = True
+        elif not isinstance(value, (str, int, float, bool)):
+            value = str(value)
+        options[key] = value
+    env.ou_inventory.setdefault(env.docname, []).append(
+        {
+            "doc": env.docname,
+            "line": line,
+            "directive": directive.name,
+            "options": options,
+            "assets": sorted({str(asset) for asset in assets if asset}),
+            "remote": sorted({str(url) for url in remote if url}),
+            "artifacts": sorted({str(artifact) for artifact in artifacts if artifact}),
+        }
+    )
+
+
+class Inventory:
+    """The ou directives used in a book, with lookups by document, directive and asset."""
+
+    def __init__(self, entries: List[Dict[str, Any]]):
+        self.entries = entries
+        self.docs: Dict[str, List[int]] = {}
+        self.directives: Dict[str, List[int]] = {}
+        self.assets: Dict[str, List[int]] = {}
+        for index, entry in enumerate(entries):
+            self.docs.setdefault(entry["doc"], []).append(index)
+            self.directives.setdefault(entry["directive"], []).append(index)
+            for asset in entry["assets"] + entry["remote"] + entry["artifacts"]:
+                self.assets.setdefault(asset, []).append(index)
+
+    @classmethod
+    def from_env(cls, env: BuildEnvironment) -> "Inventory":
+        inventory = getattr(env, "ou_inventory", {})
+        return cls([entry for docname in sorted(inventory) for entry in inventory[docname]])
+
+    @classmethod
+    def load(cls, filename: str) -> "Inventory":
+        with open(filename, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != INVENTORY_VERSION:
+            raise ValueError(f"{filename}: unsupported inventory version")
+        inventory = cls.__new__(cls)
+        inventory.entries = data["entries"]
+        inventory.docs = data["docs"]
+        inventory.directives = data["directives"]
+        inventory.assets = data["assets"]
+        return inventory
+
+    def dump(self, filename: str) -> None:
+        """Write the inventory, with its indexes, as compact JSON."""
+        data = {
+            "version": INVENTORY_VERSION,
+            "entries": self.entries,
+            "docs": self.docs,
+            "directives": self.directives,
+            "assets": self.assets,
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filename) or ".", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, filename)
+
+    def _entries(self, indexes: Optional[List[int]]) -> List[Dict[str, Any]]:
+        return [self.entries[index] for index in indexes or []]
+
+    def by_doc(self, docname: str) -> List[Dict[str, Any]]:
+        """Return the directives used in a document."""
+        return self._entries(self.docs.get(docname))
+
+    def by_directive(self, name: str) -> List[Dict[str, Any]]:
+        """Return the uses of a directive, e.g. ``ou-video``."""
+        return self._entries(self.directives.get(name))
+
+    def using_asset(self, asset: str) -> List[Dict[str, Any]]:
+        """Return the directives that use or generate a file or URL."""
+        return self._entries(self.assets.get(asset))
+
+
+def write_inventory(app: Sphinx, exception: Optional[Exception]) -> None:
+    if exception is not None:
+        return
+    os.makedirs(app.outdir, exist_ok=True)
+    Inventory.from_env(app.env).dump(os.path.join(app.outdir, INVENTORY))
+
+
+def purge_inventory(app: Sphinx, env: BuildEnvironment, docname: str) -> None:
+    getattr(env, "ou_inventory", {}).pop(docname, None)
+
+
+def merge_inventory(app: Sphinx, env: BuildEnvironment, docnames: List[str],
+                    other: BuildEnvironment) -> None:
+    if not hasattr(env, "ou_inventory"):
+        env.ou_inventory = {}
+    for docname, entries in getattr(other, "ou_inventory", {}).items():
+        if docname in docnames:
+            env.ou_inventory[docname] = entries
+
+
+def setup_inventory(app: Sphinx) -> None:
+    """Register the inventory build stages.
+
+    Every ou extension records its directives, so only register once.
+    """
+    if app in _registered:
+        return
+    _registered.add(app)
+    app.connect("env-purge-doc", purge_inventory)
+    app.connect("env-merge-info", merge_inventory)
+    app.connect("build-finished", write_inventory)
@@ -0,0 +1,121 @@
+"""Media upload manifests for the ``ouxml`` builder.
+
+The ``ouxml`` builder copies the local files used by images and the ou media
+directives to its output directory, and points the OU-XML at them through the
+``image_path_prefix`` and ``media_path_prefix`` URLs. It records each file in
+a manifest, ``media-manifest.json``, with the source it came from, a content
+hash, its size and its target URL, and writes the difference from the
+previously published manifest to ``media-changes.json``, so only new and
+changed files need to be uploaded.
+
+To list the files that need uploading, given the manifest of the last upload::
+
+    python -m sphinxcontrib_ou_media.manifest PUBLISHED_MANIFEST NEW_MANIFEST
+"""
+
+from typing import Any, Dict, List, Optional
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+
+MANIFEST = "media-manifest.json"
+"File name of the manifest in the output directory"
+
+CHANGES = "media-changes.json"
+"File name of the difference from the published manifest"
+
+MANIFEST_VERSION = 1
+
+
+def file_digest(filename: str) -> str:
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(filename: Optional[str]) -> Dict[str, Any]:
+    """Return a manifest, or an empty one if it can't be read."""
+    if filename:
+        try:
+            with open(filename, encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION:
+                return manifest
+        except (OSError, ValueError):
+            pass
+    return {"version": MANIFEST_VERSION, "files": {}}
+
+
+def build_manifest(outdir: str, media: Dict[str, Dict[str, str]],
+                   previous: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the manifest of the published files in ``media``.
+
+    ``media`` maps output file names to their source and URL. Files whose
+    size and modification time match the previous manifest are not hashed
+    again.
+    """
+    files = {}
+    old_files = previous.get("files", {})
+    for filename in sorted(media):
+        target = os.path.join(outdir, filename)
+        try:
+            stat = os.stat(target)
+        except OSError:
+            continue
+        old = old_files.get(filename, {})
+        if old.get("size") == stat.st_size and old.get("mtime") == stat.st_mtime_ns:
+            digest = old["hash"]
+        else:
+            digest = file_digest(target)
+        files[filename] = {
+            "source": media[filename]["source"],
+            "hash": digest,
+            "size": stat.st_size,
+            "url": media[filename]["url"],
+            "mtime": stat.st_mtime_ns,
+        }
+    return {"version": MANIFEST_VERSION, "files": files}
+
+
+def diff_manifests(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Return the files added, changed and removed between two manifests."""
+    old_files, new_files = old.get("files", {}), new.get("files", {})
+    return {
+        "added": sorted(set(new_files) - set(old_files)),
+        "changed": sorted(
+            name
+            for name in set(new_files) & set(old_files)
+            if new_files[name]["hash"] != old_files[name]["hash"]
+        ),
+        "removed": sorted(set(old_files) - set(new_files)),
+    }
+
+
+def write_json(filename: str, data: Dict[str, Any]) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filename) or ".", suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, filename)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("published", help="manifest of the last upload")
+    parser.add_argument("manifest", help="manifest of the new build")
+    parser.add_argument("--removed", action="store_true",
+                        help="list removed files instead")
+    args = parser.parse_args(argv)
+
+    changes = diff_manifests(load_manifest(args.published), load_manifest(args.manifest))
+    for filename in changes["removed"] if args.removed else changes["added"] + changes["changed"]:
+        print(filename)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Processed copies of local media files, cached by source content.
+
+Media processing (e.g. stripping embedded artwork from an MP3) writes a new
+file to a directory of ``MEDIA_CACHE`` named by a hash of the source file's
+content, the processing step and its parameters, so each file is only
+processed once however many builds use it. The processed copy then replaces the source in
+the ``env.images`` path that copies media to the output directory.
+
+Source hashes are cached by file size and modification time, so unchanged
+sources are not hashed again either.
+"""
+
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import hashlib
+import json
+import os
+import tempfile
+
+from sphinx.environment import BuildEnvironment
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+MEDIA_CACHE = os.path.join("_tmp", "media")
+"Directory that processed media files are cached in"
+
+HASH_INDEX = "hashes.json"
+
+CHUNK_SIZE = 1 << 20
+"Bytes read or copied at a time when streaming media files"
+
+Processor = Callable[..., Optional[Dict[str, Any]]]
+"Writes a processed copy of a source file, returning a summary, or None to keep the source"
+
+_hashes: Dict[str, Tuple[int, int, str]] = {}
+
+
+def source_hash(filename: str) -> str:
+    """Return the SHA-256 hash of a file, reusing it while its size and mtime match."""
+    stat = os.stat(filename)
+    if not _hashes:
+        try:
+            with open(os.path.join(MEDIA_CACHE, HASH_INDEX), encoding="utf-8") as f:
+                _hashes.update({k: tuple(v) for k, v in json.load(f).items()})
+        except (OSError, ValueError):
+            pass
+    key = os.path.abspath(filename)
+    cached = _hashes.get(key)
+    if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    _hashes[key] = (stat.st_size, stat.st_mtime_ns, digest.hexdigest())
+    os.makedirs(MEDIA_CACHE, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=MEDIA_CACHE, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(_hashes, f)
+    os.replace(tmp_path, os.path.join(MEDIA_CACHE, HASH_INDEX))
+    return digest.hexdigest()
+
+
+def copy_stream(source, target, length: Optional[int] = None) -> None:
+    """Copy ``length`` bytes (or the rest) of one open file to another, in chunks."""
+    while length is None or length > 0:
+        chunk = source.read(CHUNK_SIZE if length is None else min(CHUNK_SIZE, length))
+        if not chunk:
+            break
+        target.write(chunk)
+        if length is not None:
+            length -= len(chunk)
+
+
+def process_media(env: BuildEnvironment, src: str, step: str, processor: Processor,
+                  **params) -> str:
+    """Return the processed copy of a local media file, processing it if needed.
+
+    Args:
+        env: the build environment
+        src: the file, relative to the source directory (as in ``env.images``)
+        step: the name of the processing step, e.g. ``slim``
+        processor: called with the source and target file names and the
+            parameters; returns a summary of the processing, or None if the
+            source should be used as it is
+        params: parameters of the processing step
+
+    Returns:
+        the file to publish, relative to the source directory
+    """
+    source = os.path.join(env.srcdir, src)
+    if not os.path.exists(source):
+        return src
+    key = hashlib.sha256(
+        json.dumps([source_hash(source), step, params], sort_keys=True).encode()
+    ).hexdigest()[:16]
+    # Keep the file name, which the published copy is named after
+    directory = os.path.join(MEDIA_CACHE, f"{step}-{key}")
+    target = os.path.join(directory, Path(src).name)
+    summary_path = os.path.join(directory, "summary.json")
+    try:
+        with open(summary_path, encoding="utf-8") as f:
+            summary = json.load(f)
+    except (OSError, ValueError):
+        summary = None
+    if summary is None:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=Path(src).suffix)
+        os.close(fd)
+        try:
+            summary = processor(source, tmp_path, **params)
+            if summary is not None:
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, target)
+        except (OSError, ValueError) as err:
+            logger.warning(f"media: can't {step} {src}: {err}", location=env.docname)
+            return src
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        processed = summary is not None
+        summary = dict(summary or {}, source_size=os.path.getsize(source))
+        summary["size"] = os.path.getsize(target) if processed else None
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f)
+        if summary["size"] is not None:
+            logger.info(
+                f"media: {step} {src}: {summary['source_size']} to {summary['size']} bytes"
+            )
+    if summary.get("size") is None:
+        # Nothing to do for this file
+        return src
+    return os.path.relpath(os.path.abspath(target), env.srcdir)
+
+
+def setup_media_processing(app) -> None:
+    """Register the media processing config values.
+
+    The audio and video extensions both process media, so only register once.
+    """
+    if "ou_media_slim" not in app.config:
+        # Strip embedded artwork and metadata from published MP3 and MP4 files
+        app.add_config_value("ou_media_slim", False, "env")
@@ -0,0 +1,231 @@
+"""Pure Python processing of MP3 files, without decoding or re-encoding.
+
+The audio frames are streamed from the source file to the processed copy;
+only the ID3v2 tag at the start of the file is read into memory.
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sphinxcontrib_ou_media.media import copy_stream
+
+ID3_HEADER_SIZE = 10
+
+SLIMMED_FRAMES = {"APIC", "PIC"}
+"ID3v2 frames dropped when slimming: embedded pictures (cover art)"
+
+
+def synchsafe(data: bytes) -> int:
+    """Decode an ID3v2 synchsafe integer (7 bits per byte)."""
+    value = 0
+    for byte in data:
+        value = (value << 7) | (byte & 0x7F)
+    return value
+
+
+def to_synchsafe(value: int) -> bytes:
+    return bytes((value >> shift) & 0x7F for shift in (21, 14, 7, 0))
+
+
+def read_id3v2(f) -> Optional[Tuple[bytes, bytes, int]]:
+    """Read the ID3v2 tag at the start of a file.
+
+    Returns:
+        the tag header and body, and the size of the whole tag (including
+        any footer), or None if the file does not start with a tag
+    """
+    header = f.read(ID3_HEADER_SIZE)
+    if len(header) < ID3_HEADER_SIZE or header[:3] != b"ID3":
+        f.seek(0)
+        return None
+    size = synchsafe(header[6:10])
+    body = f.read(size)
+    if len(body) < size:
+        raise ValueError("truncated ID3v2 tag")
+    total = ID3_HEADER_SIZE + size
+    if header[3] == 4 and header[5] & 0x10:
+        # ID3v2.4 footer
+        total += ID3_HEADER_SIZE
+    return header, body, total
+
+
+def id3_frames(header: bytes, body: bytes) -> Optional[List[Tuple[str, bytes]]]:
+    """Split an ID3v2 tag body into its frames, as (frame id, raw frame) pairs.
+
+    Returns None for tags that can't be split safely (whole-tag
+    unsynchronisation in ID3v2.2 and ID3v2.3, or ID3v2.2 compression).
+    """
+    major, flags = header[3], header[5]
+    if major not in (2, 3, 4) or (flags & 0x80 and major < 4) or (flags & 0x40 and major == 2):
+        return None
+    position = 0
+    if flags & 0x40 and major > 2:
+        # Extended header; it may hold a CRC of the frames, so it is dropped
+        if major == 3:
+            position = 4 + int.from_bytes(body[:4], "big")
+        else:
+            position = synchsafe(body[:4])
+    id_size, header_size = (3, 6) if major == 2 else (4, 10)
+    frames = []
+    while position + header_size <= len(body):
+        frame_id = body[position:position + id_size]
+        if not frame_id.strip(b"\0"):
+            # Padding
+            break
+        size_bytes = body[position + id_size:position + id_size + (3 if major == 2 else 4)]
+        size = synchsafe(size_bytes) if major == 4 else int.from_bytes(size_bytes, "big")
+        end = position + header_size + size
+        if end > len(body):
+            return None
+        frames.append((frame_id.decode("latin-1"), body[position:end]))
+        position = end
+    return frames
+
+
+def slim_mp3(source: str, target: str) -> Optional[Dict[str, Any]]:
+    """Write a copy of an MP3 without its embedded pictures or tag padding.
+
+    Returns a summary of the frames removed, or None if nothing is removed.
+    """
+    with open(source, "rb") as f:
+        tag = read_id3v2(f)
+        if tag is None:
+            return None
+        header, body, total = tag
+        frames = id3_frames(header, body)
+        if frames is None:
+            return None
+        kept = b"".join(frame for frame_id, frame in frames if frame_id not in SLIMMED_FRAMES)
+        removed = sorted({frame_id for frame_id, _ in frames if frame_id in SLIMMED_FRAMES})
+        new_size = len(kept) + ID3_HEADER_SIZE if kept else 0
+        if new_size >= total:
+            return None
+        f.seek(total)
+        with open(target, "wb") as out:
+            if kept:
+                # Without the extended header or footer
+                flags = header[5] & ~(0x40 | 0x10)
+                out.write(header[:5] + bytes([flags]) + to_synchsafe(len(kept)) + kept)
+            copy_stream(f, out)
+    return {"removed": removed}
+
+
+# Bitrates (kbit/s) by MPEG version (1, or 2 and 2.5), layer and bitrate index
+BITRATES: Dict[Tuple[int, int], Tuple[int, ...]] = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+# Sample rates by MPEG version bits (MPEG 2.5, reserved, MPEG 2, MPEG 1)
+SAMPLE_RATES: Dict[int, Tuple[int, int, int]] = {
+    0: (11025, 12000, 8000),
+    2: (22050, 24000, 16000),
+    3: (44100, 48000, 32000),
+}
+
+
+def frame_header(header: bytes) -> Optional[Tuple[int, int, int]]:
+    """Decode an MPEG audio frame header.
+
+    Returns:
+        the frame length in bytes, its number of samples and the sample
+        rate, or None if the bytes are not a valid frame header
+    """
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version_bits = (header[1] >> 3) & 0x03
+    layer = 4 - ((header[1] >> 1) & 0x03)
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+    if version_bits == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        # Reserved values, or free format bitrates, which can't be walked
+        return None
+    version = 1 if version_bits == 3 else 2
+    bitrate = BITRATES[(version, layer)][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version_bits][rate_index]
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate
+    samples = 576 if layer == 3 and version == 2 else 1152
+    return samples // 8 * bitrate // sample_rate + padding, samples, sample_rate
+
+
+def is_info_frame(frame: bytes) -> bool:
+    """Whether a frame is a Xing, Info or VBRI header (a silent frame of file metadata)."""
+    return b"Xing" in frame[4:40] or b"Info" in frame[4:40] or frame[36:40] == b"VBRI"
+
+
+def frames(f) -> Iterator[Tuple[int, int, int, int]]:
+    """Yield the offset, length, samples and sample rate of each audio frame.
+
+    Bytes between frames that are not a frame header are skipped; the
+    walk stops at the ID3v1 tag, if there is one.
+    """
+    tag = read_id3v2(f)
+    position = tag[2] if tag else 0
+    first = True
+    while True:
+        f.seek(position)
+        header = f.read(4)
+        if len(header) < 4 or header[:3] == b"TAG":
+            return
+        decoded = frame_header(header)
+        if decoded is None:
+            position += 1
+            continue
+        length, samples, sample_rate = decoded
+        if first:
+            first = False
+            f.seek(position)
+            if is_info_frame(f.read(length)):
+                position += length
+                continue
+        yield position, length, samples, sample_rate
+        position += length
+
+
+def parse_time(value: str) -> float:
+    """Parse a time in seconds, or as ``MM:SS`` or ``HH:MM:SS`` (seconds may have decimals)."""
+    seconds = 0.0
+    for part in value.strip().split(":"):
+        seconds = seconds * 60 + float(part)
+    if seconds < 0:
+        raise ValueError(f"negative time: {value}")
+    return seconds
+
+
+def clip_mp3(source: str, target: str, start: float = 0.0,
+             end: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """Write the frames of an MP3 that overlap a time range, without re-encoding.
+
+    The excerpt starts and ends on frame boundaries (about 26 ms apart),
+    so it may be up to a frame longer at each end than the range asked for.
+    Tags and the Xing/Info frame are not copied.
+
+    Returns the times the excerpt actually starts and ends at.
+    """
+    with open(source, "rb") as f:
+        elapsed = 0.0
+        first_offset = last_end = None
+        clip_start = clip_end = 0.0
+        for offset, length, samples, sample_rate in frames(f):
+            duration = samples / sample_rate
+            if end is not None and elapsed >= end:
+                break
+            if elapsed + duration > start:
+                if first_offset is None:
+                    first_offset, clip_start = offset, elapsed
+                elif offset != last_end:
+                    # Stop at junk between frames rather than copy it
+                    break
+                last_end, clip_end = offset + length, elapsed + duration
+            elapsed += duration
+        if first_offset is None:
+            raise ValueError(f"no audio between {start} and {end} seconds")
+        f.seek(first_offset)
+        with open(target, "wb") as out:
+            copy_stream(f, out, last_end - first_offset)
+    return {"start": round(clip_start, 3), "end": round(clip_end, 3)}
@@ -0,0 +1,511 @@
+"""Pure Python processing of MP4 files, without decoding or re-encoding.
+
+An MP4 file is a sequence of boxes. The ``moov`` box, which indexes the
+media samples, is read into memory and rewritten; the ``mdat`` box that
+holds the samples is streamed from the source file to the processed copy.
+Fragmenting moves the sample index from the ``moov`` box into a ``moof``
+box before each run of samples.
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import bisect
+import struct
+
+from sphinxcontrib_ou_media.media import copy_stream
+
+CONTAINERS = {"moov", "trak", "mdia", "minf", "stbl", "edts", "dinf", "mvex"}
+"Boxes that only hold other boxes, and are parsed into their children"
+
+SLIMMED_BOXES = {"udta", "meta", "free", "skip", "wide"}
+"Boxes dropped when slimming: user data, metadata and free space"
+
+
+class Box:
+    """An MP4 box, with its children if it is a container."""
+
+    def __init__(self, box_type: str, data: bytes = b"", children: Optional[List["Box"]] = None,
+                 offset: int = 0, size: int = 0):
+        self.type = box_type
+        self.data = data
+        "The payload of a leaf box"
+        self.children = children
+        self.offset = offset
+        "Position of the box in the source file"
+        self.size = size
+        "Size of the box in the source file"
+
+    def find(self, *path: str) -> Optional["Box"]:
+        """Return the first descendant at a path of box types, e.g. ``mdia``, ``hdlr``."""
+        box = self
+        for box_type in path:
+            box = next((child for child in box.children or [] if child.type == box_type), None)
+            if box is None:
+                return None
+        return box
+
+    def find_all(self, box_type: str) -> List["Box"]:
+        return [child for child in self.children or [] if child.type == box_type]
+
+    def to_bytes(self) -> bytes:
+        if self.children is None:
+            payload = self.data
+        else:
+            payload = b"".join(child.to_bytes() for child in self.children)
+        return box_bytes(self.type, payload)
+
+
+def box_bytes(box_type: str, payload: bytes) -> bytes:
+    size = len(payload) + 8
+    if size > 0xFFFFFFFF:
+        return struct.pack(">I4sQ", 1, box_type.encode("latin-1"), size + 8) + payload
+    return struct.pack(">I4s", size, box_type.encode("latin-1")) + payload
+
+
+def top_level_boxes(f) -> Iterator[Tuple[str, int, int, int]]:
+    """Yield the type, offset, header size and size of each top-level box."""
+    f.seek(0, 2)
+    end = f.tell()
+    offset = 0
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, box_type = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            raise ValueError(f"invalid MP4 box at {offset}")
+        yield box_type.decode("latin-1"), offset, header, size
+        offset += size
+
+
+def parse_boxes(data: bytes, offset: int = 0) -> List[Box]:
+    """Parse boxes held in memory; ``offset`` is the file position of ``data``."""
+    boxes = []
+    position = 0
+    while position + 8 <= len(data):
+        size, box_type = struct.unpack_from(">I4s", data, position)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, position + 8)[0]
+            header = 16
+        elif size == 0:
+            size = len(data) - position
+        if size < header or position + size > len(data):
+            raise ValueError(f"invalid MP4 box at {offset + position}")
+        box_type = box_type.decode("latin-1")
+        payload = data[position + header:position + size]
+        if box_type in CONTAINERS:
+            box = Box(box_type, children=parse_boxes(payload, offset + position + header))
+        else:
+            box = Box(box_type, data=payload)
+        box.offset, box.size = offset + position, size
+        boxes.append(box)
+        position += size
+    return boxes
+
+
+def read_moov(f, boxes: List[Tuple[str, int, int, int]]) -> Box:
+    for box_type, offset, header, size in boxes:
+        if box_type == "moov":
+            f.seek(offset + header)
+            moov = Box("moov", children=parse_boxes(f.read(size - header), offset + header))
+            moov.offset, moov.size = offset, size
+            return moov
+    raise ValueError("no moov box")
+
+
+def chunk_offsets(stbl: Box) -> Tuple[Optional[Box], List[int]]:
+    """Return the chunk offset box of a sample table, and its offsets."""
+    for box_type, fmt in (("stco", ">I"), ("co64", ">Q")):
+        box = stbl.find(box_type)
+        if box is not None:
+            count = struct.unpack_from(">I", box.data, 4)[0]
+            width = struct.calcsize(fmt)
+            return box, [
+                struct.unpack_from(fmt, box.data, 8 + index * width)[0] for index in range(count)
+            ]
+    return None, []
+
+
+def set_chunk_offsets(box: Box, offsets: List[int]) -> None:
+    fmt = ">I" if box.type == "stco" else ">Q"
+    box.data = box.data[:8] + b"".join(struct.pack(fmt, offset) for offset in offsets)
+
+
+def drop_boxes(box: Box, types: set) -> set:
+    """Remove boxes of the given types from a box tree, returning the types removed."""
+    removed = set()
+    kept = []
+    for child in box.children:
+        if child.type in types:
+            removed.add(child.type)
+        else:
+            if child.children is not None:
+                removed |= drop_boxes(child, types)
+            kept.append(child)
+    box.children = kept
+    return removed
+
+
+def relocate(boxes: List[Tuple[str, int, int, int]], sizes: Dict[int, int]):
+    """Return a function mapping source file positions to positions in a copy.
+
+    Args:
+        boxes: the top-level boxes of the source file
+        sizes: the new size of each box kept in the copy, by source offset
+    """
+    starts = []
+    position = 0
+    for _, offset, _, size in boxes:
+        if offset in sizes:
+            starts.append((offset, size, position))
+            position += sizes[offset]
+
+    def move(source_position: int) -> int:
+        for offset, size, new_offset in starts:
+            if offset <= source_position < offset + size:
+                return new_offset + source_position - offset
+        raise ValueError(f"chunk offset {source_position} is outside the kept boxes")
+
+    return move
+
+
+def slim_mp4(source: str, target: str) -> Optional[Dict[str, Any]]:
+    """Write a copy of an MP4 without user data, metadata or free space boxes.
+
+    The chunk offsets of each track are moved to where the samples are in
+    the copy. Fragmented MP4s are left as they are.
+
+    Returns a summary of the boxes removed, or None if nothing is removed.
+    """
+    with open(source, "rb") as f:
+        boxes = list(top_level_boxes(f))
+        types = {box_type for box_type, *_ in boxes}
+        if "moof" in types or "moov" not in types:
+            return None
+        moov = read_moov(f, boxes)
+        removed = drop_boxes(moov, SLIMMED_BOXES)
+        removed |= types & SLIMMED_BOXES
+        if not removed:
+            return None
+        # Chunk offsets are rewritten at the same width, so moov keeps its new size
+        sizes = {
+            offset: len(moov.to_bytes()) if box_type == "moov" else size
+            for box_type, offset, _, size in boxes
+            if box_type not in SLIMMED_BOXES
+        }
+        move = relocate(boxes, sizes)
+        for trak in moov.find_all("trak"):
+            stbl = trak.find("mdia", "minf", "stbl")
+            box, offsets = chunk_offsets(stbl) if stbl is not None else (None, [])
+            if box is not None:
+                set_chunk_offsets(box, [move(offset) for offset in offsets])
+        with open(target, "wb") as out:
+            for box_type, offset, header, size in boxes:
+                if box_type in SLIMMED_BOXES:
+                    continue
+                if box_type == "moov":
+                    out.write(moov.to_bytes())
+                else:
+                    f.seek(offset)
+                    copy_stream(f, out, size)
+    return {"removed": sorted(removed)}
+
+
+# Fragmented MP4
+
+SAMPLE_SYNC = 0x02000000
+"Sample flags of a sync sample (it does not depend on other samples)"
+
+SAMPLE_NON_SYNC = 0x01010000
+"Sample flags of a non-sync sample (it depends on others)"
+
+
+def table(box: Box, fmt: str) -> List[Tuple[int, ...]]:
+    """Return the entries of a sample table box (a full box with an entry count)."""
+    count = struct.unpack_from(">I", box.data, 4)[0]
+    width = struct.calcsize(fmt)
+    return list(struct.iter_unpack(fmt, box.data[8:8 + count * width]))
+
+
+class Track:
+    """The samples of a track, read from its sample tables."""
+
+    def __init__(self, trak: Box):
+        tkhd = trak.find("tkhd")
+        self.track_id = struct.unpack_from(">I", tkhd.data, 20 if tkhd.data[0] == 1 else 12)[0]
+        mdhd = trak.find("mdia", "mdhd")
+        self.timescale = struct.unpack_from(">I", mdhd.data, 20 if mdhd.data[0] == 1 else 12)[0]
+        hdlr = trak.find("mdia", "hdlr")
+        self.handler = hdlr.data[8:12].decode("latin-1") if hdlr is not None else ""
+        stbl = trak.find("mdia", "minf", "stbl")
+        if stbl is None or stbl.find("stsz") is None:
+            raise ValueError(f"track {self.track_id} has no sample sizes (stz2 is not supported)")
+        self.stbl = stbl
+
+        stsz = stbl.find("stsz")
+        sample_size, count = struct.unpack_from(">II", stsz.data, 4)
+        self.sizes = (
+            [sample_size] * count
+            if sample_size
+            else [size for (size,) in struct.iter_unpack(">I", stsz.data[12:12 + 4 * count])]
+        )
+        self.durations: List[int] = []
+        for sample_count, delta in table(stbl.find("stts"), ">II"):
+            self.durations.extend([delta] * sample_count)
+        ctts = stbl.find("ctts")
+        self.ctts_version = ctts.data[0] if ctts is not None else 0
+        self.composition_offsets: Optional[List[int]] = None
+        if ctts is not None:
+            self.composition_offsets = []
+            for sample_count, offset in table(ctts, ">Ii" if self.ctts_version else ">II"):
+                self.composition_offsets.extend([offset] * sample_count)
+        stss = stbl.find("stss")
+        self.sync = None if stss is None else {number for (number,) in table(stss, ">I")}
+        "Sync sample numbers (from 1), or None if every sample is a sync sample"
+
+        _, chunks = chunk_offsets(stbl)
+        stsc = table(stbl.find("stsc"), ">III")
+        descriptions = {description for _, _, description in stsc}
+        if len(descriptions) > 1:
+            raise ValueError(f"track {self.track_id} uses several sample descriptions")
+        self.description = descriptions.pop() if descriptions else 1
+        self.offsets: List[int] = []
+        for index, (first_chunk, per_chunk, _) in enumerate(stsc):
+            last_chunk = stsc[index + 1][0] - 1 if index + 1 < len(stsc) else len(chunks)
+            for chunk in range(first_chunk, last_chunk + 1):
+                position = chunks[chunk - 1]
+                for _ in range(per_chunk):
+                    if len(self.offsets) == count:
+                        break
+                    self.offsets.append(position)
+                    position += self.sizes[len(self.offsets) - 1]
+        if len(self.offsets) != count or len(self.durations) < count or (
+            self.composition_offsets is not None and len(self.composition_offsets) < count
+        ):
+            raise ValueError(f"track {self.track_id} has inconsistent sample tables")
+        self.decode_times = [0] * count
+        for index in range(1, count):
+            self.decode_times[index] = self.decode_times[index - 1] + self.durations[index - 1]
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+    def is_sync(self, index: int) -> bool:
+        return self.sync is None or index + 1 in self.sync
+
+    def traf(self, start: int, end: int, data_offset: int) -> bytes:
+        """Return the track fragment for samples ``start`` to ``end``."""
+        flags = 0x000001 | 0x000100 | 0x000200 | 0x000400
+        if self.composition_offsets is not None:
+            flags |= 0x000800
+        samples = []
+        for index in range(start, end):
+            sample = [
+                self.durations[index],
+                self.sizes[index],
+                SAMPLE_SYNC if self.is_sync(index) else SAMPLE_NON_SYNC,
+            ]
+            if self.composition_offsets is not None:
+                sample.append(self.composition_offsets[index])
+            samples.append(sample)
+        if self.composition_offsets is None:
+            sample_fmt = ">III"
+        else:
+            sample_fmt = ">IIIi" if self.ctts_version else ">IIII"
+        trun = full_box(
+            "trun",
+            self.ctts_version,
+            flags,
+            struct.pack(">Ii", end - start, data_offset)
+            + b"".join(struct.pack(sample_fmt, *sample) for sample in samples),
+        )
+        # Sample data offsets are relative to the start of the moof box
+        tfhd = full_box("tfhd", 0, 0x020000, struct.pack(">I", self.track_id))
+        tfdt = full_box("tfdt", 1, 0, struct.pack(">Q", self.decode_times[start]))
+        return box_bytes("traf", tfhd + tfdt + trun)
+
+
+def full_box(box_type: str, version: int, flags: int, payload: bytes) -> bytes:
+    return box_bytes(box_type, struct.pack(">I", (version << 24) | flags) + payload)
+
+
+def fragment_bounds(reference: Track, tracks: List[Track], duration: float) -> List[List[int]]:
+    """Split each track's samples into fragments of about ``duration`` seconds.
+
+    Fragments start at sync samples of the reference track; the samples of
+    the other tracks go in the fragment covering their decode time.
+
+    Returns the index of the first sample of each fragment, for each track.
+    """
+    target = int(duration * reference.timescale)
+    starts = [0]
+    for index in range(1, len(reference)):
+        if reference.is_sync(index) and (
+            reference.decode_times[index] - reference.decode_times[starts[-1]] >= target
+        ):
+            starts.append(index)
+    times = [reference.decode_times[index] for index in starts]
+    bounds = []
+    for track in tracks:
+        if track is reference:
+            bounds.append(starts)
+            continue
+        # The first sample at or after each fragment start, in the track's timescale
+        track_times = [
+            -(-time * track.timescale // reference.timescale) for time in times
+        ]
+        bounds.append([bisect.bisect_left(track.decode_times, time) for time in track_times])
+        bounds[-1][0] = 0
+    return bounds
+
+
+def fragment_moov(moov: Box, tracks: List[Track]) -> bytes:
+    """Return the moov box of the fragmented file: sample tables empty, with mvex."""
+    drop_boxes(moov, SLIMMED_BOXES)
+    for track in tracks:
+        track.stbl.children = [child for child in track.stbl.children if child.type == "stsd"] + [
+            Box("stts", data=struct.pack(">II", 0, 0)),
+            Box("stsc", data=struct.pack(">II", 0, 0)),
+            Box("stsz", data=struct.pack(">III", 0, 0, 0)),
+            Box("stco", data=struct.pack(">II", 0, 0)),
+        ]
+    mvhd = moov.find("mvhd")
+    if mvhd.data[0] == 1:
+        duration = struct.unpack_from(">Q", mvhd.data, 24)[0]
+    else:
+        duration = struct.unpack_from(">I", mvhd.data, 16)[0]
+    mvex = full_box("mehd", 1, 0, struct.pack(">Q", duration)) + b"".join(
+        full_box("trex", 0, 0, struct.pack(">IIIII", track.track_id, track.description, 0, 0, 0))
+        for track in tracks
+    )
+    moov.children = [child for child in moov.children if child.type != "mvex"]
+    return box_bytes("moov", b"".join(child.to_bytes() for child in moov.children)
+                     + box_bytes("mvex", mvex))
+
+
+def fragment_mp4(source: str, target: str, duration: float = 2.0) -> Optional[Dict[str, Any]]:
+    """Remux an MP4 as a fragmented MP4, without re-encoding.
+
+    The samples are moved into ``moof``/``mdat`` fragments of about
+    ``duration`` seconds, each starting at a sync sample, indexed by a
+    ``sidx`` box, so players can start playing after reading a small
+    ``moov`` box and seek with byte-range requests. User data, metadata and
+    free space boxes are not copied. Files that are already fragmented are
+    left as they are.
+
+    Returns the number of fragments written.
+    """
+    with open(source, "rb") as f:
+        boxes = list(top_level_boxes(f))
+        types = {box_type for box_type, *_ in boxes}
+        if "moof" in types or "moov" not in types:
+            return None
+        brands = []
+        for box_type, offset, header, size in boxes:
+            if box_type == "ftyp":
+                f.seek(offset + header)
+                payload = f.read(size - header)
+                # The major brand and the compatible brands, without the minor version
+                brands = [payload[:4]] + [payload[i:i + 4] for i in range(8, len(payload), 4)]
+        moov = read_moov(f, boxes)
+        all_tracks = [Track(trak) for trak in moov.find_all("trak")]
+        tracks = [track for track in all_tracks if len(track)]
+        if not tracks:
+            return None
+        reference = next((track for track in tracks if track.handler == "vide"), tracks[0])
+        bounds = fragment_bounds(reference, tracks, duration)
+        count = len(bounds[0])
+
+        # Build the moof boxes first, as the sidx gives each fragment's size
+        fragments = []
+        for number in range(count):
+            ranges = [
+                (track, bound[number], bound[number + 1] if number + 1 < count else len(track))
+                for track, bound in zip(tracks, bounds)
+            ]
+            ranges = [(track, start, end) for track, start, end in ranges if end > start]
+            data_size = sum(sum(track.sizes[start:end]) for track, start, end in ranges)
+            mdat_header = 8 if data_size + 8 <= 0xFFFFFFFF else 16
+
+            def moof(moof_size: int) -> bytes:
+                trafs = []
+                data_offset = moof_size + mdat_header
+                for track, start, end in ranges:
+                    trafs.append(track.traf(start, end, data_offset))
+                    data_offset += sum(track.sizes[start:end])
+                return box_bytes(
+                    "moof", full_box("mfhd", 0, 0, struct.pack(">I", number + 1)) + b"".join(trafs)
+                )
+
+            moof_bytes = moof(len(moof(0)))
+            fragments.append((moof_bytes, data_size, mdat_header, ranges))
+
+        starts = bounds[tracks.index(reference)]
+        references = []
+        for number, (moof_bytes, data_size, mdat_header, ranges) in enumerate(fragments):
+            start = starts[number]
+            end = starts[number + 1] if number + 1 < count else len(reference)
+            subsegment_duration = (
+                reference.decode_times[end - 1] + reference.durations[end - 1]
+                - reference.decode_times[start]
+            )
+            references.append(
+                struct.pack(
+                    ">III",
+                    len(moof_bytes) + mdat_header + data_size,
+                    subsegment_duration,
+                    # Starts with a type 1 stream access point
+                    (1 << 31) | (1 << 28) if reference.is_sync(start) else 0,
+                )
+            )
+        first = starts[1] if count > 1 else len(reference)
+        # Earliest presentation time of the first fragment
+        earliest = min(
+            reference.decode_times[index]
+            + (reference.composition_offsets[index] if reference.composition_offsets else 0)
+            for index in range(first)
+        )
+        sidx = full_box(
+            "sidx",
+            1,
+            0,
+            struct.pack(">IIQQHH", reference.track_id, reference.timescale, max(earliest, 0), 0,
+                        0, count)
+            + b"".join(references),
+        )
+
+        compatible = [b"iso6", b"iso5", b"mp41"]
+        compatible += [brand for brand in brands if brand not in compatible]
+        with open(target, "wb") as out:
+            out.write(box_bytes("ftyp", b"iso6" + struct.pack(">I", 0) + b"".join(compatible)))
+            out.write(fragment_moov(moov, all_tracks))
+            out.write(sidx)
+            for moof_bytes, data_size, mdat_header, ranges in fragments:
+                out.write(moof_bytes)
+                if mdat_header == 16:
+                    out.write(struct.pack(">I4sQ", 1, b"mdat", data_size + 16))
+                else:
+                    out.write(struct.pack(">I4s", data_size + 8, b"mdat"))
+                for track, start, end in ranges:
+                    # Copy runs of samples that are next to each other in one go
+                    index = start
+                    while index < end:
+                        run_end = index + 1
+                        while (
+                            run_end < end
+                            and track.offsets[run_end]
+                            == track.offsets[run_end - 1] + track.sizes[run_end - 1]
+                        ):
+                            run_end += 1
+                        f.seek(track.offsets[index])
+                        copy_stream(
+                            f, out, track.offsets[run_end - 1] + track.sizes[run_end - 1]
+                            - track.offsets[index]
+                        )
+                        index = run_end
+    return {"fragments": count, "duration": duration}
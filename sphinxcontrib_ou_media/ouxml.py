@@ -0,0 +1,1458 @@
+"""Sphinx builder that writes OU-XML directly from the doctrees.
+
+The ``ouxml`` builder translates each document straight into an OU-XML
+``Session`` (or ``Section``) fragment with a streaming writer, so there is
+no intermediate Sphinx XML to write and re-parse. Fragments are only
+rewritten for documents that changed. Once the documents are written, the
+fragments are streamed into one OU-XML ``Item`` file per part of the book,
+adding the front and back matter, and the session, figure and table
+numbers, which depend on the position of each document in the book.
+
+Settings are taken from the ``ou`` config value, or from the ``ou`` block of
+a Jupyter Book ``_config.yml`` file, as used by the ``ouseful_obt`` tool.
+Images and media used by the documents are copied to the output directory
+with OU-XML friendly names, and referenced using the ``image_path_prefix``
+and ``media_path_prefix`` settings.
+"""
+
+from datetime import datetime, timezone
+from os import path
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set
+from urllib.parse import urljoin, urlparse
+from xml.sax.saxutils import escape, quoteattr
+
+import bisect
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import zipfile
+
+from docutils import nodes
+from sphinx import addnodes
+from sphinx.application import Sphinx
+from sphinx.builders import Builder
+from sphinx.environment import BuildEnvironment
+from sphinx.util import logging
+from sphinx.util.build_phase import BuildPhase
+from sphinx.util.docutils import SphinxTranslator
+from sphinx.util.parallel import SerialTasks
+
+from sphinxcontrib_ou_media import manifest
+from sphinxcontrib_ou_media.utils import cached_template, is_draft
+from sphinxcontrib_ou_media.validate import FragmentValidator, default_schema
+
+logger = logging.getLogger(__name__)
+
+FRAGMENT_DIR = "_fragments"
+"Output subdirectory that the per-document fragments are written to"
+
+FRAGMENT_VERSION = 2
+"Version of the fragment and sidecar format; changing it rewrites every fragment"
+
+CODESNIPPET_WIDGET = "https://openuniv.sharepoint.com/sites/modules%E2%80%93shared/imd/widgets/CL/codesnippet/cl_codesnippet_v1.0.zip"  # noqa: E501
+"The OU codesnippet HTML package"
+
+SHINYLITE_WIDGET = "https://github.com/innovationOUtside/sphinxcontrib-ou-xml-tags/raw/main/dist/shinylite-py-01.zip"  # noqa: E501
+"The shinylite-py HTML package used by the Xshinylite-py codestyle type"
+
+DEFAULT_SETTINGS: Dict[str, Any] = {
+    "module_code": "MODULE",
+    "module_title": "",
+    "block": 1,
+    "presentation": "X",
+    "first_published": "",
+    "isbn": "",
+    "edition": "",
+    "block_title": "",
+    "image_path_prefix": "",
+    "media_path_prefix": "",
+    "codestyle": False,
+    "codesnippet_theme": "light",
+    "caption_as_title": False,
+    "numbering_from": 1,
+}
+"Defaults for the ``ou`` settings"
+
+NUMBER_MARKER = re.compile(r"<\?ou-number (\w+)\?>")
+"Marker for a number that is filled in when the fragments are assembled"
+
+# Docutils nodes that map to a single OU-XML element
+SIMPLE_TAGS: Dict[str, str] = {
+    "emphasis": "i",
+    "strong": "b",
+    "superscript": "sup",
+    "subscript": "sub",
+    "figure": "Figure",
+    "legend": "Description",
+    "row": "tr",
+    "topic": "Box",
+    "sidebar": "Box",
+}
+
+# Docutils nodes whose content is written without a wrapping element
+PASS_THROUGH: Set[str] = {
+    "number_reference",
+    "glossary",
+    "definition_list",
+    "tgroup",
+    "line_block",
+    "problematic",
+}
+
+# Docutils nodes that are left out of OU-XML
+SKIPPED: Set[str] = {
+    "target",
+    "index",
+    "comment",
+    "substitution_definition",
+    "system_message",
+    "colspec",
+    "label",
+    "meta",
+    "toctree",
+    "only",
+    "docinfo",
+    "ou_interaction_choices",
+}
+
+ADMONITIONS: Set[str] = {
+    "attention",
+    "caution",
+    "danger",
+    "error",
+    "hint",
+    "important",
+    "note",
+    "seealso",
+    "tip",
+    "warning",
+}
+
+# Activity components, by sphinx_design component name
+COMPONENT_TAGS: Dict[str, str] = {
+    "ou-activity": "Activity",
+    "ou-exercise": "Exercise",
+    "ou-answer": "Answer",
+    "ou-activity-answer": "Answer",
+    "ou-discussion": "Discussion",
+    "ou-question": "Question",
+}
+COMPONENT_TEXT_TAGS: Dict[str, str] = {
+    "ou-title": "Heading",
+    "ou-activity-title": "Heading",
+    "ou-time": "Timing",
+}
+ACTIVITY_STRUCTURE: Set[str] = {
+    "ou-title",
+    "ou-activity-title",
+    "ou-time",
+    "ou-answer",
+    "ou-activity-answer",
+    "ou-discussion",
+    "ou-interaction",
+    "ou-question",
+}
+"Activity components that are not wrapped in the activity Question"
+
+
+def ou_settings(config, srcdir: str) -> Dict[str, Any]:
+    """Return the ``ou`` settings.
+
+    Uses the ``ou`` config value if it is set, otherwise the ``ou`` block of
+    a Jupyter Book ``_config.yml`` file in the source directory.
+    """
+    settings = dict(config.ou)
+    if not settings:
+        config_yml = Path(srcdir, "_config.yml")
+        if config_yml.exists():
+            try:
+                import yaml
+
+                with open(config_yml, encoding="utf-8") as f:
+                    settings = (yaml.safe_load(f) or {}).get("ou") or {}
+            except ImportError:
+                logger.warning("ouxml: reading _config.yml needs the pyyaml package")
+    missing = [k for k in ("module_code", "block", "presentation") if k not in settings]
+    if missing:
+        logger.warning(f"ouxml: no ou setting for {', '.join(missing)}; using defaults")
+    # Unset values in _config.yml are None
+    settings = {k: v for k, v in settings.items() if v is not None}
+    return {**DEFAULT_SETTINGS, **settings}
+
+
+class XMLStream:
+    """Write XML to a file as it is generated."""
+
+    def __init__(self, out):
+        self.out = out
+        self.line = 1
+        "The line being written"
+
+    def write(self, text: str) -> None:
+        self.line += text.count("\n")
+        self.out.write(text)
+
+    def start(self, tag: str, attrs: Optional[Dict[str, Any]] = None, block=True):
+        """Write a start tag; block elements start on a new line."""
+        attributes = "".join(
+            f" {k}={quoteattr(str(v))}" for k, v in (attrs or {}).items()
+        )
+        self.write(f"{chr(10) if block else ''}<{tag}{attributes}>")
+
+    def end(self, tag: str, block=False) -> None:
+        self.write(f"{chr(10) if block else ''}</{tag}>")
+
+    def empty(self, tag: str, attrs: Optional[Dict[str, Any]] = None, block=True):
+        attributes = "".join(
+            f" {k}={quoteattr(str(v))}" for k, v in (attrs or {}).items()
+        )
+        self.write(f"{chr(10) if block else ''}<{tag}{attributes}/>")
+
+    def text(self, text: str) -> None:
+        self.write(escape(text))
+
+    def element(self, tag: str, text: str, attrs=None, block=True) -> None:
+        """Write an element that only holds text."""
+        self.start(tag, attrs, block)
+        self.text(text)
+        self.end(tag)
+
+    def number(self, kind: str) -> None:
+        """Write a marker for a number filled in on assembly."""
+        self.write(f"<?ou-number {kind}?>")
+
+
+def normalize_space(text: str) -> str:
+    return " ".join(text.split())
+
+
+class OUXMLTranslator(SphinxTranslator):
+    """Translate a document to an OU-XML fragment."""
+
+    def __init__(self, document, builder: "OUXMLBuilder", stream: XMLStream,
+                 docname: str):
+        super().__init__(document, builder)
+        self.out = stream
+        self.docname = docname
+        self.role = builder.doc_roles[docname]
+        self.item = builder.items[self.role["item"]]
+        self.settings = builder.settings
+        self.glossary: List[Dict[str, str]] = []
+        "Glossary items, which are moved to the back matter"
+        self.context: List[Any] = []
+        "Tags to close on departure"
+        self.root_section: Optional[nodes.section] = None
+        self.list_depth = 0
+        self.in_thead = False
+        self.tbody_open = False
+        self.media_count = 0
+        self.lines: List[List[Any]] = []
+        "Fragment line, source and source line of each node with a line"
+
+    def media_id(self) -> str:
+        """Return a stable id for a MediaContent element in this document."""
+        self.media_count += 1
+        digest = hashlib.sha1(f"{self.docname}:{self.media_count}".encode())
+        return f"m{digest.hexdigest()[:19]}"
+
+    # Generic handling
+
+    def dispatch_visit(self, node: nodes.Node) -> None:
+        if isinstance(node, nodes.Element) and node.line:
+            # Block elements start on the next line
+            self.lines.append([self.out.line + 1, node.source or "", node.line])
+        super().dispatch_visit(node)
+
+    def unknown_visit(self, node: nodes.Node) -> None:
+        name = node.__class__.__name__
+        if name in SIMPLE_TAGS:
+            self.out.start(SIMPLE_TAGS[name], block=False)
+        elif name in PASS_THROUGH:
+            pass
+        elif name in SKIPPED:
+            raise nodes.SkipNode
+        else:
+            logger.warning(
+                f"ouxml: {name} nodes are not supported", location=node, type="ouxml"
+            )
+            self.out.element("UnknownTag", name)
+            raise nodes.SkipNode
+
+    def unknown_departure(self, node: nodes.Node) -> None:
+        name = node.__class__.__name__
+        if name in SIMPLE_TAGS:
+            self.out.end(SIMPLE_TAGS[name])
+
+    def visit_Text(self, node: nodes.Text) -> None:
+        text = node.astext()
+        if "$PART_TITLE" in text:
+            text = text.replace("$PART_TITLE", self.item["part_title"])
+        self.out.text(text)
+
+    def depart_Text(self, node: nodes.Text) -> None:
+        pass
+
+    def visit_document(self, node: nodes.document) -> None:
+        pass
+
+    def depart_document(self, node: nodes.document) -> None:
+        pass
+
+    # Structure
+
+    def visit_section(self, node: nodes.section) -> None:
+        attrs = {"id": node["ids"][0]} if node["ids"] else {}
+        if self.root_section is None:
+            self.root_section = node
+            self.out.start(self.role["tag"], attrs)
+            self.context.append(self.role["tag"])
+        else:
+            self.out.start("InternalSection", attrs)
+            self.context.append("InternalSection")
+
+    def depart_section(self, node: nodes.section) -> None:
+        # The root element closes on its own line, so that assembly can
+        # insert sub-sections before it
+        self.out.end(self.context.pop(), block=node is self.root_section)
+
+    def visit_title(self, node: nodes.title) -> None:
+        parent = node.parent
+        if parent is self.root_section:
+            self.out.start("Title")
+            if self.role["tag"] == "Session":
+                self.out.number("session")
+                overwrite = self.settings.get("overwrite") or {}
+                if self.role["first"] and overwrite.get("introduction_title"):
+                    self.out.text(overwrite["introduction_title"])
+                    self.out.end("Title")
+                    raise nodes.SkipNode
+            else:
+                self.out.number("section")
+            self.context.append("Title")
+        elif isinstance(parent, nodes.table):
+            self.out.start("TableHead")
+            self.out.number("table")
+            self.context.append("TableHead")
+        else:
+            self.out.element("Heading", normalize_space(node.astext()))
+            raise nodes.SkipNode
+
+    def depart_title(self, node: nodes.title) -> None:
+        self.out.end(self.context.pop())
+
+    def visit_paragraph(self, node: nodes.paragraph) -> None:
+        text = node.astext()
+        if (
+            len(node) == 1
+            and isinstance(node[0], nodes.Text)
+            and len(text) > 4
+            and text.startswith("$$")
+            and text.endswith("$$")
+        ):
+            self.out.start("Equation")
+            self.out.element("TeX", text.strip("$"), block=False)
+            self.out.end("Equation")
+            raise nodes.SkipNode
+        # Images are written as figures, so drop the paragraph around them
+        if any(isinstance(child, nodes.image) for child in node.children) or (
+            isinstance(node.parent, nodes.citation)
+        ):
+            self.context.append(None)
+        else:
+            self.out.start("Paragraph")
+            self.context.append("Paragraph")
+
+    def depart_paragraph(self, node: nodes.paragraph) -> None:
+        tag = self.context.pop()
+        if tag:
+            self.out.end(tag)
+
+    def visit_block_quote(self, node: nodes.block_quote) -> None:
+        self.out.start("Quote")
+        paragraphs = [child for child in node.children if isinstance(child, nodes.paragraph)]
+        source = paragraphs[-1] if paragraphs else None
+        for child in node.children:
+            if child is source and normalize_space(child.astext()).startswith("Source:"):
+                self.out.element(
+                    "SourceReference",
+                    normalize_space(child.astext())[len("Source:"):].strip(),
+                )
+            else:
+                child.walkabout(self)
+        self.out.end("Quote")
+        raise nodes.SkipNode
+
+    def visit_attribution(self, node: nodes.attribution) -> None:
+        self.out.element("SourceReference", normalize_space(node.astext()))
+        raise nodes.SkipNode
+
+    def visit_admonition(self, node: nodes.Element) -> None:
+        self.out.start("Box")
+        name = node.__class__.__name__
+        if name in ADMONITIONS:
+            self.out.element("Heading", name.capitalize())
+
+    def depart_admonition(self, node: nodes.Element) -> None:
+        self.out.end("Box")
+
+    # Lists
+
+    def visit_bullet_list(self, node: nodes.Element) -> None:
+        kind = "Numbered" if isinstance(node, nodes.enumerated_list) else "Bulleted"
+        tag = f"{kind}SubsidiaryList" if self.list_depth else f"{kind}List"
+        self.list_depth += 1
+        self.out.start(tag)
+        self.context.append(tag)
+
+    def depart_bullet_list(self, node: nodes.Element) -> None:
+        self.list_depth -= 1
+        self.out.end(self.context.pop())
+
+    visit_enumerated_list = visit_bullet_list
+    depart_enumerated_list = depart_bullet_list
+
+    def visit_list_item(self, node: nodes.list_item) -> None:
+        tag = "SubListItem" if self.list_depth > 1 else "ListItem"
+        self.out.start(tag)
+        self.context.append(tag)
+
+    def depart_list_item(self, node: nodes.list_item) -> None:
+        self.out.end(self.context.pop())
+
+    def visit_definition_list_item(self, node: nodes.definition_list_item) -> None:
+        term = node.next_node(nodes.term)
+        definition = node.next_node(nodes.definition)
+        self.glossary.append(
+            {
+                "term": term.astext() if term else "",
+                "definition": definition.astext() if definition else "",
+            }
+        )
+        raise nodes.SkipNode
+
+    # Code
+
+    def visit_literal(self, node: nodes.literal) -> None:
+        self.out.element("ComputerCode", node.astext(), block=False)
+        raise nodes.SkipNode
+
+    def visit_inline(self, node: nodes.inline) -> None:
+        if {"guilabel", "menuselection"} & set(node.get("classes", [])):
+            self.out.start("ComputerUI", block=False)
+            self.context.append("ComputerUI")
+        else:
+            self.context.append(None)
+
+    def depart_inline(self, node: nodes.inline) -> None:
+        tag = self.context.pop()
+        if tag:
+            self.out.end(tag)
+
+    def visit_literal_block(self, node: nodes.literal_block) -> None:
+        language = node.get("language", "")
+        code = node.astext()
+        if self.settings.get("codestyle") and language.lower() in (
+            "python",
+            "ipython",
+            "ipython3",
+        ):
+            self.codesnippet(code, "python", "100", "*")
+            raise nodes.SkipNode
+        lines = code.split("\n")
+        if lines and not lines[-1].strip():
+            lines = lines[:-1]
+        self.out.start("ProgramListing")
+        if language.lower() in ("python", "ipython3", "xml", "text"):
+            self.out.start("Paragraph")
+            for i, line in enumerate(lines):
+                if i:
+                    self.out.empty("br", block=False)
+                self.out.text(line)
+            self.out.end("Paragraph")
+        else:
+            for line in lines:
+                self.out.element("Paragraph", line)
+        self.out.end("ProgramListing")
+        raise nodes.SkipNode
+
+    def visit_doctest_block(self, node: nodes.doctest_block) -> None:
+        self.visit_literal_block(node)
+
+    def codesnippet(self, code: str, codetype: str, height: str, width: str,
+                    theme: Optional[str] = None) -> None:
+        """Write a codesnippet widget with the code as an attachment."""
+        filename = self.builder.write_media_text(self.item, "code", code, ".txt")
+        self.out.start(
+            "MediaContent",
+            {
+                "type": "html5",
+                "src": CODESNIPPET_WIDGET,
+                "height": height,
+                "width": width,
+                "id": self.media_id(),
+            },
+        )
+        self.out.start("Parameters")
+        self.out.empty("Parameter", {"name": "codetype", "value": codetype})
+        self.out.empty(
+            "Parameter",
+            {"name": "theme", "value": theme or self.settings["codesnippet_theme"]},
+        )
+        self.out.end("Parameters")
+        self.out.start("Attachments")
+        self.out.empty("Attachment", {"name": "codesnippet", "src": filename})
+        self.out.end("Attachments")
+        self.out.end("MediaContent")
+
+    # Maths
+
+    def visit_math(self, node: nodes.math) -> None:
+        self.out.start("InlineEquation", block=False)
+        self.out.element("TeX", node.astext(), block=False)
+        self.out.end("InlineEquation")
+        raise nodes.SkipNode
+
+    def visit_math_block(self, node: nodes.math_block) -> None:
+        self.out.start("Equation", {"id": node["label"]} if node.get("label") else {})
+        self.out.element("TeX", node.astext(), block=False)
+        self.out.end("Equation")
+        raise nodes.SkipNode
+
+    # References
+
+    def visit_reference(self, node: nodes.reference) -> None:
+        if "refid" in node:
+            self.out.start("CrossRef", {"idref": node["refid"]}, block=False)
+            self.context.append("CrossRef")
+        elif node.get("internal") and "refuri" in node:
+            docname, _, anchor = node["refuri"].partition("#")
+            docname = docname or self.docname
+            target = self.builder.doc_roles.get(docname)
+            if target is not None and target["item"] == self.role["item"]:
+                idref = anchor or nodes.make_id(self.builder.doc_title(docname))
+                self.out.start("CrossRef", {"idref": idref}, block=False)
+                self.context.append("CrossRef")
+            else:
+                targetdoc = (
+                    self.builder.items[target["item"]]["title"]
+                    if target is not None
+                    else docname
+                )
+                self.out.start(
+                    "olink", {"targetdoc": targetdoc, "targetptr": anchor}, block=False
+                )
+                self.context.append("olink")
+        elif "refuri" in node:
+            self.out.start("a", {"href": node["refuri"]}, block=False)
+            self.context.append("a")
+        else:
+            self.context.append(None)
+
+    def depart_reference(self, node: nodes.reference) -> None:
+        tag = self.context.pop()
+        if tag:
+            self.out.end(tag)
+
+    def visit_compound(self, node: nodes.compound) -> None:
+        if "toctree-wrapper" in node.get("classes", []):
+            raise nodes.SkipNode
+
+    def depart_compound(self, node: nodes.compound) -> None:
+        pass
+
+    def visit_citation(self, node: nodes.citation) -> None:
+        self.out.start("Reference")
+
+    def depart_citation(self, node: nodes.citation) -> None:
+        self.out.end("Reference")
+
+    # Figures
+
+    def visit_image(self, node: nodes.image) -> None:
+        src = self.builder.publish_image(self.item, node["uri"])
+        in_figure = isinstance(node.parent, nodes.figure)
+        if not in_figure:
+            self.out.start("Figure")
+        self.out.empty("Image", {"src": src})
+        if not in_figure:
+            self.out.end("Figure")
+        raise nodes.SkipNode
+
+    def visit_caption(self, node: nodes.caption) -> None:
+        self.out.start("Caption")
+        self.out.number("figure")
+
+    def depart_caption(self, node: nodes.caption) -> None:
+        self.out.end("Caption")
+
+    def visit_mermaid(self, node: nodes.Element) -> None:
+        src = self.builder.render_mermaid(self.item, node["code"])
+        if src is not None:
+            self.out.start("Figure")
+            self.out.empty("Image", {"src": src})
+            self.out.end("Figure")
+        raise nodes.SkipNode
+
+    # Tables
+
+    def visit_table(self, node: nodes.table) -> None:
+        self.out.start("Table")
+        if not isinstance(node.children[0], nodes.title):
+            self.out.start("TableHead")
+            self.out.number("table")
+            self.out.end("TableHead")
+
+    def depart_table(self, node: nodes.table) -> None:
+        if self.tbody_open:
+            self.out.end("tbody")
+            self.tbody_open = False
+        self.out.end("Table")
+
+    def visit_thead(self, node: nodes.thead) -> None:
+        # Header rows are moved into the body, with th cells
+        self.out.start("tbody")
+        self.tbody_open = True
+        self.in_thead = True
+
+    def depart_thead(self, node: nodes.thead) -> None:
+        self.in_thead = False
+
+    def visit_tbody(self, node: nodes.tbody) -> None:
+        if not self.tbody_open:
+            self.out.start("tbody")
+            self.tbody_open = True
+
+    def depart_tbody(self, node: nodes.tbody) -> None:
+        self.out.end("tbody")
+        self.tbody_open = False
+
+    def visit_entry(self, node: nodes.entry) -> None:
+        if self.in_thead:
+            self.out.start("th", {"class": "ColumnHeadLeft"})
+            self.context.append("th")
+        else:
+            self.out.start("td")
+            self.context.append("td")
+
+    def depart_entry(self, node: nodes.entry) -> None:
+        self.out.end(self.context.pop())
+
+    # Activities
+
+    def visit_container(self, node: nodes.container) -> None:
+        component = node.get("design_component")
+        if component in ("ou-activity", "ou-exercise"):
+            self.wrap_question(node)
+        if component in COMPONENT_TAGS:
+            tag = COMPONENT_TAGS[component]
+            self.out.start(tag)
+            self.context.append(tag)
+        elif component in COMPONENT_TEXT_TAGS:
+            self.out.element(
+                COMPONENT_TEXT_TAGS[component], normalize_space(node.astext())
+            )
+            raise nodes.SkipNode
+        elif component in ("Right", "Wrong"):
+            self.out.start(component)
+            self.out.element(
+                "Paragraph",
+                "".join(c.astext() for c in node.children if isinstance(c, nodes.Text)),
+            )
+            for child in node.children:
+                if not isinstance(child, nodes.Text):
+                    child.walkabout(self)
+            self.out.end(component)
+            raise nodes.SkipNode
+        elif component == "Feedback":
+            self.out.start("Feedback")
+            self.out.start("Paragraph", block=False)
+            self.context.append(("Paragraph", "Feedback"))
+        elif component == "ou-interaction":
+            self.visit_interaction(node)
+        elif component == "ou-where-next":
+            self.out.start("Box")
+            self.out.element("Heading", "Now go to ...")
+            self.context.append("Box")
+        else:
+            self.context.append(None)
+
+    def depart_container(self, node: nodes.container) -> None:
+        tags = self.context.pop()
+        for tag in (tags,) if isinstance(tags, str) else tags or ():
+            self.out.end(tag)
+
+    @staticmethod
+    def wrap_question(node: nodes.container) -> None:
+        """Move the body of an activity into a Question component."""
+        content = [
+            child
+            for child in node.children
+            if not (
+                isinstance(child, nodes.container)
+                and child.get("design_component") in ACTIVITY_STRUCTURE
+            )
+        ]
+        if not content:
+            return
+        index = node.index(content[0])
+        question = nodes.container(design_component="ou-question")
+        for child in content:
+            node.remove(child)
+            question += child
+        node.insert(index, question)
+
+    def visit_interaction(self, node: nodes.container) -> None:
+        self.out.start("Interaction")
+        typ = node.get("type")
+        if typ == "freeresponse":
+            self.out.empty(
+                "FreeResponse", {"id": node.get("id", ""), "size": node.get("size", "")}
+            )
+            self.out.end("Interaction")
+            raise nodes.SkipNode
+        tag = {"multiple": "MultipleChoice", "single": "SingleChoice"}.get(typ)
+        if tag:
+            self.out.start(tag)
+            self.context.append((tag, "Interaction"))
+        else:
+            self.context.append("Interaction")
+
+    # ou media directives
+
+    def media_content(self, node: nodes.Element, attrs: Dict[str, Any],
+                      repair=False) -> None:
+        """Write a MediaContent element, with any caption or description."""
+        attrs = {k: v for k, v in attrs.items() if v not in ("", None)}
+        if repair:
+            # The VLE expects html5 packages to have an id and a size
+            attrs.setdefault("height", "400")
+            attrs.setdefault("width", "600")
+            attrs.setdefault("id", self.media_id())
+        self.out.start("MediaContent", attrs)
+        self.context.append("MediaContent")
+
+    def depart_media_content(self, node: nodes.Element) -> None:
+        self.out.end(self.context.pop())
+
+    def visit_ou_audio(self, node: nodes.Element) -> None:
+        src = self.builder.publish_media(self.item, node["sources"][0][0], node["sources"][0][2])
+        self.media_content(node, {"type": "audio", "src": src})
+
+    def visit_ou_video(self, node: nodes.Element) -> None:
+        src = self.builder.publish_media(self.item, node["sources"][0][0], node["sources"][0][2])
+        self.media_content(
+            node,
+            {
+                "type": "video",
+                "src": src,
+                "height": node.get("height"),
+                "width": node.get("width"),
+            },
+        )
+
+    def visit_ou_html5(self, node: nodes.Element) -> None:
+        src = self.builder.publish_package(
+            self.item, node["src"], node.get("keep") == "always"
+        )
+        self.media_content(
+            node,
+            {
+                "type": "html5",
+                "src": src,
+                "height": node.get("height"),
+                "width": node.get("width"),
+            },
+            repair=True,
+        )
+
+    visit_ou_mol3d = visit_ou_html5
+
+    def visit_ou_codestyle(self, node: nodes.Element) -> None:
+        keep = node.get("keep") == "always"
+        if node.get("codesnippet"):
+            code = Path(self.builder.local_path(node["src"])).read_text(encoding="utf-8")
+            self.codesnippet(
+                code,
+                node.get("codetype", ""),
+                node.get("height") or "400",
+                node.get("width") or "600",
+                node.get("theme"),
+            )
+            raise nodes.SkipNode
+        if node.get("interactivetype") == "Xshinylite-py":
+            filename = self.builder.publish_file(
+                self.item, "html", self.builder.local_path(node["src"]), keep
+            )
+            self.media_content(
+                node,
+                {
+                    "type": "html5",
+                    "src": SHINYLITE_WIDGET,
+                    "height": node.get("height"),
+                    "width": node.get("width"),
+                },
+                repair=True,
+            )
+            self.out.start("Attachments")
+            self.out.empty("Attachment", {"name": "codesnippet", "src": filename})
+            self.out.end("Attachments")
+            return
+        self.visit_ou_html5(node)
+
+    depart_ou_audio = depart_media_content
+    depart_ou_video = depart_media_content
+    depart_ou_html5 = depart_media_content
+    depart_ou_mol3d = depart_media_content
+    depart_ou_codestyle = depart_media_content
+
+    def visit_raw(self, node: nodes.raw) -> None:
+        if "html" in node.get("format", "").split():
+            src = self.builder.write_media_zip(self.item, node.astext())
+            self.media_content(node, {"type": "html5", "src": src}, repair=True)
+            self.depart_media_content(node)
+        raise nodes.SkipNode
+
+    def visit_youtube(self, node: nodes.Element) -> None:
+        self.out.empty(
+            "MediaContent",
+            {"type": "oembed", "src": f"{node.get('platform_url', '')}{node['id']}"},
+        )
+        raise nodes.SkipNode
+
+    visit_vimeo = visit_youtube
+
+
+for _name in ADMONITIONS:
+    setattr(OUXMLTranslator, f"visit_{_name}", OUXMLTranslator.visit_admonition)
+    setattr(OUXMLTranslator, f"depart_{_name}", OUXMLTranslator.depart_admonition)
+
+
+class OUXMLBuilder(Builder):
+    """Write OU-XML Items straight from the doctrees."""
+
+    name = "ouxml"
+    format = "ouxml"
+    epilog = "The OU-XML files are in %(outdir)s."
+    out_suffix = ".xml"
+    allow_parallel = True
+    default_translator_class = OUXMLTranslator
+    supported_image_types = ["image/svg+xml", "image/png", "image/gif", "image/jpeg"]
+    supported_remote_images = True
+
+    def init(self) -> None:
+        self.settings: Dict[str, Any] = {}
+        self.items: List[Dict[str, Any]] = []
+        "The Items to write, in order"
+        self.doc_roles: Dict[str, Dict[str, Any]] = {}
+        "Item index, root element and first-session flag, by docname"
+        self.signature = ""
+        self.validator: Optional[FragmentValidator] = None
+        self.main_pid = os.getpid()
+        self.published: Dict[str, Dict[str, str]] = {}
+        "Files published by the document being written, by output file name"
+
+    @property
+    def fragment_dir(self) -> str:
+        return path.join(self.outdir, FRAGMENT_DIR)
+
+    def fragment_path(self, docname: str, suffix=".xml") -> str:
+        return path.join(self.fragment_dir, docname + suffix)
+
+    # Book structure
+
+    def doc_title(self, docname: str) -> str:
+        title = self.env.titles.get(docname)
+        return title.astext() if title is not None else docname
+
+    def init_structure(self) -> None:
+        """Work out the Items and the role of each document in them.
+
+        Each captioned toctree in the root document is a part, written to
+        its own Item; otherwise all the documents go in a single Item. The
+        documents a chapter includes in its own toctree are its sections.
+        """
+        self.settings = ou_settings(self.config, self.srcdir)
+        settings = self.settings
+        env = self.env
+        toctrees = list(
+            env.get_doctree(self.config.root_doc).findall(addnodes.toctree)
+        )
+        parts = [
+            (toctree.get("caption"), [doc for _, doc in toctree["entries"] if doc in env.all_docs])
+            for toctree in toctrees
+        ]
+        has_parts = any(caption for caption, _ in parts)
+        if not has_parts:
+            parts = [(None, [doc for _, docs in parts for doc in docs])]
+
+        code = str(settings["module_code"])
+        block = str(settings["block"])
+        presentation = str(settings["presentation"]).lower()
+        self.items = []
+        self.doc_roles = {}
+        for index, (caption, chapters) in enumerate(parts):
+            if not chapters:
+                continue
+            part = settings["numbering_from"] + index if has_parts else 1
+            if has_parts:
+                stem = f"{code.lower()}_b{block}_p{part}_{presentation}"
+                title = (
+                    caption
+                    if settings["caption_as_title"]
+                    else f"{code} Block {block}, Part {part}: $PART_TITLE"
+                )
+                item = {
+                    "id": f"X_{stem}",
+                    "filename": f"{stem}.xml",
+                    "unit_id": f"Block {block}: {settings['block_title']}",
+                    "unit_title": f"{caption}: $PART_TITLE",
+                }
+            else:
+                stem = f"{code.lower()}_b{block.lower()}_p{part}_{presentation}"
+                title = settings.get("item_title") or f"{code} {block}: $PART_TITLE"
+                item = {
+                    "id": f"X_{code.lower()}_b{block.lower()}_{presentation}",
+                    "filename": f"{code.lower()}_{block.lower()}.xml",
+                    "unit_id": f"{block}: $PART_TITLE",
+                    "unit_title": f"{code} {block}: $PART_TITLE",
+                }
+            part_title = self.doc_title(chapters[0])
+            item.update(
+                {
+                    "stem": stem,
+                    "part_title": part_title,
+                    "title": title.replace("$PART_TITLE", part_title),
+                    "unit_id": item["unit_id"].replace("$PART_TITLE", part_title),
+                    "unit_title": item["unit_title"].replace("$PART_TITLE", part_title),
+                    "chapters": [
+                        (chapter, [
+                            doc
+                            for doc in env.toctree_includes.get(chapter, [])
+                            if doc in env.all_docs
+                        ])
+                        for chapter in chapters
+                    ],
+                }
+            )
+            item_index = len(self.items)
+            self.items.append(item)
+            for position, (chapter, sections) in enumerate(item["chapters"]):
+                self.doc_roles.setdefault(
+                    chapter,
+                    {"item": item_index, "tag": "Session", "first": position == 0},
+                )
+                for section in sections:
+                    self.doc_roles.setdefault(
+                        section, {"item": item_index, "tag": "Section", "first": False}
+                    )
+        self.signature = hashlib.sha256(
+            json.dumps(
+                [FRAGMENT_VERSION, self.items, self.doc_roles, settings], sort_keys=True, default=str
+            ).encode()
+        ).hexdigest()
+
+    def structure_changed(self) -> bool:
+        """Whether the book structure changed since the fragments were written."""
+        stamp = Path(self.fragment_dir, ".structure")
+        return not (stamp.exists() and stamp.read_text() == self.signature)
+
+    # Documents
+
+    def get_outdated_docs(self) -> Iterator[str]:
+        for docname in self.env.found_docs:
+            if docname == self.config.root_doc:
+                # Only its toctrees are used, which are checked on reading
+                continue
+            if docname not in self.env.all_docs:
+                yield docname
+                continue
+            try:
+                targetmtime = path.getmtime(self.fragment_path(docname))
+            except OSError:
+                targetmtime = 0
+            try:
+                srcmtime = path.getmtime(self.env.doc2path(docname))
+                if srcmtime > targetmtime:
+                    yield docname
+                    continue
+            except OSError:
+                # source doesn't exist anymore
+                continue
+            try:
+                # Re-read since the fragment was written, e.g. by another builder
+                if path.getmtime(path.join(self.doctreedir, docname + ".doctree")) > targetmtime:
+                    yield docname
+            except OSError:
+                pass
+
+    def get_target_uri(self, docname: str, typ: Optional[str] = None) -> str:
+        return docname
+
+    def get_relative_uri(self, from_: str, to: str, typ: Optional[str] = None) -> str:
+        # Links are resolved to Items on assembly, so keep docnames whole
+        return self.get_target_uri(to, typ)
+
+    def prepare_writing(self, docnames: Set[str]) -> None:
+        if not self.items:
+            self.init_structure()
+        if self.settings.get("validate"):
+            self.validator = self.create_validator()
+
+    # Validation
+
+    def create_validator(self) -> Optional[FragmentValidator]:
+        """Return a fragment validator, if xmlschema and a schema are available."""
+        try:
+            import xmlschema  # noqa: F401
+        except ImportError:
+            logger.warning("ouxml: validation needs the xmlschema package")
+            return None
+        schema = self.settings.get("schema")
+        schema = path.join(self.srcdir, schema) if schema else default_schema()
+        if not schema or not path.exists(schema):
+            logger.warning(
+                "ouxml: validation needs an OU-XML schema; set the schema ou "
+                "setting or install the ou-xml-validator package"
+            )
+            return None
+        try:
+            with open(path.join(self.fragment_dir, ".validation.json"), encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+        return FragmentValidator(schema, cache)
+
+    def report_validation(self) -> None:
+        """Warn about schema errors, against the source lines they came from."""
+        validator = self.validator
+        for docname in self.doc_roles:
+            if docname not in validator.jobs and path.exists(self.fragment_path(docname)):
+                validator.submit(
+                    docname, self.fragment_path(docname), self.doc_roles[docname]["tag"]
+                )
+        results = validator.results()
+        for docname in sorted(results):
+            if docname not in self.doc_roles or not results[docname]:
+                continue
+            lines = self.fragment_data(docname).get("lines", [])
+            starts = [entry[0] for entry in lines]
+            for line, message in results[docname]:
+                index = bisect.bisect_right(starts, line or 0) - 1
+                if index >= 0:
+                    _, source, source_line = lines[index]
+                    location = f"{source}:{source_line}" if source else (docname, source_line)
+                else:
+                    location = docname
+                logger.warning(f"ouxml: {message}", location=location, type="ouxml")
+        cache = {k: v for k, v in validator.cache.items() if k in self.doc_roles}
+        os.makedirs(self.fragment_dir, exist_ok=True)
+        with open(path.join(self.fragment_dir, ".validation.json"), "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+
+    def write_doc(self, docname: str, doctree: nodes.document) -> None:
+        if docname not in self.doc_roles:
+            return
+        self.post_process_images(doctree)
+        self.published = {}
+        section = doctree.next_node(nodes.section)
+        target = self.fragment_path(docname)
+        os.makedirs(path.dirname(target), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.dirname(target), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            translator = self.create_translator(doctree, self, XMLStream(f), docname)
+            if section is not None:
+                section.walkabout(translator)
+            else:
+                logger.warning("ouxml: document has no title", location=docname)
+        with open(self.fragment_path(docname, ".json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "glossary": translator.glossary,
+                    "lines": translator.lines,
+                    "media": self.published,
+                },
+                f,
+            )
+        os.replace(tmp_path, target)
+        if self.validator is not None and os.getpid() == self.main_pid:
+            # Validate while the remaining documents are written
+            self.validator.submit(docname, target, self.doc_roles[docname]["tag"])
+
+    # Media
+
+    def local_path(self, src: str) -> str:
+        """Return the path of a local file named in a node.
+
+        Generated files are relative to the working directory; other files
+        are relative to the source directory.
+        """
+        if path.isabs(src) or path.exists(src):
+            return src
+        return path.join(self.srcdir, src)
+
+    def _publish(self, source: str, filename: str, prefix_key: str) -> str:
+        """Copy a file to the output directory, if changed, and return its URL."""
+        target = path.join(self.outdir, filename)
+        if not path.exists(source):
+            logger.warning(f"ouxml: can't find {source}")
+        elif not path.exists(target) or path.getmtime(target) < path.getmtime(source):
+            fd, tmp_path = tempfile.mkstemp(dir=self.outdir, suffix=".tmp")
+            os.close(fd)
+            shutil.copyfile(source, tmp_path)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, target)
+        return self.note_media(filename, source, prefix_key)
+
+    def note_media(self, filename: str, source: str, prefix_key: str) -> str:
+        """Record a file published by the current document and return its URL."""
+        url = urljoin(self.settings[prefix_key], filename)
+        if path.isabs(source) and source.startswith(str(self.srcdir)):
+            source = path.relpath(source, self.srcdir)
+        self.published[filename] = {"source": source, "url": url}
+        return url
+
+    def publish_file(self, item: Dict[str, Any], kind: str, source: str,
+                     keep=False) -> str:
+        """Publish a media file, named for the Item unless it is kept."""
+        name = path.basename(source)
+        filename = name if keep else f"{item['stem']}_{kind}_{name}"
+        return self._publish(source, filename, "media_path_prefix")
+
+    def publish_image(self, item: Dict[str, Any], uri: str) -> str:
+        if urlparse(uri).netloc:
+            return uri
+        # Use Sphinx's unique name, in case images share a file name
+        name = self.images.get(uri, path.basename(uri))
+        return self._publish(
+            path.join(self.srcdir, uri), f"{item['stem']}_fig_{name}", "image_path_prefix"
+        )
+
+    def publish_media(self, item: Dict[str, Any], src: str, is_remote: bool) -> str:
+        if is_remote:
+            return src
+        name = self.images.get(src, path.basename(src))
+        return self._publish(
+            path.join(self.srcdir, src), f"{item['stem']}_media_{name}", "media_path_prefix"
+        )
+
+    def publish_package(self, item: Dict[str, Any], src: str, keep=False) -> str:
+        """Publish an html5 package; single HTML files are zipped as index.html."""
+        if urlparse(src).netloc:
+            return src
+        source = self.local_path(src)
+        if Path(source).suffix.lower() in (".html", ".htm"):
+            filename = f"{item['stem']}_html_{Path(source).stem}.zip"
+            target = path.join(self.outdir, filename)
+            if path.exists(source) and (
+                not path.exists(target) or path.getmtime(target) < path.getmtime(source)
+            ):
+                self._write_zip(target, Path(source).read_text(encoding="utf-8"))
+            return self.note_media(filename, source, "media_path_prefix")
+        return self.publish_file(item, "html", source, keep)
+
+    def _write_zip(self, target: str, html: str) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.outdir, suffix=".tmp")
+        os.close(fd)
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("index.html", html)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, target)
+
+    def write_media_zip(self, item: Dict[str, Any], html: str) -> str:
+        """Publish an HTML fragment as an html5 package, named by its content."""
+        digest = hashlib.sha256(html.encode("utf-8")).hexdigest()[:12]
+        filename = f"{item['stem']}_html_{digest}.zip"
+        target = path.join(self.outdir, filename)
+        if not path.exists(target):
+            self._write_zip(target, html)
+        return self.note_media(filename, "(generated)", "media_path_prefix")
+
+    def write_media_text(self, item: Dict[str, Any], kind: str, text: str,
+                         suffix: str) -> str:
+        """Publish a text file, named by its content."""
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        filename = f"{item['stem']}_{kind}_{digest}{suffix}"
+        target = path.join(self.outdir, filename)
+        if not path.exists(target):
+            fd, tmp_path = tempfile.mkstemp(dir=self.outdir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, target)
+        return self.note_media(filename, "(generated)", "media_path_prefix")
+
+    def render_mermaid(self, item: Dict[str, Any], code: str) -> Optional[str]:
+        """Render a Mermaid diagram with the mermaid-cli ``mmdc`` command."""
+        digest = hashlib.sha256(code.encode("utf-8")).hexdigest()[:12]
+        filename = f"{item['stem']}_fig_mermaid_{digest}.png"
+        target = path.join(self.outdir, filename)
+        if not path.exists(target):
+            mmdc = shutil.which("mmdc")
+            if mmdc is None:
+                logger.warning("ouxml: rendering Mermaid diagrams needs mmdc (mermaid-cli)")
+                return None
+            # mmdc picks the output format from the file name
+            fd, tmp_path = tempfile.mkstemp(dir=self.outdir, suffix=".tmp.png")
+            os.close(fd)
+            try:
+                result = subprocess.run(
+                    [mmdc, "-i", "-", "-o", tmp_path], input=code.encode(), capture_output=True
+                )
+                if result.returncode:
+                    logger.warning(f"ouxml: mmdc failed: {result.stderr.decode().strip()}")
+                    return None
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, target)
+            finally:
+                if path.exists(tmp_path):
+                    os.unlink(tmp_path)
+        return self.note_media(filename, "(generated)", "image_path_prefix")
+
+    # Assembly
+
+    def finish(self) -> None:
+        if not self.items:
+            self.init_structure()
+        if self.validator is not None:
+            self.report_validation()
+        self.finish_tasks.add_task(self.write_items)
+        self.finish_tasks.add_task(self.write_manifest)
+
+    def write_items(self) -> None:
+        numbers = Numbering(self.config)
+        for item in self.items:
+            target = path.join(self.outdir, item["filename"])
+            fd, tmp_path = tempfile.mkstemp(dir=self.outdir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                self.write_item(XMLStream(f), item, numbers)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, target)
+        Path(self.fragment_dir).mkdir(parents=True, exist_ok=True)
+        Path(self.fragment_dir, ".structure").write_text(self.signature)
+
+    def write_item(self, out: XMLStream, item: Dict[str, Any], numbers: "Numbering"):
+        """Stream the fragments of an Item's documents into its OU-XML file."""
+        settings = self.settings
+        out.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        out.start(
+            "Item",
+            {
+                "TextType": "CompleteItem",
+                "SchemaVersion": "2.0",
+                "id": item["id"],
+                "Template": "Generic_A4_Unnumbered",
+                "Rendering": settings.get("rendering", "VLE2 modules (learn2)"),
+                "DiscussionAlias": "Comment",
+                "vleglossary": "auto",
+            },
+            block=False,
+        )
+        out.empty("meta", {"content": item["title"]})
+        out.element("CourseCode", str(settings["module_code"]))
+        out.element("CourseTitle", str(settings["module_title"]))
+        out.empty("ItemID")
+        out.element("ItemTitle", item["title"])
+        out.write("\n")
+        out.write(
+            cached_template("assets", "ouxml", "frontmatter.xml").format(
+                **{
+                    key: escape(str(value))
+                    for key, value in {
+                        "author": settings.get("author") or self.config.author,
+                        "module_code": settings["module_code"],
+                        "module_title": settings["module_title"],
+                        "first_published": settings["first_published"],
+                        "isbn": settings["isbn"],
+                        "edition": settings["edition"],
+                        "year": datetime.now(tz=timezone.utc).year,
+                    }.items()
+                }
+            )
+        )
+        out.start("Unit")
+        out.element("UnitID", item["unit_id"])
+        out.element("UnitTitle", item["unit_title"])
+        out.element("ByLine", settings.get("author") or self.config.author)
+        glossary = []
+        for chapter, sections in item["chapters"]:
+            closing = self.copy_fragment(out, chapter, numbers, keep_last=False)
+            for section in sections:
+                self.copy_fragment(out, section, numbers)
+                glossary.extend(self.fragment_glossary(section))
+            out.write(closing)
+            glossary.extend(self.fragment_glossary(chapter))
+        out.start("BackMatter")
+        if glossary:
+            out.start("Glossary")
+            for entry in glossary:
+                out.start("GlossaryItem")
+                out.element("Term", entry["term"])
+                out.element("Definition", entry["definition"])
+                out.end("GlossaryItem")
+            out.end("Glossary")
+        out.end("BackMatter")
+        out.write("\n</Unit>\n</Item>\n")
+
+    def copy_fragment(self, out: XMLStream, docname: str, numbers: "Numbering",
+                      keep_last=True) -> str:
+        """Copy a fragment, filling in its numbers, line by line.
+
+        Unless ``keep_last`` is set, the closing line of the fragment is not
+        written but returned, so sub-sections can be inserted before it.
+        """
+        try:
+            f = open(self.fragment_path(docname), encoding="utf-8")
+        except OSError:
+            logger.warning(f"ouxml: no output for {docname}")
+            return ""
+        previous = None
+        with f:
+            for line in f:
+                if previous is not None:
+                    out.write(numbers.fill(previous))
+                previous = line
+        if previous is None:
+            return ""
+        if keep_last:
+            out.write(numbers.fill(previous))
+            return ""
+        return numbers.fill(previous)
+
+    def fragment_glossary(self, docname: str) -> List[Dict[str, str]]:
+        return self.fragment_data(docname).get("glossary", [])
+
+    def fragment_data(self, docname: str) -> Dict[str, Any]:
+        """Return what was recorded about a document as it was translated."""
+        try:
+            with open(self.fragment_path(docname, ".json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    # Upload manifest
+
+    def write_manifest(self) -> None:
+        """Write the media manifest and its difference from the published one."""
+        media = {}
+        for docname in sorted(self.doc_roles):
+            media.update(self.fragment_data(docname).get("media", {}))
+        manifest_path = path.join(self.outdir, manifest.MANIFEST)
+        previous = manifest.load_manifest(manifest_path)
+        new = manifest.build_manifest(self.outdir, media, previous)
+        published = self.settings.get("published_manifest")
+        if published:
+            previous = manifest.load_manifest(path.join(self.srcdir, published))
+        changes = manifest.diff_manifests(previous, new)
+        manifest.write_json(manifest_path, new)
+        manifest.write_json(path.join(self.outdir, manifest.CHANGES), changes)
+        logger.info(
+            f"ouxml: {len(changes['added'])} new and {len(changes['changed'])} "
+            f"changed media files to upload"
+        )
+
+
+class Numbering:
+    """Session, section, figure and table numbers, in book order."""
+
+    def __init__(self, config):
+        # ouseful_obt numbers figures through the book unless
+        # numfig_secnum_depth is explicitly set to 1
+        explicit = {**getattr(config, "_raw_config", {}), **getattr(config, "_overrides", {})}
+        self.figures_by_session = str(explicit.get("numfig_secnum_depth", 0)) == "1"
+        self.counts = {"session": 0, "section": 0, "figure": 0, "table": 0}
+        self.session_figures = 0
+
+    def next(self, match: re.Match) -> str:
+        kind = match.group(1)
+        counts = self.counts
+        counts[kind] += 1
+        if kind == "session":
+            counts["section"] = 0
+            self.session_figures = 0
+            return f"{counts['session']} "
+        if kind == "section":
+            return f"{counts['session']}.{counts['section']} "
+        if kind == "figure":
+            if self.figures_by_session:
+                self.session_figures += 1
+                return f"Figure {counts['session']}.{self.session_figures} "
+            return f"Figure {counts['figure']} "
+        return f"Table {counts['table']} "
+
+    def fill(self, line: str) -> str:
+        if "<?ou-number" not in line:
+            return line
+        return NUMBER_MARKER.sub(self.next, line)
+
+
+def check_structure(app: Sphinx, env: BuildEnvironment) -> List[str]:
+    """Rewrite every document if the book structure or settings changed."""
+    builder = app.builder
+    if not isinstance(builder, OUXMLBuilder):
+        return []
+    builder.init_structure()
+    if builder.structure_changed():
+        return sorted(builder.doc_roles)
+    return []
+
+
+def write_ouxml(app: Sphinx, exception: Optional[Exception]) -> None:
+    """Also write OU-XML from the doctrees another builder has just read.
+
+    The documents are only read, and their directives only run, once; the
+    artifacts generated while reading (e.g. codestyle packages in ``_tmp``)
+    are shared by both outputs.
+    """
+    outdir = app.config.ou_ouxml_outdir
+    if exception is not None or not outdir or isinstance(app.builder, OUXMLBuilder):
+        return
+    if is_draft(app):
+        # Draft artifacts are unpacked previews, not publishable packages
+        logger.info("ouxml: not written for a draft build")
+        return
+    main_builder = app.builder
+    builder = OUXMLBuilder(app, app.env)
+    # Relative to the parent of the main output directory, e.g. _build
+    builder.outdir = path.join(path.dirname(path.abspath(app.outdir)), outdir)
+    os.makedirs(builder.outdir, exist_ok=True)
+    builder.init()
+    builder.init_structure()
+    docnames = set(builder.get_outdated_docs())
+    if builder.structure_changed():
+        docnames |= set(builder.doc_roles)
+    logger.info(f"ouxml: writing {len(docnames)} documents to {builder.outdir}")
+    builder.phase = BuildPhase.RESOLVING
+    builder.parallel_ok = app.parallel > 1 and app.is_parallel_allowed("write")
+    builder.finish_tasks = SerialTasks()
+    # Post-transforms look the builder up on the application and environment
+    main_builder_cls = getattr(app.env, "_builder_cls", None)
+    app.builder = builder
+    app.env._builder_cls = OUXMLBuilder
+    try:
+        builder.write(docnames, [], "update")
+        builder.finish()
+        builder.finish_tasks.join()
+    finally:
+        app.builder = main_builder
+        app.env._builder_cls = main_builder_cls
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
+    """Add the ouxml builder."""
+    # The ou settings; if empty, read from the ou block of _config.yml
+    app.add_config_value("ou", {}, "")
+    # Also write OU-XML to this directory when building another format
+    app.add_config_value("ou_ouxml_outdir", "", "")
+    app.add_builder(OUXMLBuilder)
+    app.connect("env-updated", check_structure)
+    app.connect("build-finished", write_ouxml)
+
+    return {
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
@@ -0,0 +1,198 @@
+"""Check that the remote media used by the ou extensions can be reached.
+
+The ``ou-video``, ``ou-audio`` and ``ou-html5`` directives record the remote
+URLs they are given. When ``ou_check_remote_media`` is set, a
+``build-finished`` stage sends a ``HEAD`` request for each URL, concurrently
+and through a bounded pool of connections, and warns about the ones that
+fail; servers that reject ``HEAD`` are sent a ``GET`` for the first byte
+instead. The ``ETag``, ``Last-Modified`` and ``Content-Length`` of each URL
+are cached in ``ou-remote-media-cache.json`` in the doctree directory, so
+later builds only send conditional requests, and a report of each URL's
+status and size, with the total, is written to ``ou-remote-media.json`` in
+the output directory.
+
+``check_urls`` does not depend on Sphinx, so it can be run against a local
+HTTP server.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Set
+from urllib.error import HTTPError, URLError
+
+import json
+import os
+import tempfile
+import urllib.request
+
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+CACHE = "ou-remote-media-cache.json"
+"File name of the cache in the doctree directory"
+
+REPORT = "ou-remote-media.json"
+"File name of the report in the output directory"
+
+USER_AGENT = "sphinxcontrib-ou-media remote media check"
+
+
+def note_remote_media(env: BuildEnvironment, url: str) -> None:
+    """Record a remote media URL used by the current document."""
+    if not hasattr(env, "ou_remote_media"):
+        env.ou_remote_media = {}
+    env.ou_remote_media.setdefault(env.docname, set()).add(url)
+
+
+def send(url: str, method: str, headers: Dict[str, str], timeout: float,
+         cached: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Send a request, returning the result to record for the URL."""
+    request = urllib.request.Request(url, method=method, headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            # A ranged response gives the full length after the range
+            length = response.headers.get("Content-Range", "").rpartition("/")[2]
+            if response.status != 206:
+                length = response.headers.get("Content-Length")
+            return {
+                "status": response.status,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "length": int(length) if length and length.isdigit() else None,
+                "error": None,
+            }
+    except HTTPError as err:
+        err.close()
+        if err.code == 304 and cached:
+            return {**cached, "status": 304}
+        return {"status": err.code, "error": f"{err.code} {err.reason}"}
+    except (URLError, OSError, ValueError) as err:
+        reason = getattr(err, "reason", err)
+        return {"status": None, "error": str(reason)}
+
+
+HEAD_REJECTED = {403, 405}
+"Statuses of servers that refuse HEAD requests but may still serve the URL"
+
+
+def head(url: str, cached: Optional[Dict[str, Any]], timeout: float) -> Dict[str, Any]:
+    """Send a HEAD request, conditional on the cached validators if any.
+
+    Servers that reject ``HEAD`` are sent a ``GET`` for the first byte instead.
+    Returns the status, the ``ETag``, ``Last-Modified`` and
+    ``Content-Length`` of the response, and any error.
+    """
+    headers = {"User-Agent": USER_AGENT}
+    if cached and not cached.get("error"):
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    result = send(url, "HEAD", headers, timeout, cached)
+    if result["status"] in HEAD_REJECTED:
+        result = send(url, "GET", {**headers, "Range": "bytes=0-0"}, timeout, cached)
+    return result
+
+
+def check_urls(urls: Iterable[str], cache: Optional[Dict[str, Dict[str, Any]]] = None,
+               connections=8, timeout=10.0) -> Dict[str, Dict[str, Any]]:
+    """Check URLs concurrently, returning the result for each.
+
+    Args:
+        urls: the URLs to check
+        cache: the previous results, by URL, used for conditional requests
+        connections: the most requests to have open at once
+        timeout: the timeout of each request, in seconds
+    """
+    urls = sorted(set(urls))
+    cache = cache or {}
+    # The pool bounds the number of open connections
+    with ThreadPoolExecutor(max_workers=max(1, connections)) as pool:
+        results = pool.map(lambda url: head(url, cache.get(url), timeout), urls)
+        return dict(zip(urls, results))
+
+
+def load_cache(filename: str) -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(filename, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_json(filename: str, data: Any) -> None:
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filename), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, filename)
+
+
+def check_remote_media(app: Sphinx, exception: Optional[Exception]) -> None:
+    """Check the remote media URLs once the build is done."""
+    if exception is not None or not app.config.ou_check_remote_media:
+        return
+    used: Dict[str, Set[str]] = {}
+    for docname, urls in getattr(app.env, "ou_remote_media", {}).items():
+        for url in urls:
+            used.setdefault(url, set()).add(docname)
+    if not used:
+        return
+    cache_path = os.path.join(app.doctreedir, CACHE)
+    cache = load_cache(cache_path)
+    results = check_urls(
+        used,
+        cache,
+        app.config.ou_remote_media_connections,
+        app.config.ou_remote_media_timeout,
+    )
+    report = []
+    for url, result in sorted(results.items()):
+        for docname in sorted(used[url]):
+            if result.get("error"):
+                logger.warning(
+                    f"remote media {url} can't be reached: {result['error']}",
+                    location=docname,
+                )
+        report.append({"url": url, "docs": sorted(used[url]), **result})
+    write_json(cache_path, {**cache, **results})
+    total = sum(entry.get("length") or 0 for entry in report)
+    write_json(
+        os.path.join(app.outdir, REPORT), {"total_length": total, "media": report}
+    )
+    failed = sum(1 for entry in report if entry.get("error"))
+    logger.info(
+        f"checked {len(report)} remote media URLs: {failed} unreachable, "
+        f"{total} bytes in total"
+    )
+
+
+def purge_remote_media(app: Sphinx, env: BuildEnvironment, docname: str) -> None:
+    getattr(env, "ou_remote_media", {}).pop(docname, None)
+
+
+def merge_remote_media(app: Sphinx, env: BuildEnvironment, docnames: List[str],
+                       other: BuildEnvironment) -> None:
+    if not hasattr(env, "ou_remote_media"):
+        env.ou_remote_media = {}
+    for docname, urls in getattr(other, "ou_remote_media", {}).items():
+        if docname in docnames:
+            env.ou_remote_media[docname] = urls
+
+
+def setup_remote_check(app: Sphinx) -> None:
+    """Register the remote media check config values and build stage.
+
+    Several extensions use remote media, so only register once.
+    """
+    if "ou_check_remote_media" in app.config:
+        return
+    app.add_config_value("ou_check_remote_media", False, "")
+    app.add_config_value("ou_remote_media_connections", 8, "")
+    app.add_config_value("ou_remote_media_timeout", 10.0, "")
+    app.connect("env-purge-doc", purge_remote_media)
+    app.connect("env-merge-info", merge_remote_media)
+    app.connect("build-finished", check_remote_media)
@@ -0,0 +1,306 @@
+"""Shared runtimes for interactive codestyle artifacts.
+
+Each interactive codestyle type (``thebelite``, ``shinylite-py``,
+``pyodide-terminal``) is made up of a runtime directory that is the same for
+every snippet, plus a few per-snippet files. The runtime is zipped once per
+build into a base archive; each snippet archive starts as a copy of that base
+archive, with its own files appended, so the runtime is never re-deflated.
+
+Optionally, the runtime can instead be hosted once per site: it is written
+to ``HOSTED_DIR`` in the output directory, snippet archives only hold the
+per-snippet files, and snippet pages load the runtime from
+``ou_codestyle_runtime_url``.
+
+In draft builds, snippets are not zipped at all: each is written as an
+unpacked directory in the output directory, with a ``runtime`` symlink to
+the single shared runtime.
+"""
+
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple, Union
+
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import zipfile
+from urllib.parse import urlparse
+
+from sphinx.util import logging
+
+from sphinxcontrib_ou_media.utils import resources_path
+
+logger = logging.getLogger(__name__)
+
+RUNTIME_ROOT = os.path.join("_tmp", "runtimes")
+"Directory that prepared runtimes and base archives are cached in"
+
+HOSTED_DIR = "_ou_runtimes"
+"Output directory that site-hosted runtimes are written to"
+
+DRAFT_RUNTIME_LINK = "runtime"
+"Name of the link to the shared runtime in draft snippet directories"
+
+RUNTIME_RESOURCES: Dict[str, Union[Tuple[str, ...], str]] = {
+    "thebelite": ("assets", "html-zip-resources", "thebelite"),
+    "shinylite-py": "shinylive",
+    "pyodide-terminal": ("assets", "html-zip-resources", "pyodide-terminal"),
+}
+"Package directory, or distribution, that each runtime is made from"
+
+SHINYLITE_SNIPPET_FILES = ("index.html", "app.json", "edit")
+"Files written by ``shinylive export`` that are specific to an app"
+
+SHINYLITE_SW_FILES = ("shinylive-sw.js", "shinylive/load-shinylive-sw.js")
+"Service worker files, which must be served from each snippet's own directory"
+
+_base_archives: Dict[Tuple[str, str], str] = {}
+_hosted: Set[Tuple[str, str]] = set()
+_cross_origin_warned: Set[str] = set()
+
+
+# Via Chatgpt:
+# function to mimic: zip -j MYZIP.zip MYDIR
+# zip files to root of zipfile, ignoring path
+def zip_directory(source_folder, output_zipfile):
+    source_path = Path(source_folder)
+    with zipfile.ZipFile(output_zipfile, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for file_path in source_path.glob("**/*"):
+            if file_path.is_file():
+                arcname = file_path.relative_to(source_path)
+                zipf.write(file_path, arcname)
+
+
+def fingerprint(runtime: Path) -> str:
+    """Return a fingerprint of a runtime directory's file listing."""
+    digest = hashlib.sha256()
+    for path in sorted(p for p in runtime.glob("**/*") if p.is_file()):
+        stat = path.stat()
+        digest.update(
+            f"{path.relative_to(runtime)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode()
+        )
+    return digest.hexdigest()[:16]
+
+
+def shinylite_runtime(config) -> Optional[Path]:
+    """Return the shared shinylive runtime, exporting it on first use.
+
+    The runtime is produced with the ``shinylive export`` command (from the
+    optional ``shinylive`` package) for a placeholder app that imports
+    ``shiny`` and any ``ou_shinylite_packages``, so their Pyodide packages
+    are included. The app-specific files are then removed.
+    """
+    try:
+        from importlib.metadata import version
+
+        shinylive_version = version("shinylive")
+    except Exception:
+        shinylive_version = None
+    cli = shutil.which("shinylive")
+    if cli is None or shinylive_version is None:
+        logger.warning(
+            "codestyle: shinylite-py needs the shinylive package "
+            "(pip install shinylive); the runtime will be missing"
+        )
+        return None
+
+    packages = ["shiny"] + sorted(set(config.ou_shinylite_packages) - {"shiny"})
+    key = hashlib.sha256(
+        "\n".join([shinylive_version] + packages).encode()
+    ).hexdigest()[:12]
+    runtime = Path(RUNTIME_ROOT, f"shinylite-py-{key}")
+    if (runtime / "shinylive").is_dir():
+        return runtime
+
+    os.makedirs(RUNTIME_ROOT, exist_ok=True)
+    exportdir = tempfile.mkdtemp(dir=RUNTIME_ROOT)
+    with tempfile.TemporaryDirectory() as appdir:
+        Path(appdir, "app.py").write_text(
+            "".join(f"import {package}\n" for package in packages)
+        )
+        result = subprocess.run(
+            [cli, "export", appdir, exportdir], capture_output=True, text=True
+        )
+    if result.returncode:
+        logger.warning(f"codestyle: shinylive export failed: {result.stderr.strip()}")
+        shutil.rmtree(exportdir, ignore_errors=True)
+        return None
+    for name in SHINYLITE_SNIPPET_FILES:
+        path = Path(exportdir, name)
+        if path.is_dir():
+            shutil.rmtree(path)
+        elif path.exists():
+            path.unlink()
+    try:
+        os.replace(exportdir, runtime)
+    except OSError:
+        # Another (parallel) reader prepared the runtime first
+        shutil.rmtree(exportdir, ignore_errors=True)
+    return runtime
+
+
+def runtime_dir(name: str, config) -> Optional[Path]:
+    """Return the runtime directory for an interactive codestyle type."""
+    if name == "thebelite":
+        return Path(
+            str(resources_path().joinpath("assets", "html-zip-resources", "thebelite"))
+        )
+    if name == "shinylite-py":
+        return shinylite_runtime(config)
+    if name == "pyodide-terminal":
+        # Pyodide itself is loaded from ou_pyodide_index_url
+        return Path(
+            str(resources_path().joinpath("assets", "html-zip-resources", "pyodide-terminal"))
+        )
+    return None
+
+
+def base_archive(name: str, runtime: Path) -> str:
+    """Return the base archive for a runtime, zipping it on first use.
+
+    Archives are keyed by the runtime fingerprint, so they are reused across
+    builds until the runtime changes.
+    """
+    cache_key = (name, str(runtime))
+    # The archive is relative to the book directory, so it can be missing
+    # from a later build in the same process (e.g. of another book)
+    if cache_key not in _base_archives or not os.path.exists(_base_archives[cache_key]):
+        path = os.path.join(RUNTIME_ROOT, f"{name}-{fingerprint(runtime)}.zip")
+        if not os.path.exists(path):
+            os.makedirs(RUNTIME_ROOT, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(suffix=".zip", dir=RUNTIME_ROOT)
+            os.close(fd)
+            zip_directory(runtime, tmp_path)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        _base_archives[cache_key] = path
+    return _base_archives[cache_key]
+
+
+def host_runtime(name: str, runtime: Path, outdir: str) -> None:
+    """Write a runtime to the site's hosted runtime directory, if changed."""
+    cache_key = (name, outdir)
+    target = Path(outdir, HOSTED_DIR, name)
+    stamp = target / ".ou-runtime"
+    # The output directory may have been removed since the last build
+    if cache_key in _hosted and stamp.exists():
+        return
+    runtime_fingerprint = fingerprint(runtime)
+    if not (stamp.exists() and stamp.read_text() == runtime_fingerprint):
+        shutil.copytree(runtime, target, dirs_exist_ok=True)
+        stamp.write_text(runtime_fingerprint)
+    _hosted.add(cache_key)
+
+
+def start_artifact(name: str, config, outdir: str, output_zipfile: str) -> str:
+    """Start a snippet archive for an interactive codestyle type.
+
+    Args:
+        name: the codestyle type, e.g. ``thebelite``
+        config: the Sphinx config
+        outdir: the builder output directory
+        output_zipfile: the snippet archive to create
+
+    Returns:
+        the URL prefix the snippet page should load runtime files from
+    """
+    runtime = runtime_dir(name, config)
+    if hosted_runtime_url(name, config):
+        if runtime is not None:
+            host_runtime(name, runtime, outdir)
+        with zipfile.ZipFile(output_zipfile, "w", zipfile.ZIP_DEFLATED) as zipf:
+            for filename in service_worker_files(name, runtime):
+                zipf.write(runtime / filename, filename)
+    elif runtime is None:
+        zipfile.ZipFile(output_zipfile, "w").close()
+    else:
+        shutil.copyfile(base_archive(name, runtime), output_zipfile)
+    return runtime_url_prefix(name, config)
+
+
+def hosted_runtime_url(name: str, config) -> str:
+    """Return the URL a runtime is hosted at, or an empty string if snippets bundle it.
+
+    Shinylive registers a service worker and starts web workers, which
+    browsers only load from the page's own origin, so the ``shinylite-py``
+    runtime is only hosted at a URL path (e.g. ``/mybook/_ou_runtimes``),
+    not a URL on another host.
+    """
+    hosted_url = config.ou_codestyle_runtime_url
+    if hosted_url and name == "shinylite-py" and urlparse(hosted_url).netloc:
+        if hosted_url not in _cross_origin_warned:
+            _cross_origin_warned.add(hosted_url)
+            logger.warning(
+                f"codestyle: shinylite-py runtimes must be hosted on the same site as "
+                f"the book; ou_codestyle_runtime_url {hosted_url} is a full URL, so "
+                "shinylite-py snippets bundle their runtime"
+            )
+        return ""
+    return hosted_url.rstrip("/") if hosted_url else ""
+
+
+def service_worker_files(name: str, runtime: Optional[Path]) -> Tuple[str, ...]:
+    """Return the runtime files a snippet needs a copy of when it does not bundle the runtime.
+
+    A service worker only controls pages in its own directory, so the
+    shinylive service worker is copied to each snippet.
+    """
+    if name != "shinylite-py" or runtime is None:
+        return ()
+    return tuple(filename for filename in SHINYLITE_SW_FILES if (runtime / filename).exists())
+
+
+def runtime_url_prefix(name: str, config) -> str:
+    """Return the URL prefix a snippet archive's page loads runtime files from."""
+    hosted_url = hosted_runtime_url(name, config)
+    if hosted_url:
+        return f"{hosted_url}/{name}/"
+    return "./"
+
+
+def start_draft_artifact(name: str, config, outdir: str, artifact_dir: str) -> str:
+    """Start an unpacked snippet directory for a draft build.
+
+    The directory links to the shared runtime rather than holding a copy of
+    it (falling back to a copy where symlinks are not available).
+
+    Returns:
+        the URL prefix the snippet page should load runtime files from
+    """
+    runtime = runtime_dir(name, config)
+    os.makedirs(artifact_dir, exist_ok=True)
+    if runtime is None:
+        return runtime_url_prefix(name, config)
+    for filename in service_worker_files(name, runtime):
+        target = Path(artifact_dir, filename)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(runtime / filename, target)
+    if hosted_runtime_url(name, config):
+        host_runtime(name, runtime, outdir)
+        return runtime_url_prefix(name, config)
+    link = os.path.join(artifact_dir, DRAFT_RUNTIME_LINK)
+    if not os.path.lexists(link):
+        try:
+            os.symlink(os.path.abspath(runtime), link, target_is_directory=True)
+        except OSError:
+            shutil.copytree(runtime, link)
+    return f"./{DRAFT_RUNTIME_LINK}/"
+
+
+def write_draft_files(artifact_dir: str, files: Dict[str, Union[str, Path]]) -> None:
+    """Write the per-snippet files of a draft snippet directory.
+
+    Text is only written if it changed; paths (e.g. wheels) are linked.
+    """
+    for name, content in files.items():
+        target = Path(artifact_dir, name)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(content, Path):
+            if not os.path.lexists(target):
+                try:
+                    os.symlink(content.resolve(), target)
+                except OSError:
+                    shutil.copyfile(content, target)
+        elif not (target.exists() and target.read_text(encoding="utf-8") == content):
+            target.write_text(content, encoding="utf-8")
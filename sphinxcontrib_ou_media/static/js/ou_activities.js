@@ -1,33 +1,132 @@
-function ou_activitySetup() {
-  for (const toggle of document.querySelectorAll(".ou-toggle")) {
-    toggle.addEventListener("click", () => {
-      // Find the associated content container
-      const answerContent = toggle
-        .closest(".ou-activity-answer")
-        .querySelector(".ou-activity-answer-content");
-
-      if (answerContent) {
-        // Toggle the visibility of the content
-        answerContent.classList.toggle("ou-hidden");
-
-        // Toggle the button state
-        toggle.classList.toggle("ou-toggle-hidden");
-      }
-    });
+function ou_toggleAnswer(toggle) {
+  // Find the associated answer block
+  const answer = toggle.closest(".ou-activity-answer");
+  if (!answer) {
+    return;
+  }
+
+  // Answers emitted in the "template" mode are only added to the page
+  // the first time they are shown
+  const template = answer.querySelector(
+    ":scope > template.ou-activity-answer-template"
+  );
+  if (template) {
+    template.replaceWith(template.content);
+    toggle.classList.remove("ou-toggle-hidden");
+    if (window.MathJax && MathJax.typesetPromise) {
+      MathJax.typesetPromise([answer]);
+    }
+    return;
+  }
+
+  const answerContent = answer.querySelector(
+    ":scope > .ou-activity-answer-content"
+  );
+  if (answerContent) {
+    // Toggle the visibility of the content
+    answerContent.classList.toggle("ou-hidden");
+
+    // Toggle the button state
+    toggle.classList.toggle("ou-toggle-hidden");
   }
 }
 
+// A single delegated listener handles every answer toggle on the page
+document.addEventListener("click", (event) => {
+  const toggle = event.target.closest(".ou-toggle");
+  if (toggle) {
+    ou_toggleAnswer(toggle);
+  }
+});
+
 document.addEventListener("DOMContentLoaded", () => {
-  ou_activitySetup();
+  // Initially hide all inline answer contents and set button text to "Show answer"
+  document
+    .querySelectorAll(".ou-activity-answer > .ou-activity-answer-content")
+    .forEach((content) => {
+      const toggle = content.parentElement.querySelector(":scope > .ou-toggle");
+      if (toggle) {
+        content.classList.add("ou-hidden");
+        toggle.classList.add("ou-toggle-hidden");
+      }
+    });
+});
 
-  // Initially hide all answer contents and set button text to "Show answer"
-  document.querySelectorAll(".ou-activity-answer").forEach((answer) => {
-    const content = answer.querySelector(".ou-activity-answer-content");
-    const toggle = answer.querySelector(".ou-toggle");
+// Choice questions are written as empty placeholders plus a JSON island
+// holding the options of every question on the page. Each question UI is
+// only built when it is about to scroll into view.
+function ou_interactionData() {
+  const data = {};
+  document
+    .querySelectorAll("script.ou-interaction-data")
+    .forEach((island) => Object.assign(data, JSON.parse(island.textContent)));
+  return data;
+}
 
-    if (content && toggle) {
-      content.classList.add("ou-hidden");
-      toggle.classList.add("ou-toggle-hidden");
-    }
+function ou_buildInteraction(container, spec) {
+  const name = container.dataset.ouInteraction;
+  const inputType = spec.type === "multiple" ? "checkbox" : "radio";
+  const options = spec.options.map((option) => {
+    const row = document.createElement("div");
+    row.className = "ou-interaction-option";
+    const label = document.createElement("label");
+    const input = document.createElement("input");
+    input.type = inputType;
+    input.name = name;
+    label.append(input, " ", option.text);
+    const feedback = document.createElement("div");
+    feedback.className = "ou-interaction-feedback ou-hidden";
+    feedback.textContent = option.feedback || "";
+    row.append(label, feedback);
+    container.append(row);
+    return { option, row, input, feedback };
+  });
+
+  const check = document.createElement("button");
+  check.type = "button";
+  check.className = "sd-btn sd-btn-info ou-interaction-check";
+  check.textContent = "Check answer";
+  check.addEventListener("click", () => {
+    options.forEach(({ option, row, input, feedback }) => {
+      row.classList.toggle("ou-correct", input.checked && option.correct);
+      row.classList.toggle("ou-incorrect", input.checked && !option.correct);
+      feedback.classList.toggle(
+        "ou-hidden",
+        !(input.checked && option.feedback)
+      );
+    });
   });
+  container.append(check);
+}
+
+document.addEventListener("DOMContentLoaded", () => {
+  const containers = document.querySelectorAll(
+    ".ou-interaction-choices[data-ou-interaction]"
+  );
+  if (!containers.length) {
+    return;
+  }
+  const data = ou_interactionData();
+  const hydrate = (container) => {
+    const spec = data[container.dataset.ouInteraction];
+    if (spec) {
+      ou_buildInteraction(container, spec);
+    }
+  };
+  if (!("IntersectionObserver" in window)) {
+    containers.forEach(hydrate);
+    return;
+  }
+  const observer = new IntersectionObserver(
+    (entries) => {
+      entries.forEach((entry) => {
+        if (entry.isIntersecting) {
+          observer.unobserve(entry.target);
+          hydrate(entry.target);
+        }
+      });
+    },
+    { rootMargin: "200px" }
+  );
+  containers.forEach((container) => observer.observe(container));
 });
@@ -1,10 +1,58 @@
-function resizeExpandableCodeIframes() {
-  const iframes = document.getElementsByName("expandable-code-iframe");
-  iframes.forEach((iframe) => {
-    iframe.style.height =
-      iframe.contentWindow.document.documentElement.scrollHeight + 20 + "px";
-    iframe.style.width =
-      iframe.contentWindow.document.documentElement.scrollWidth + 20 + "px";
+/**
+ * Parent side of the ou-frame resize protocol.
+ *
+ * Generated code iframes post {type: "ou-frame-resize", name, height}
+ * messages (see assets/html-zip-resources/templates/ou-frame-resize.js).
+ * Each frame is found by its name rather than by scanning the documents of
+ * every iframe on the page, so this also works for cross-origin frames.
+ * Height updates arriving in the same animation frame are applied together.
+ */
+window.ouFrameResizer = (function () {
+  const pending = new Map();
+  let scheduled = false;
+
+  function findFrame(event) {
+    const name = event.data.name;
+    const named = name ? document.getElementsByName(name)[0] : null;
+    if (named && named.contentWindow === event.source) {
+      return named;
+    }
+    // Frames renamed by their host page: match on the sending window.
+    for (const iframe of document.getElementsByTagName("iframe")) {
+      if (iframe.contentWindow === event.source) {
+        return iframe;
+      }
+    }
+    return null;
+  }
+
+  function flush() {
+    scheduled = false;
+    pending.forEach((height, iframe) => {
+      iframe.height = height;
+    });
+    pending.clear();
+  }
+
+  window.addEventListener("message", (event) => {
+    const data = event.data;
+    if (!data || data.type !== "ou-frame-resize") {
+      return;
+    }
+    const height = Number(data.height);
+    if (!(height > 0)) {
+      return;
+    }
+    const iframe = findFrame(event);
+    if (!iframe) {
+      return;
+    }
+    pending.set(iframe, height);
+    if (!scheduled) {
+      scheduled = true;
+      window.requestAnimationFrame(flush);
+    }
   });
 
-}
+  return { flush: flush };
+})();
@@ -0,0 +1,53 @@
+/**
+ * Deferred activation of heavy interactive iframes.
+ *
+ * Frames rendered with an activation mode other than "eager" are emitted
+ * hidden, with a static preview and a data-src attribute in place of src,
+ * so their runtimes do not load with the page. The real src is attached
+ * when the learner clicks the activate button or, for "visible" frames,
+ * when the frame is about to scroll into view.
+ */
+(function () {
+  function activate(placeholder) {
+    const iframe = placeholder && placeholder.querySelector("iframe[data-src]");
+    if (!iframe) {
+      return;
+    }
+    iframe.src = iframe.dataset.src;
+    iframe.removeAttribute("data-src");
+    iframe.hidden = false;
+    placeholder.classList.add("ou-frame-active");
+  }
+
+  document.addEventListener("click", (event) => {
+    const button = event.target.closest(".ou-frame-activate");
+    if (button) {
+      activate(button.closest(".ou-frame-placeholder"));
+    }
+  });
+
+  document.addEventListener("DOMContentLoaded", () => {
+    const lazy = document.querySelectorAll(
+      '.ou-frame-placeholder[data-ou-activate="visible"]'
+    );
+    if (!lazy.length) {
+      return;
+    }
+    if (!("IntersectionObserver" in window)) {
+      lazy.forEach(activate);
+      return;
+    }
+    const observer = new IntersectionObserver(
+      (entries) => {
+        entries.forEach((entry) => {
+          if (entry.isIntersecting) {
+            observer.unobserve(entry.target);
+            activate(entry.target);
+          }
+        });
+      },
+      { rootMargin: "200px" }
+    );
+    lazy.forEach((placeholder) => observer.observe(placeholder));
+  });
+})();
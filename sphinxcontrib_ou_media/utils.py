@@ -1,4 +1,5 @@
 from importlib import resources as import_resources
+import functools
 import uuid
 
 
@@ -19,6 +20,12 @@ def fetch_template(*args, path=None):
         return None  # Handle the case where the file doesn't exist
 
 
+@functools.lru_cache(maxsize=None)
+def cached_template(*args):
+    """Fetch a template the first time it is used, then reuse it."""
+    return fetch_template(*args)
+
+
 def hack_uuid():
     while True:
         # Generate a random UUID
@@ -31,38 +38,245 @@ def hack_uuid():
 
 
 from pathlib import Path
-from sphinx.util.fileutil import copy_asset
+from typing import Dict, List, Set
+from sphinx.util import logging
+from sphinx.util.osutil import copyfile
+import hashlib
 import os
+import re
+import weakref
+
+logger = logging.getLogger(__name__)
+
+ASSET_KINDS: Dict[str, str] = {"js": "js", "css": "css"}
+"Static asset file suffix by subdirectory of the package static directory"
+
+ASSET_BUNDLE_STUB = "ou_bundle"
+"Stub of the bundled asset filenames, e.g. ou_bundle.<hash>.js"
+
+_asset_stubs: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_asset_bundles: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
 
 
 def handle_css_js_assets(app, stub):
-    """Copy over CSS and JS assets to relevant directory
-    and add links to HTML page."""
+    """Register an extension's CSS and JS assets for the shared bundle.
+
+    The assets of every enabled ou extension are concatenated, minified and
+    written as a single content-hashed JS and CSS file once an HTML builder
+    is ready, and only linked from pages that use an ou directive.
+    """
+    if app not in _asset_stubs:
+        _asset_stubs[app] = []
+        app.connect("builder-inited", write_asset_bundles)
+        app.connect("env-get-outdated", bundle_pages_outdated)
+        app.connect("html-page-context", add_asset_bundles)
+    if stub not in _asset_stubs[app]:
+        _asset_stubs[app].append(stub)
+
+
+def minify_js(source: str) -> str:
+    """Minify JavaScript, using rjsmin if it is installed.
+
+    Without rjsmin the source is returned as it is, as stripping comments
+    safely needs a full tokenizer (e.g. for template literals).
+    """
+    try:
+        import rjsmin
+
+        return rjsmin.jsmin(source)
+    except ImportError:
+        return source
+
 
+def minify_css(source: str) -> str:
+    """Minify CSS, using rcssmin if it is installed."""
+    try:
+        import rcssmin
+
+        return rcssmin.cssmin(source)
+    except ImportError:
+        pass
+    source = re.sub(r"/\*.*?\*/", "", source, flags=re.S)
+    source = re.sub(r"\s+", " ", source)
+    # Whitespace around ":" can be significant in selectors, so keep it
+    return re.sub(r"\s*([{};,])\s*", r"\1", source).strip() + "\n"
+
+
+def write_asset_bundles(app) -> None:
+    """Write the bundled assets of the registered extensions.
+
+    Bundles are named by a hash of their content, so browsers can cache them
+    indefinitely, and are only written when that content changes. Earlier
+    bundles are removed; the pages linking to them are rewritten, as
+    ``bundle_pages_outdated`` marks them as outdated.
+    """
+    if app.builder.format != "html":
+        return
     source_dir = os.path.join(resources_path(), "static")
     build_dir = os.path.join(app.outdir, "_static")
+    os.makedirs(build_dir, exist_ok=True)
+    minifiers = {"js": minify_js, "css": minify_css}
+    # Keep each script a separate statement when concatenated
+    separators = {"js": "\n;\n", "css": "\n"}
+    bundles = {}
+    for kind, suffix in ASSET_KINDS.items():
+        sources = []
+        for stub in _asset_stubs[app]:
+            path = os.path.join(source_dir, kind, f"{stub}.{suffix}")
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    sources.append(f.read())
+        if not sources:
+            continue
+        bundle = minifiers[kind](separators[kind].join(sources))
+        digest = hashlib.sha256(bundle.encode("utf-8")).hexdigest()[:12]
+        filename = f"{ASSET_BUNDLE_STUB}.{digest}.{suffix}"
+        for stale in Path(build_dir).glob(f"{ASSET_BUNDLE_STUB}.*.{suffix}"):
+            if stale.name != filename:
+                stale.unlink()
+        path = os.path.join(build_dir, filename)
+        if not os.path.exists(path):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(bundle)
+        bundles[kind] = filename
+    _asset_bundles[app] = bundles
 
-    js_file = f"{stub}.js"
-    css_file = f"{stub}.css"
 
-    # Copy JavaScript file
+def uses_ou_directive(env, docname: str) -> bool:
+    """Whether a document uses any ou directive, as recorded in the inventory."""
+    return bool(getattr(env, "ou_inventory", {}).get(docname))
 
-    _js_file = os.path.join(source_dir, "js", js_file)
-    if os.path.exists(_js_file):
-        copy_asset(
-            _js_file,
-            build_dir,
-            # app.builder,
-        )
 
-    _css_file = os.path.join(source_dir, "css", css_file)
-    # Copy CSS file
-    if os.path.exists(_css_file):
-        copy_asset(
-            _css_file,
-            build_dir,
-            # app.builder,
+def bundle_pages_outdated(app, env, added: Set[str], changed: Set[str],
+                          removed: Set[str]) -> List[str]:
+    """Return the pages that link to the asset bundles, if the bundles changed."""
+    if app.builder.format != "html":
+        return []
+    bundles = _asset_bundles.get(app, {})
+    previous = getattr(env, "ou_asset_bundles", None)
+    env.ou_asset_bundles = bundles
+    if previous == bundles:
+        return []
+    return sorted(docname for docname in getattr(env, "ou_inventory", {}) if docname not in removed)
+
+
+def add_asset_bundles(app, pagename, templatename, context, doctree) -> None:
+    """Link the asset bundles from pages that use an ou directive."""
+    bundles = _asset_bundles.get(app)
+    if not bundles or doctree is None or not uses_ou_directive(app.env, pagename):
+        return
+    # Builder files added here only apply to the current page
+    if "css" in bundles:
+        app.builder.add_css_file(bundles["css"])
+    if "js" in bundles:
+        app.builder.add_js_file(bundles["js"])
+
+
+FRAME_ACTIVATION_MODES: List[str] = ["eager", "click", "visible"]
+"Supported iframe activation modes"
+
+
+def get_activation(directive) -> str:
+    """Return the activation mode for a directive's iframe.
+
+    Uses the directive's ``activate`` option if set, falling back to the
+    ``ou_frame_activate`` config value. Raise a warning if the mode is not
+    supported and default to "eager".
+    """
+    activate = directive.options.get(
+        "activate", directive.config.ou_frame_activate
+    ).lower()
+    if activate not in FRAME_ACTIVATION_MODES:
+        logger.warning(
+            f'The provided activate ("{activate}") is not an accepted value. defaulting to "eager"'
         )
+        activate = "eager"
+    return activate
+
+
+def frame_placeholder_open(
+    attr: List[str], activate: str, preview: str, label: str
+) -> str:
+    """Return the opening HTML for an iframe that is only loaded on activation.
+
+    The iframe is emitted hidden and with ``data-src`` in place of ``src``,
+    preceded by a lightweight static preview and an activate button. The
+    ``ou_frames.js`` script attaches the real ``src`` on click or, for the
+    "visible" mode, when the frame scrolls into view.
+    """
+    attr = [f"data-{a}" if a.startswith("src=") else a for a in attr]
+    return (
+        f'<div class="ou-frame-placeholder" data-ou-activate="{activate}">'
+        f'<div class="ou-frame-preview">{preview}</div>'
+        f'<button type="button" class="ou-frame-activate">{label}</button>'
+        f"<iframe {' '.join(attr)} hidden>"
+    )
+
+
+def frame_placeholder_close() -> str:
+    """Return the closing HTML for a deferred iframe."""
+    return "</iframe></div>"
+
+
+def setup_frame_activation(app):
+    """Register the shared frame activation config value and assets.
+
+    Several extensions use deferred iframes, so only register once.
+    """
+    if "ou_frame_activate" not in app.config:
+        app.add_config_value("ou_frame_activate", "eager", "env")
+    handle_css_js_assets(app, "ou_frames")
+
+
+DRAFT_ENV = "OU_DRAFT"
+"Environment variable that selects draft mode, as an alternative to ou_draft"
+
+
+def is_draft(app) -> bool:
+    """Whether this is a draft (preview) HTML build.
+
+    Draft mode is selected by the ``ou_draft`` config value (which the
+    ``OU_DRAFT`` environment variable sets), and only applies to HTML builders.
+    """
+    if app.builder is None or app.builder.format != "html":
+        return False
+    return bool(getattr(app.config, "ou_draft", False))
+
+
+def copy_asset(source: str, target: str) -> None:
+    """Copy an asset to the output directory.
+
+    Unchanged assets are not copied again, and changed ones are overwritten.
+    """
+    copyfile(source, target, force=True)
+
+
+def draft_key(docname: str, index: int, *parts: str) -> str:
+    """Return a content hash to name a draft artifact by.
+
+    Draft artifacts are named by their document, position and content rather
+    than a random id, so an unchanged snippet reuses its output from the
+    previous build, while identical snippets on a page get frames of their own.
+    """
+    return hashlib.sha256("\0".join([docname, str(index), *parts]).encode()).hexdigest()[:32]
+
+
+def setup_draft_mode(app):
+    """Register the draft mode config value.
+
+    Several extensions produce artifacts, so only register once.
+    """
+    if "ou_draft" not in app.config:
+        app.add_config_value("ou_draft", False, "env")
+        app.connect("config-inited", draft_from_environment)
+
+
+def draft_from_environment(app, config) -> None:
+    """Set ``ou_draft`` from the ``OU_DRAFT`` environment variable.
 
-    app.add_css_file(css_file)
-    app.add_js_file(js_file)
+    Setting the config value, rather than checking the variable when it is
+    used, means a change of mode invalidates the environment like any other
+    "env" config change.
+    """
+    if os.environ.get(DRAFT_ENV, "").lower() in ("1", "true", "yes"):
+        config.ou_draft = True
@@ -0,0 +1,166 @@
+"""Validate OU-XML fragments against the OU-XML schema.
+
+Compiling the OU-XML schema takes a few seconds, so the compiled schema is
+pickled to ``SCHEMA_CACHE``, keyed by a hash of the schema files, and
+loaded from there by each worker of a process pool. The ``ouxml`` builder
+submits each document fragment to the pool once it is written; fragments
+whose content has not changed since they were last validated reuse the
+cached result.
+
+Each fragment is wrapped in a minimal ``Item`` for validation, since that is
+the only global element in the schema. Errors are reported against the
+fragment line of the element they concern.
+
+Validation needs the optional ``xmlschema`` package, and the OU-XML schema,
+taken from the ``schema`` ``ou`` setting or the ``ou-xml-validator``
+package.
+"""
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+from xml.parsers import expat
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_CACHE = os.path.join("_tmp", "ouxml-schema")
+"Directory that compiled schemas are pickled to"
+
+ITEM_WRAPPER = (
+    '<Item TextType="CompleteItem" SchemaVersion="2.0">'
+    "<CourseCode>X</CourseCode><CourseTitle>X</CourseTitle><ItemID/>"
+    "<ItemTitle>X</ItemTitle><Unit><UnitID>X</UnitID><UnitTitle>X</UnitTitle>"
+)
+"Start of the Item a fragment is validated in; it must not hold a newline"
+
+_schema = None
+
+
+def default_schema() -> Optional[str]:
+    """Return the schema shipped with the ou-xml-validator package, if any."""
+    try:
+        from importlib.resources import files
+
+        schema = files("ou_xml_validator").joinpath(
+            "schemas", "OUIntermediateSchema.xsd"
+        )
+    except (ImportError, ModuleNotFoundError):
+        return None
+    return str(schema) if schema.is_file() else None
+
+
+def compiled_schema(schema_path: str) -> str:
+    """Return the path of the pickled schema, compiling it on first use."""
+    import xmlschema
+
+    digest = hashlib.sha256(xmlschema.__version__.encode())
+    schema_dir = Path(schema_path).parent
+    for path in sorted(schema_dir.glob("**/*.xsd")):
+        digest.update(str(path.relative_to(schema_dir)).encode())
+        digest.update(path.read_bytes())
+    cache_path = os.path.join(SCHEMA_CACHE, f"{digest.hexdigest()[:16]}.pickle")
+    if not os.path.exists(cache_path):
+        logger.info("ouxml: compiling the OU-XML schema")
+        schema = xmlschema.XMLSchema(schema_path)
+        os.makedirs(SCHEMA_CACHE, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=SCHEMA_CACHE, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(schema, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    return cache_path
+
+
+def _load_schema(cache_path: str) -> None:
+    """Load the compiled schema in a pool worker."""
+    global _schema
+    with open(cache_path, "rb") as f:
+        _schema = pickle.load(f)
+
+
+def parse_with_lines(text: str) -> Tuple[ElementTree.Element, Dict]:
+    """Parse XML, returning the root and the line of each element."""
+    builder = ElementTree.TreeBuilder()
+    parser = expat.ParserCreate()
+    lines = {}
+
+    def start(tag, attrs):
+        lines[builder.start(tag, attrs)] = parser.CurrentLineNumber
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = builder.end
+    parser.CharacterDataHandler = builder.data
+    # Processing instructions (number markers) are dropped
+    parser.Parse(text, True)
+    return builder.close(), lines
+
+
+def validate_fragment(fragment_path: str, tag: str) -> List[Tuple[Optional[int], str]]:
+    """Validate a fragment, returning the fragment line and message of each error.
+
+    Section fragments are wrapped in a Session, as they are on assembly.
+    """
+    with open(fragment_path, encoding="utf-8") as f:
+        fragment = f.read()
+    if tag == "Section":
+        start, end = "<Session><Title>X</Title>", "</Session>"
+    else:
+        start, end = "", ""
+    try:
+        root, lines = parse_with_lines(f"{ITEM_WRAPPER}{start}{fragment}{end}</Unit></Item>")
+    except expat.ExpatError as err:
+        return [(err.lineno, f"not well-formed XML ({expat.ErrorString(err.code)})")]
+    errors = []
+    for error in _schema.iter_errors(root):
+        elem = error.elem
+        # Content errors are raised on the parent; report the child
+        index = getattr(error, "index", None)
+        if elem is not None and index is not None and index < len(elem):
+            elem = elem[index]
+        errors.append((lines.get(elem), error.reason or str(error)))
+    return errors
+
+
+class FragmentValidator:
+    """Validate fragments in a process pool, skipping unchanged ones."""
+
+    def __init__(self, schema_path: str, cache: Dict[str, Dict]):
+        self.cache_path = compiled_schema(schema_path)
+        self.cache = cache
+        "Fragment hash and errors, by docname"
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.jobs: Dict[str, Tuple[str, Future]] = {}
+
+    def submit(self, docname: str, fragment_path: str, tag: str) -> None:
+        """Validate a fragment, unless it is unchanged since it was last validated."""
+        with open(fragment_path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        cached = self.cache.get(docname)
+        if cached is not None and cached["hash"] == digest:
+            self.jobs.pop(docname, None)
+            return
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                initializer=_load_schema, initargs=(self.cache_path,)
+            )
+        self.jobs[docname] = (
+            digest,
+            self.pool.submit(validate_fragment, fragment_path, tag),
+        )
+
+    def results(self) -> Dict[str, List[Tuple[Optional[int], str]]]:
+        """Wait for the pool and return the errors of every fragment."""
+        for docname, (digest, future) in self.jobs.items():
+            self.cache[docname] = {"hash": digest, "errors": future.result()}
+        self.jobs = {}
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        return {docname: entry["errors"] for docname, entry in self.cache.items()}
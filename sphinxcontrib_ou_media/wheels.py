@@ -0,0 +1,238 @@
+"""Bundle local Pyodide wheels for the packages imported by code snippets.
+
+The thebelite runtime installs packages with piplite, which by default
+fetches its index and wheels from a CDN at run time. If a book configures
+a local wheel directory, the imports used by each snippet are resolved
+against it and the required wheels are bundled, with a piplite ``all.json``
+index, alongside the snippet so the kernel starts without network fetches.
+"""
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import ast
+import datetime
+import hashlib
+import os
+import re
+import sys
+import zipfile
+
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+PIPLITE_CDN = "https://unpkg.com/@jupyterlite/pyodide-kernel@0.0.7/pypi"
+
+DEFAULT_PIPLITE_SETTINGS: Dict[str, object] = {
+    "pipliteUrls": [f"{PIPLITE_CDN}/all.json"],
+    "pipliteWheelUrl": f"{PIPLITE_CDN}/piplite-0.0.7-py3-none-any.whl",
+}
+"piplite kernel settings used when no local wheels are bundled"
+
+WHEEL_PREFIX = "pypi"
+"Directory inside the artifact that bundled wheels are written to"
+
+STDLIB_MODULES: Set[str] = set(getattr(sys, "stdlib_module_names", ()))
+
+_index_cache: Dict[str, Tuple[int, "WheelIndex"]] = {}
+
+
+def normalize(name: str) -> str:
+    """Normalise a project name (PEP 503, with underscores)."""
+    return re.sub(r"[-_.]+", "_", name).lower()
+
+
+def scan_imports(code: str) -> Set[str]:
+    """Return the top-level, non-stdlib module names imported by a snippet."""
+    # Drop IPython magics and shell escapes, which are not valid Python
+    lines = [
+        line for line in code.splitlines() if not line.lstrip().startswith(("%", "!"))
+    ]
+    try:
+        tree = ast.parse("\n".join(lines))
+    except SyntaxError as err:
+        logger.warning(f"codestyle: could not scan snippet imports ({err})")
+        return set()
+    names: Set[str] = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.add(node.module.split(".")[0])
+    return names - STDLIB_MODULES
+
+
+class WheelIndex:
+    """Index of the wheels in a local directory.
+
+    Each wheel is opened once to find the top-level modules it provides and
+    the projects it requires.
+    """
+
+    def __init__(self, wheel_dir: str):
+        self.wheels: Dict[str, Path] = {}
+        "Wheel path by normalised project name"
+        self.modules: Dict[str, str] = {}
+        "Normalised project name by top-level import name"
+        self.requires: Dict[str, List[str]] = {}
+        "Required normalised project names by normalised project name"
+        self._releases: Dict[Path, Dict[str, object]] = {}
+
+        for path in sorted(Path(wheel_dir).glob("*.whl")):
+            project = normalize(path.name.split("-")[0])
+            self.wheels[project] = path
+            with zipfile.ZipFile(path) as whl:
+                names = whl.namelist()
+                for name in names:
+                    top = name.split("/")[0]
+                    if top.endswith((".dist-info", ".data")):
+                        continue
+                    if "/" in name:
+                        self.modules.setdefault(top, project)
+                    elif top.endswith((".py", ".so", ".pyd")):
+                        self.modules.setdefault(top.split(".")[0], project)
+                metadata = next(
+                    (n for n in names if n.endswith(".dist-info/METADATA")), None
+                )
+                self.requires[project] = (
+                    self._requirements(whl.read(metadata)) if metadata else []
+                )
+
+    @staticmethod
+    def _requirements(metadata: bytes) -> List[str]:
+        """Return the non-optional requirements listed in wheel metadata."""
+        requires = []
+        for line in metadata.decode("utf-8", "replace").splitlines():
+            if not line.startswith("Requires-Dist:"):
+                continue
+            requirement = line.split(":", 1)[1].strip()
+            if "extra ==" in requirement:
+                continue
+            requires.append(normalize(re.split(r"[\s;<>=!~\[(]", requirement, 1)[0]))
+        return requires
+
+    def resolve(self, imports: Iterable[str]) -> Tuple[List[Path], List[str]]:
+        """Return the wheels needed for the imports, including dependencies.
+
+        Returns:
+            the wheels, and the imports that no local wheel provides
+        """
+        pending = []
+        unresolved = []
+        for name in sorted(imports):
+            project = self.modules.get(name, normalize(name))
+            if project in self.wheels:
+                pending.append(project)
+            else:
+                unresolved.append(name)
+        found: Set[str] = set()
+        while pending:
+            project = pending.pop()
+            if project in found or project not in self.wheels:
+                continue
+            found.add(project)
+            pending.extend(self.requires.get(project, []))
+        return [self.wheels[project] for project in sorted(found)], unresolved
+
+    def piplite(self) -> Optional[Path]:
+        """Return the local piplite wheel, if there is one."""
+        return self.wheels.get("piplite")
+
+    def release(self, path: Path) -> Dict[str, object]:
+        """Return the piplite release entry for a wheel (cached).
+
+        The wheel URL is relative to the index itself.
+        """
+        if path not in self._releases:
+            data = path.read_bytes()
+            uploaded = datetime.datetime.fromtimestamp(
+                path.stat().st_mtime, datetime.timezone.utc
+            )
+            md5 = hashlib.md5(data).hexdigest()
+            self._releases[path] = {
+                "comment_text": "",
+                "digests": {"md5": md5, "sha256": hashlib.sha256(data).hexdigest()},
+                "downloads": -1,
+                "filename": path.name,
+                "has_sig": False,
+                "md5_digest": md5,
+                "packagetype": "bdist_wheel",
+                "python_version": "py3",
+                "requires_python": None,
+                "size": len(data),
+                "upload_time": uploaded.strftime("%Y-%m-%dT%H:%M:%S"),
+                "upload_time_iso_8601": uploaded.isoformat(),
+                "url": f"./{path.name}",
+                "yanked": False,
+                "yanked_reason": None,
+            }
+        return self._releases[path]
+
+    def piplite_index(self, wheels: List[Path]) -> Dict[str, object]:
+        """Return a piplite ``all.json`` index for the given wheels."""
+        index: Dict[str, Dict[str, Dict[str, list]]] = {}
+        for path in wheels:
+            name, version = path.name.split("-")[:2]
+            project = index.setdefault(name.lower().replace("_", "-"), {"releases": {}})
+            project["releases"].setdefault(version, []).append(self.release(path))
+        return index
+
+
+def get_wheel_index(wheel_dir: str) -> WheelIndex:
+    """Return the (cached) index of a wheel directory.
+
+    The index is rebuilt only if the directory has changed.
+    """
+    mtime = os.stat(wheel_dir).st_mtime_ns
+    cached = _index_cache.get(wheel_dir)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, WheelIndex(wheel_dir))
+        _index_cache[wheel_dir] = cached
+    return cached[1]
+
+
+def bundle_wheels(
+    code: str, wheel_dir: str, location=None
+) -> Tuple[Dict[str, object], List[Path], Dict[str, object]]:
+    """Resolve a snippet's imports against a local wheel directory.
+
+    Args:
+        code: the snippet source
+        wheel_dir: the local wheel directory, or an empty value for none
+        location: where the snippet is, for log messages
+
+    Returns:
+        the piplite kernel settings, the wheels to bundle under
+        ``WHEEL_PREFIX``, and the piplite index for them
+    """
+    if not wheel_dir:
+        return dict(DEFAULT_PIPLITE_SETTINGS), [], {}
+    if not os.path.isdir(wheel_dir):
+        logger.warning(f"codestyle: wheel directory {wheel_dir} not found")
+        return dict(DEFAULT_PIPLITE_SETTINGS), [], {}
+
+    wheel_index = get_wheel_index(wheel_dir)
+    wheels, unresolved = wheel_index.resolve(scan_imports(code))
+    settings: Dict[str, object] = {
+        "pipliteUrls": [f"./{WHEEL_PREFIX}/all.json"],
+        # Only install what was bundled, unless some imports can only come from PyPI
+        "disablePyPIFallback": not unresolved,
+        "pipliteWheelUrl": DEFAULT_PIPLITE_SETTINGS["pipliteWheelUrl"],
+    }
+    if unresolved:
+        logger.info(
+            f"codestyle: no local wheel for imports {', '.join(unresolved)}; "
+            "they will be installed from PyPI at run time",
+            location=location,
+        )
+    piplite = wheel_index.piplite()
+    if piplite is not None:
+        wheels = sorted(set(wheels) | {piplite})
+        settings["pipliteWheelUrl"] = f"./{WHEEL_PREFIX}/{piplite.name}"
+    else:
+        logger.info(
+            f"codestyle: no piplite wheel in {wheel_dir}; "
+            "piplite will be fetched at run time"
+        )
+    return settings, wheels, wheel_index.piplite_index(wheels)
@@ -0,0 +1,92 @@
+"""Small Sphinx books, built in a temporary directory."""
+
+from io import StringIO
+from pathlib import Path
+from textwrap import dedent
+
+import shutil
+
+import pytest
+from sphinx.application import Sphinx
+
+from sphinxcontrib_ou_media import fingerprints, runtimes, utils
+
+CONF = """\
+extensions = ["sphinxcontrib_ou_media"]
+exclude_patterns = ["_build", "_tmp"]
+"""
+
+
+class Book:
+    """A book directory, which is also the working directory, as in a real build."""
+
+    def __init__(self, root: Path):
+        self.srcdir = root
+        self.warnings = StringIO()
+        self.write("conf.py", CONF)
+
+    def write(self, name: str, text: str) -> Path:
+        """Write a source file, leaving it alone (and its mtime) if it is unchanged."""
+        path = self.srcdir / name
+        text = dedent(text)
+        if not path.exists() or path.read_text() != text:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(text)
+        return path
+
+    def outdir(self, buildername: str = "html") -> Path:
+        return self.srcdir / "_build" / buildername
+
+    def build(self, buildername: str = "html", parallel: int = 0, **confoverrides) -> Sphinx:
+        app = Sphinx(
+            str(self.srcdir),
+            str(self.srcdir),
+            str(self.outdir(buildername)),
+            str(self.srcdir / "_build" / "doctrees"),
+            buildername,
+            confoverrides=confoverrides,
+            status=None,
+            warning=self.warnings,
+            parallel=parallel,
+        )
+        app.build()
+        return app
+
+    def read_source(self, name: str) -> str:
+        return (self.srcdir / name).read_text(encoding="utf-8")
+
+    def read(self, name: str, buildername: str = "html") -> str:
+        return (self.outdir(buildername) / name).read_text(encoding="utf-8")
+
+
+@pytest.fixture
+def book(tmp_path, monkeypatch) -> Book:
+    monkeypatch.chdir(tmp_path)
+    return Book(tmp_path)
+
+
+@pytest.fixture
+def package_resources(tmp_path, monkeypatch):
+    """Return a function that makes editable copies of package resources.
+
+    The other package resources are linked, not copied.
+    """
+    package = Path(str(utils.resources_path()))
+    resources = tmp_path / "resources"
+    resources.mkdir()
+    for entry in package.iterdir():
+        (resources / entry.name).symlink_to(entry)
+    resources_path = utils.resources_path
+
+    def package_resources_path(path=None):
+        return resources if path is None else resources_path(path)
+
+    for module in (utils, fingerprints, runtimes):
+        monkeypatch.setattr(module, "resources_path", package_resources_path)
+
+    def copy(name: str) -> Path:
+        (resources / name).unlink()
+        shutil.copytree(package / name, resources / name)
+        return resources / name
+
+    return copy
@@ -0,0 +1,110 @@
+"""Activity components and choice questions, in HTML and other formats."""
+
+from xml.etree import ElementTree
+
+import json
+import re
+
+QUIZ = """\
+Quiz
+====
+
+.. ou-activity:: Capitals
+   :timing: 5 minutes
+
+   Which is the capital of France?
+
+   .. ou-interaction::
+      :type: single
+      :id: capital
+
+      T Paris :: Yes, it is.
+      F Lyon
+
+   .. ou-answer::
+
+      Paris.
+
+.. ou-interaction::
+   :type: multiple
+   :id: colours
+
+   T Red
+   F Blue :: Not this one.
+"""
+
+OPTIONS = {
+    "capital": {
+        "type": "single",
+        "options": [
+            {"correct": True, "text": "Paris", "feedback": "Yes, it is."},
+            {"correct": False, "text": "Lyon", "feedback": None},
+        ],
+    },
+    "colours": {
+        "type": "multiple",
+        "options": [
+            {"correct": True, "text": "Red", "feedback": None},
+            {"correct": False, "text": "Blue", "feedback": "Not this one."},
+        ],
+    },
+}
+
+
+def interaction_data(html: str):
+    islands = re.findall(
+        r'<script type="application/json" class="ou-interaction-data">(.*?)</script>', html
+    )
+    assert len(islands) == 1
+    return json.loads(islands[0])
+
+
+def test_html_activity_and_choices(book):
+    book.write("index.rst", QUIZ)
+    book.build()
+    html = book.read("index.html")
+
+    # Activities get a title block and answers a toggle
+    assert '<div class="ou-activity-title docutils container">' in html
+    assert '<button class="sd-btn sd-btn-info ou-toggle ou-toggle-hidden">' in html
+    # Choice questions are placeholders, built from one JSON island per page
+    assert re.findall(r'data-ou-interaction="(\w+)"', html) == ["capital", "colours"]
+    assert interaction_data(html) == OPTIONS
+    assert 'design_component' not in html and "Paris :: " not in html
+
+
+def test_other_formats_get_right_wrong_and_feedback(book):
+    book.write("index.rst", QUIZ)
+    book.build("xml")
+    document = ElementTree.fromstring(book.read("index.xml", "xml").encode("utf-8"))
+
+    def component(node):
+        return node.get("design_component")
+
+    questions = [
+        node for node in document.iter("container") if component(node) == "ou-interaction"
+    ]
+    expanded = []
+    for question in questions:
+        responses = []
+        for response in question:
+            feedback = [child.text.strip() for child in response if component(child) == "Feedback"]
+            responses.append((component(response), response.text.strip(), feedback))
+        expanded.append(responses)
+    assert expanded == [
+        [("Right", "Paris", ["Yes, it is."]), ("Wrong", "Lyon", [])],
+        [("Right", "Red", []), ("Wrong", "Blue", ["Not this one."])],
+    ]
+    # Activities are left for the format to lay out
+    assert [component(node) for node in document.iter("container")][:2] == [
+        "ou-activity", "ou-title"
+    ]
+
+
+def test_duplicate_interaction_ids_warn(book):
+    book.write("index.rst", QUIZ.replace(":id: colours", ":id: capital"))
+    book.build()
+    warnings = book.warnings.getvalue()
+    assert "index.rst:20: WARNING: ou-interaction: duplicate id 'capital'" in warnings
+    # The first question keeps its options
+    assert interaction_data(book.read("index.html")) == {"capital": OPTIONS["capital"]}
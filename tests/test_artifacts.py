@@ -0,0 +1,97 @@
+"""Artifact jobs, run by several local worker processes sharing a directory."""
+
+from pathlib import Path
+from types import SimpleNamespace
+
+import json
+import os
+import subprocess
+import sys
+import zipfile
+
+from sphinxcontrib_ou_media.artifacts import (
+    JOB_LIST,
+    export_jobs,
+    result_path,
+    run_job,
+    snippet_job,
+    submit_job,
+)
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+JOBS_DIR = os.path.join("_tmp", "jobs")
+
+
+def make_build(book: Path):
+    config = SimpleNamespace(
+        ou_artifact_jobs=JOBS_DIR,
+        ou_codestyle_runtime_url="",
+        ou_shinylite_packages=[],
+    )
+    app = SimpleNamespace(config=config, outdir=str(book / "_build" / "html"))
+    env = SimpleNamespace(config=config, docname="index")
+    return app, env
+
+
+def test_jobs_run_by_sharded_workers(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    app, env = make_build(tmp_path)
+    jobs = [
+        snippet_job(
+            "pyodide-terminal", os.path.join("_tmp", f"PT-{n}.zip"), app.config, app.outdir,
+            {"index.html": f"<p>snippet {n}</p>"},
+        )
+        for n in range(4)
+    ]
+    for job in jobs:
+        # Jobs must not depend on where the book directory is
+        assert not os.path.isabs(job["outdir"])
+        submit_job(env, job)
+
+    export_jobs(app, env)
+    with open(os.path.join(JOBS_DIR, JOB_LIST), encoding="utf-8") as f:
+        assert len(json.load(f)["jobs"]) == 4
+    assert not any(os.path.exists(job["target"]) for job in jobs)
+
+    worker_env = dict(os.environ, PYTHONPATH=str(REPO_ROOT))
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-m", "sphinxcontrib_ou_media.artifacts", JOBS_DIR,
+             "--shard", f"{index}/2"],
+            cwd=tmp_path, env=worker_env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        for index in (1, 2)
+    ]
+    for worker in workers:
+        _, stderr = worker.communicate(timeout=120)
+        assert worker.returncode == 0, stderr.decode()
+
+    # The next build places every result and has nothing left to export
+    export_jobs(app, env)
+    with open(os.path.join(JOBS_DIR, JOB_LIST), encoding="utf-8") as f:
+        assert json.load(f)["jobs"] == []
+    for n, job in enumerate(jobs):
+        with zipfile.ZipFile(job["target"]) as zipf:
+            assert zipf.read("index.html").decode() == f"<p>snippet {n}</p>"
+            assert "ou-pyodide-terminal.js" in zipf.namelist()
+
+
+def test_published_copy_follows_the_result(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    app, env = make_build(tmp_path)
+    os.makedirs(app.outdir)
+    published = os.path.join(app.outdir, "PT.zip")
+    for n in range(2):
+        # The same target, generated from a changed snippet in the next build
+        job = snippet_job(
+            "pyodide-terminal", os.path.join("_tmp", "PT.zip"), app.config, app.outdir,
+            {"index.html": f"<p>version {n}</p>"},
+        )
+        job["publish"] = "PT.zip"
+        env.ou_artifact_jobs = {}
+        submit_job(env, job)
+        run_job(job, result_path(JOBS_DIR, job))
+        export_jobs(app, env)
+        with zipfile.ZipFile(published) as zipf:
+            assert zipf.read("index.html").decode() == f"<p>version {n}</p>"
@@ -0,0 +1,75 @@
+"""Bundled static assets, linked only from pages that use an ou directive."""
+
+from pathlib import Path
+
+import re
+
+INDEX = """\
+Book
+====
+
+.. toctree::
+
+   ch1
+   ch2
+   plain
+"""
+
+ACTIVITY_PAGE = """\
+{title}
+===
+
+.. ou-activity:: Try it
+
+   Do the thing.
+"""
+
+PLAIN_PAGE = """\
+Plain
+=====
+
+No directives here.
+"""
+
+
+def bundle_links(html: str):
+    return re.findall(r'_static/(ou_bundle\.[0-9a-f]+\.(?:js|css))', html)
+
+
+def write_book(book):
+    book.write("index.rst", INDEX)
+    book.write("ch1.rst", ACTIVITY_PAGE.format(title="One"))
+    book.write("ch2.rst", ACTIVITY_PAGE.format(title="Two"))
+    book.write("plain.rst", PLAIN_PAGE)
+
+
+def test_bundle_linked_only_from_pages_with_directives(book):
+    write_book(book)
+    book.build()
+    links = bundle_links(book.read("ch1.html"))
+    assert {Path(name).suffix for name in links} == {".js", ".css"}
+    assert bundle_links(book.read("plain.html")) == []
+    assert bundle_links(book.read("index.html")) == []
+    for name in links:
+        assert (book.outdir() / "_static" / name).exists()
+
+
+def test_changed_bundle_rewrites_every_page_that_links_it(book, package_resources):
+    static = package_resources("static")
+
+    write_book(book)
+    book.build()
+    old = set(bundle_links(book.read("ch2.html")))
+
+    with open(static / "js" / "ou_activities.js", "a") as f:
+        f.write("\nconsole.log('changed');\n")
+    # Only ch1 changes, but ch2 links the bundle too
+    book.write("ch1.rst", ACTIVITY_PAGE.format(title="One again"))
+    book.build()
+
+    new = set(bundle_links(book.read("ch2.html")))
+    assert new != old
+    assert new == set(bundle_links(book.read("ch1.html")))
+    bundles = {path.name for path in (book.outdir() / "_static").glob("ou_bundle.*")}
+    # Earlier bundles are removed, and every linked bundle exists
+    assert bundles == new
@@ -0,0 +1,59 @@
+"""Precompressed copies of the static files the extensions write."""
+
+import gzip
+
+import pytest
+
+PAGE = """\
+Book
+====
+
+.. ou-activity:: Try it
+
+   Do the thing.
+"""
+
+
+def compressed(outdir, suffix):
+    return sorted(
+        path.relative_to(outdir).as_posix()[:-len(suffix)] for path in outdir.rglob(f"*{suffix}")
+    )
+
+
+def test_only_matched_files_are_compressed(book):
+    book.write("index.rst", PAGE)
+    book.build(ou_precompress=True)
+    outdir = book.outdir()
+
+    gz = compressed(outdir, ".gz")
+    assert gz and all(name.startswith("_static/ou_bundle.") for name in gz)
+    assert {name.rsplit(".", 1)[1] for name in gz} == {"js", "css"}
+    for name in gz:
+        data = (outdir / name).read_bytes()
+        assert gzip.decompress((outdir / f"{name}.gz").read_bytes()) == data
+    assert compressed(outdir, ".br") == []
+
+    # Further files are only compressed once they are matched
+    book.build(
+        ou_precompress=True, ou_precompress_patterns=[r"index\.html$"], ou_precompress_min_size=0
+    )
+    assert compressed(outdir, ".gz") == sorted(gz + ["index.html"])
+
+
+def test_nothing_is_compressed_unless_enabled(book):
+    book.write("index.rst", PAGE)
+    book.build()
+    assert compressed(book.outdir(), ".gz") == []
+
+
+def test_brotli_copies(book):
+    brotli = pytest.importorskip("brotli")
+    book.write("index.rst", PAGE)
+    book.build(ou_precompress=True, ou_precompress_brotli=True)
+    outdir = book.outdir()
+
+    br = compressed(outdir, ".br")
+    assert br == compressed(outdir, ".gz")
+    for name in br:
+        data = (outdir / name).read_bytes()
+        assert brotli.decompress((outdir / f"{name}.br").read_bytes()) == data
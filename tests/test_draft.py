@@ -0,0 +1,30 @@
+"""Draft builds, for fast previews."""
+
+import re
+
+SNIPPET = """\
+
+.. ou-codestyle:: python
+   :type: thebelite
+
+   print("hello")
+"""
+
+
+def frame_names(html: str):
+    return re.findall(r'name="(ou-frame-[0-9a-f]+)"', html)
+
+
+def test_identical_snippets_get_their_own_frames(book):
+    book.write("index.rst", "Book\n====\n" + SNIPPET * 2)
+    book.write("other.rst", "Other\n=====\n" + SNIPPET)
+    book.build(ou_draft=True)
+    index, other = frame_names(book.read("index.html")), frame_names(book.read("other.html"))
+    assert len(set(index + other)) == 3
+    for name in index + other:
+        assert (book.outdir() / name.replace("ou-frame-", "JL-") / "index.html").exists()
+
+    # Unchanged snippets keep their names, so their output is reused
+    book.write("index.rst", "Book\n====\n" + SNIPPET * 2 + "\nMore text.\n")
+    book.build(ou_draft=True)
+    assert frame_names(book.read("index.html")) == index
@@ -0,0 +1,40 @@
+"""Snippets run at build time, with their output cached across builds."""
+
+import shutil
+
+PAGE = """\
+Snippet
+=======
+
+.. ou-codestyle:: python
+   :type: pyodide-terminal
+
+   with open("runs.txt", "a") as f:
+       f.write("run\\n")
+   print("hello from the build")
+"""
+
+OUTPUT = '<pre class="ou-static-output ou-static-output-ok">hello from the build\n</pre>'
+
+
+def test_cached_output_is_reused(book):
+    book.write("index.rst", PAGE)
+    runs = book.srcdir / "runs.txt"
+
+    book.build(ou_codestyle_execute=True)
+    assert OUTPUT in book.read("index.html")
+    assert runs.read_text() == "run\n"
+
+    # Read again, and written from a clean build directory: the output is reused
+    book.write("index.rst", PAGE + "\nMore text.\n")
+    book.build(ou_codestyle_execute=True)
+    shutil.rmtree(book.srcdir / "_build")
+    book.build(ou_codestyle_execute=True)
+    assert OUTPUT in book.read("index.html")
+    assert runs.read_text() == "run\n"
+
+    # Changed code runs again
+    book.write("index.rst", PAGE.replace("hello from", "goodbye from"))
+    book.build(ou_codestyle_execute=True)
+    assert "goodbye from the build" in book.read("index.html")
+    assert runs.read_text() == "run\nrun\n"
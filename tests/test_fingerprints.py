@@ -0,0 +1,56 @@
+"""Documents are read again when the templates or runtimes they use change."""
+
+INDEX = """\
+Book
+====
+
+.. toctree::
+
+   thebe
+   code
+   plain
+"""
+
+SNIPPET = """\
+{title}
+=====
+
+.. ou-codestyle:: python
+   :type: {type}
+
+   print("hello")
+"""
+
+PLAIN = """\
+Plain
+=====
+
+No snippets here.
+"""
+
+DOCS = ["thebe", "code", "plain"]
+
+
+def doctree_times(book):
+    doctrees = book.srcdir / "_build" / "doctrees"
+    return {docname: (doctrees / f"{docname}.doctree").stat().st_mtime_ns for docname in DOCS}
+
+
+def test_changed_template_rereads_only_the_pages_using_it(book, package_resources):
+    assets = package_resources("assets")
+    book.write("index.rst", INDEX)
+    book.write("thebe.rst", SNIPPET.format(title="Thebe", type="thebelite"))
+    book.write("code.rst", SNIPPET.format(title="Code", type="code"))
+    book.write("plain.rst", PLAIN)
+    book.build()
+    before = doctree_times(book)
+
+    # Nothing changed: nothing is read again
+    book.build()
+    assert doctree_times(book) == before
+
+    template = assets / "html-zip-resources" / "templates" / "ou-thebe-lite-index.html"
+    template.write_text(template.read_text() + "<!-- changed -->\n")
+    book.build()
+    after = doctree_times(book)
+    assert [docname for docname in DOCS if after[docname] != before[docname]] == ["thebe"]
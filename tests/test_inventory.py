@@ -0,0 +1,59 @@
+"""The directive inventory, kept up to date across parallel and incremental reads."""
+
+from sphinxcontrib_ou_media.inventory import INVENTORY, Inventory
+
+# Enough documents for Sphinx to read them in parallel
+CHAPTERS = [f"ch{n}" for n in range(8)]
+
+CHAPTER = """\
+Chapter {n}
+==========
+
+.. ou-activity:: Activity {n}
+
+   Do thing {n}.
+
+.. ou-audio:: clip{n}.mp3
+"""
+
+
+def write_book(book, chapters):
+    book.write("index.rst", "Book\n====\n\n.. toctree::\n\n" + "".join(f"   {c}\n" for c in chapters))
+    for n, chapter in enumerate(chapters):
+        book.write(f"{chapter}.rst", CHAPTER.format(n=n))
+        (book.srcdir / f"clip{n}.mp3").write_bytes(b"\xff\xfb\x90\x00" + b"\0" * 413)
+
+
+def load(book) -> Inventory:
+    return Inventory.load(str(book.outdir() / INVENTORY))
+
+
+def test_parallel_reads_are_merged(book):
+    write_book(book, CHAPTERS)
+    book.build(parallel=2)
+    inventory = load(book)
+    assert sorted(inventory.docs) == CHAPTERS
+    for n, chapter in enumerate(CHAPTERS):
+        assert [(e["directive"], e["line"]) for e in inventory.by_doc(chapter)] == [
+            ("ou-activity", 4), ("ou-audio", 8)
+        ]
+        assert [e["doc"] for e in inventory.using_asset(f"clip{n}.mp3")] == [chapter]
+    assert len(inventory.by_directive("ou-activity")) == len(CHAPTERS)
+
+
+def test_changed_and_removed_documents_are_purged(book):
+    write_book(book, CHAPTERS)
+    book.build(parallel=2)
+
+    # A directive is dropped from one chapter, and another chapter is removed
+    book.write("ch1.rst", "Chapter 1\n==========\n\nNo directives now.\n")
+    (book.srcdir / "ch2.rst").unlink()
+    book.write("index.rst", book.read_source("index.rst").replace("   ch2\n", ""))
+    book.build(parallel=2)
+
+    inventory = load(book)
+    assert inventory.by_doc("ch1") == [] and inventory.by_doc("ch2") == []
+    assert sorted(inventory.docs) == [c for c in CHAPTERS if c not in ("ch1", "ch2")]
+    # Unchanged documents keep their entries, without duplicates
+    assert len(inventory.by_directive("ou-audio")) == len(CHAPTERS) - 2
+    assert inventory.using_asset("clip2.mp3") == []
@@ -0,0 +1,132 @@
+"""MP3 rewriting, checked against a synthetic file."""
+
+import struct
+
+import pytest
+
+from sphinxcontrib_ou_media.mp3 import (
+    clip_mp3,
+    id3_frames,
+    parse_time,
+    read_id3v2,
+    slim_mp3,
+    synchsafe,
+    to_synchsafe,
+)
+
+# MPEG-1 layer III, 128 kbit/s, 44.1 kHz, no padding: 417 byte frames of 1152 samples
+FRAME_HEADER = b"\xff\xfb\x90\x00"
+FRAME_SIZE = 417
+FRAME_DURATION = 1152 / 44100
+
+
+def id3_frame(frame_id: str, payload: bytes) -> bytes:
+    # ID3v2.3 frame sizes are plain big-endian integers
+    return frame_id.encode() + struct.pack(">I", len(payload)) + b"\0\0" + payload
+
+
+def audio_frames(count: int) -> bytes:
+    # Each frame is filled with its number, so frames can be told apart
+    return b"".join(
+        FRAME_HEADER + bytes([n % 256]) * (FRAME_SIZE - len(FRAME_HEADER)) for n in range(count)
+    )
+
+
+def make_mp3(path, frames: int = 200, picture: bool = True) -> bytes:
+    tag_frames = id3_frame("TIT2", b"\0A title")
+    if picture:
+        tag_frames += id3_frame("APIC", b"\0image/png\0\x03\0" + b"\x89PNG" * 1000)
+    body = tag_frames + b"\0" * 512
+    audio = audio_frames(frames)
+    path.write_bytes(b"ID3\x03\0\0" + to_synchsafe(len(body)) + body + audio)
+    return audio
+
+
+def test_synchsafe_round_trip():
+    for value in (0, 127, 128, 1 << 20, (1 << 28) - 1):
+        assert synchsafe(to_synchsafe(value)) == value
+
+
+def test_slim_drops_pictures_and_padding(tmp_path):
+    source, target = tmp_path / "in.mp3", tmp_path / "out.mp3"
+    audio = make_mp3(source)
+    assert slim_mp3(str(source), str(target)) == {"removed": ["APIC"]}
+
+    with open(target, "rb") as f:
+        header, body, size = read_id3v2(f)
+        rest = f.read()
+    assert [frame_id for frame_id, _ in id3_frames(header, body)] == ["TIT2"]
+    assert size == 10 + len(id3_frame("TIT2", b"\0A title"))
+    assert rest == audio
+
+
+def test_slim_leaves_files_without_pictures(tmp_path):
+    source = tmp_path / "in.mp3"
+    make_mp3(source, picture=False)
+    target = tmp_path / "out.mp3"
+    # Only padding to remove: still smaller
+    assert slim_mp3(str(source), str(target)) == {"removed": []}
+    assert slim_mp3(str(target), str(tmp_path / "again.mp3")) is None
+
+
+def test_slim_leaves_files_without_tags(tmp_path):
+    source = tmp_path / "in.mp3"
+    source.write_bytes(audio_frames(10))
+    assert slim_mp3(str(source), str(tmp_path / "out.mp3")) is None
+
+
+@pytest.mark.parametrize("major", [2, 3])
+def test_unsynchronised_tags_are_not_split(major):
+    header = b"ID3" + bytes([major, 0, 0x80]) + to_synchsafe(0)
+    assert id3_frames(header, b"") is None
+
+
+@pytest.mark.parametrize(
+    "value, seconds", [("90", 90.0), ("1:30", 90.0), ("0:01:30.5", 90.5), (" 2.25 ", 2.25)]
+)
+def test_parse_time(value, seconds):
+    assert parse_time(value) == seconds
+
+
+def test_parse_time_rejects_negative_times():
+    with pytest.raises(ValueError):
+        parse_time("-1")
+
+
+def test_clip_keeps_whole_frames_overlapping_the_range(tmp_path):
+    source, target = tmp_path / "in.mp3", tmp_path / "out.mp3"
+    audio = make_mp3(source)
+    summary = clip_mp3(str(source), str(target), 1.0, 2.0)
+
+    # Frame 38 starts just before 1 s; frame 76 is the last to start before 2 s
+    first, last = 38, 76
+    assert first * FRAME_DURATION <= 1.0 < (first + 1) * FRAME_DURATION
+    assert last * FRAME_DURATION < 2.0 <= (last + 1) * FRAME_DURATION
+    assert target.read_bytes() == audio[first * FRAME_SIZE:(last + 1) * FRAME_SIZE]
+    assert summary == {
+        "start": round(first * FRAME_DURATION, 3),
+        "end": round((last + 1) * FRAME_DURATION, 3),
+    }
+
+
+def test_clip_to_the_end(tmp_path):
+    source, target = tmp_path / "in.mp3", tmp_path / "out.mp3"
+    audio = make_mp3(source, frames=100)
+    clip_mp3(str(source), str(target), 2.0)
+    assert target.read_bytes() == audio[76 * FRAME_SIZE:]
+
+
+def test_clip_skips_the_info_frame(tmp_path):
+    source, target = tmp_path / "in.mp3", tmp_path / "out.mp3"
+    info = FRAME_HEADER + b"\0" * 32 + b"Info" + b"\0" * (FRAME_SIZE - 40)
+    audio = audio_frames(10)
+    source.write_bytes(info + audio)
+    assert clip_mp3(str(source), str(target), 0.0, 0.05)["start"] == 0.0
+    assert target.read_bytes() == audio[:2 * FRAME_SIZE]
+
+
+def test_clip_after_the_audio_is_an_error(tmp_path):
+    source = tmp_path / "in.mp3"
+    make_mp3(source, frames=10)
+    with pytest.raises(ValueError, match="no audio"):
+        clip_mp3(str(source), str(tmp_path / "out.mp3"), 5.0, 6.0)
@@ -0,0 +1,160 @@
+"""MP4 rewriting, checked against the sample video in the docs."""
+
+from pathlib import Path
+from typing import Dict, List
+
+import struct
+
+import pytest
+
+from sphinxcontrib_ou_media.mp4 import (
+    SAMPLE_SYNC,
+    SLIMMED_BOXES,
+    Track,
+    fragment_mp4,
+    parse_boxes,
+    read_moov,
+    slim_mp4,
+    top_level_boxes,
+)
+
+TEST_MP4 = Path(__file__).resolve().parents[1] / "docs" / "resources" / "test.mp4"
+
+
+def read_tracks(path) -> List[Track]:
+    with open(path, "rb") as f:
+        moov = read_moov(f, list(top_level_boxes(f)))
+    return [Track(trak) for trak in moov.find_all("trak")]
+
+
+def sample_data(path, track: Track) -> List[bytes]:
+    with open(path, "rb") as f:
+        samples = []
+        for offset, size in zip(track.offsets, track.sizes):
+            f.seek(offset)
+            samples.append(f.read(size))
+    return samples
+
+
+@pytest.fixture
+def source_tracks():
+    return read_tracks(TEST_MP4)
+
+
+def test_slim_drops_boxes_and_keeps_samples(tmp_path, source_tracks):
+    target = tmp_path / "slim.mp4"
+    summary = slim_mp4(str(TEST_MP4), str(target))
+    assert summary is not None
+    with open(target, "rb") as f:
+        boxes = list(top_level_boxes(f))
+        moov = read_moov(f, boxes)
+    assert not {box_type for box_type, *_ in boxes} & SLIMMED_BOXES
+    assert not moov.find("udta")
+    assert target.stat().st_size < TEST_MP4.stat().st_size
+
+    # Chunk offsets were moved to match, so every sample reads back the same
+    for source, slimmed in zip(source_tracks, read_tracks(target)):
+        assert slimmed.sizes == source.sizes
+        assert sample_data(target, slimmed) == sample_data(TEST_MP4, source)
+
+
+def test_slim_leaves_slimmed_files(tmp_path):
+    target = tmp_path / "slim.mp4"
+    slim_mp4(str(TEST_MP4), str(target))
+    assert slim_mp4(str(target), str(tmp_path / "again.mp4")) is None
+
+
+def read_fragments(path) -> Dict[int, Dict[str, list]]:
+    """Rebuild each track's samples from the moof boxes of a fragmented file."""
+    tracks: Dict[int, Dict[str, list]] = {}
+    data = Path(path).read_bytes()
+    with open(path, "rb") as f:
+        boxes = list(top_level_boxes(f))
+    for (box_type, offset, header, size), following in zip(boxes, boxes[1:]):
+        if box_type != "moof":
+            continue
+        # Sample data must lie in the mdat that follows the moof
+        mdat_start, mdat_end = following[1] + following[2], following[1] + following[3]
+        assert following[0] == "mdat"
+        for traf in parse_boxes(data[offset + header:offset + size]):
+            if traf.type != "traf":
+                continue
+            children = {box.type: box for box in parse_boxes(traf.data)}
+            tfhd_flags, track_id = struct.unpack_from(">II", children["tfhd"].data)
+            assert tfhd_flags & 0x020000  # default-base-is-moof
+            track = tracks.setdefault(
+                track_id, {"data": [], "durations": [], "offsets": [], "sync": [], "bases": [], "starts": []}
+            )
+            track["bases"].append(struct.unpack_from(">Q", children["tfdt"].data, 4)[0])
+            trun = children["trun"].data
+            version, flags = trun[0], int.from_bytes(trun[1:4], "big")
+            count, data_offset = struct.unpack_from(">Ii", trun, 4)
+            track["starts"].append(len(track["data"]))
+            fields = 3 + bool(flags & 0x000800)
+            position = offset + data_offset
+            for index in range(count):
+                sample = struct.unpack_from(
+                    ">IIIi" if version else ">IIII", trun, 12 + 4 * fields * index
+                )[:fields]
+                assert mdat_start <= position and position + sample[1] <= mdat_end
+                track["data"].append(data[position:position + sample[1]])
+                track["durations"].append(sample[0])
+                track["sync"].append(sample[2] == SAMPLE_SYNC)
+                track["offsets"].append(sample[3] if fields == 4 else 0)
+                position += sample[1]
+    return tracks
+
+
+def test_fragment_round_trips_samples(tmp_path, source_tracks):
+    target = tmp_path / "fragmented.mp4"
+    summary = fragment_mp4(str(TEST_MP4), str(target), duration=2.0)
+    fragments = read_fragments(target)
+    assert summary["fragments"] == len(fragments[source_tracks[0].track_id]["bases"]) > 1
+
+    for source in source_tracks:
+        track = fragments[source.track_id]
+        assert track["data"] == sample_data(TEST_MP4, source)
+        assert track["durations"] == source.durations[:len(source)]
+        assert track["offsets"] == (source.composition_offsets or [0] * len(source))[:len(source)]
+        assert track["sync"] == [source.is_sync(index) for index in range(len(source))]
+        # Each fragment's decode time is the sum of the durations before it
+        assert track["bases"] == [sum(track["durations"][:start]) for start in track["starts"]]
+        assert all(track["sync"][start] for start in track["starts"])
+
+    # The moov holds no samples, and the moof boxes are announced in mvex
+    with open(target, "rb") as f:
+        boxes = list(top_level_boxes(f))
+        moov = read_moov(f, boxes)
+    assert [box_type for box_type, *_ in boxes][:3] == ["ftyp", "moov", "sidx"]
+    assert moov.find("mvex") is not None
+    for track in read_tracks(target):
+        assert len(track) == 0
+
+
+def test_fragment_sidx_indexes_each_fragment(tmp_path, source_tracks):
+    target = tmp_path / "fragmented.mp4"
+    fragment_mp4(str(TEST_MP4), str(target), duration=2.0)
+    data = target.read_bytes()
+    with open(target, "rb") as f:
+        boxes = list(top_level_boxes(f))
+    _, offset, header, size = next(box for box in boxes if box[0] == "sidx")
+    sidx = data[offset + header:offset + size]
+    reference_id, timescale, _, first_offset, _, count = struct.unpack_from(">IIQQHH", sidx, 4)
+    references = [struct.unpack_from(">III", sidx, 32 + 12 * n) for n in range(count)]
+
+    reference = next(track for track in source_tracks if track.track_id == reference_id)
+    assert timescale == reference.timescale
+    assert first_offset == 0
+    # Each reference covers one moof and its mdat, starting where the previous one ends
+    fragments = [
+        boxes[n][3] + boxes[n + 1][3] for n in range(len(boxes)) if boxes[n][0] == "moof"
+    ]
+    assert [size for size, _, _ in references] == fragments
+    assert sum(duration for _, duration, _ in references) == sum(reference.durations)
+    assert all(sap >> 31 for _, _, sap in references)
+
+
+def test_fragment_leaves_fragmented_files(tmp_path):
+    target = tmp_path / "fragmented.mp4"
+    fragment_mp4(str(TEST_MP4), str(target))
+    assert fragment_mp4(str(target), str(tmp_path / "again.mp4")) is None
@@ -0,0 +1,180 @@
+"""OU-XML, written by the ouxml builder from a small book."""
+
+from xml.etree import ElementTree
+
+import base64
+import hashlib
+import importlib
+import json
+
+import pytest
+
+CONF = """\
+extensions = ["sphinxcontrib_ou_media"]
+exclude_patterns = ["_build", "_tmp"]
+ou = {"module_code": "TM129", "block": 2, "presentation": "J", "module_title": "Robotics"}
+"""
+
+INDEX = """\
+Book
+====
+
+.. toctree::
+   :caption: Robots
+
+   ch1
+   ch2
+"""
+
+CH1 = """\
+Moving
+======
+
+Forwards.
+
+.. toctree::
+
+   sec1
+
+.. figure:: diagram.png
+
+   A diagram.
+
+.. glossary::
+
+   Robot
+      A machine that moves.
+"""
+
+SEC1 = """\
+Turning
+=======
+
+.. figure:: diagram.png
+
+   Another diagram.
+
+.. ou-audio:: clip.mp3
+"""
+
+CH2 = """\
+Stopping
+========
+
+.. figure:: diagram.png
+
+   The last diagram.
+
+.. glossary::
+
+   Brake
+      What stops a robot.
+"""
+
+# A 1x1 pixel PNG, and one MP3 frame
+PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
+)
+MP3 = b"\xff\xfb\x90\x00" + b"\0" * 413
+
+ITEM = "tm129_b2_p1_j"
+
+
+@pytest.fixture
+def ou_book(book):
+    book.write("conf.py", CONF)
+    book.write("index.rst", INDEX)
+    book.write("ch1.rst", CH1)
+    book.write("sec1.rst", SEC1)
+    book.write("ch2.rst", CH2)
+    (book.srcdir / "diagram.png").write_bytes(PNG)
+    (book.srcdir / "clip.mp3").write_bytes(MP3)
+    return book
+
+
+def read_item(book, buildername="ouxml"):
+    text = book.read(f"{ITEM}.xml", buildername)
+    return text, ElementTree.fromstring(text.encode("utf-8"))
+
+
+def test_item_and_unit_structure(ou_book):
+    ou_book.build("ouxml")
+    _, item = read_item(ou_book)
+    assert item.tag == "Item"
+    assert item.get("id") == f"X_{ITEM}"
+    assert item.findtext("CourseCode") == "TM129"
+    assert item.findtext("ItemTitle") == "TM129 Block 2, Part 1: Moving"
+    unit = item.find("Unit")
+    assert unit.findtext("UnitTitle") == "Robots: Moving"
+    sessions = unit.findall("Session")
+    assert [session.findtext("Title") for session in sessions] == ["1 Moving", "2 Stopping"]
+    # A chapter's own toctree documents are its sections
+    assert [section.findtext("Title") for section in sessions[0].findall("Section")] == [
+        "1.1 Turning"
+    ]
+    assert sessions[1].findall("Section") == []
+
+
+def test_numbers_are_filled_in_book_order(ou_book):
+    ou_book.build("ouxml")
+    text, item = read_item(ou_book)
+    assert "<?ou-number" not in text
+    # The fragments keep their markers, to be numbered on assembly
+    assert "<?ou-number figure?>" in ou_book.read("_fragments/ch2.xml", "ouxml")
+    assert [caption.text for caption in item.iter("Caption")] == [
+        "Figure 1 A diagram.", "Figure 2 Another diagram.", "Figure 3 The last diagram."
+    ]
+
+
+def test_glossary_back_matter(ou_book):
+    ou_book.build("ouxml")
+    _, item = read_item(ou_book)
+    glossary = item.find("Unit/BackMatter/Glossary")
+    assert [
+        (entry.findtext("Term"), entry.findtext("Definition"))
+        for entry in glossary.findall("GlossaryItem")
+    ] == [("Robot", "A machine that moves."), ("Brake", "What stops a robot.")]
+
+
+def test_media_manifest(ou_book):
+    ou_book.build("ouxml")
+    _, item = read_item(ou_book)
+    image = f"{ITEM}_fig_diagram.png"
+    audio = f"{ITEM}_media_clip.mp3"
+    assert {node.get("src") for node in item.iter("Image")} == {image}
+    assert item.find(".//MediaContent").get("src") == audio
+
+    outdir = ou_book.outdir("ouxml")
+    manifest = json.loads((outdir / "media-manifest.json").read_text())
+    assert set(manifest["files"]) == {image, audio}
+    assert manifest["files"][image]["source"] == "diagram.png"
+    assert manifest["files"][image]["hash"] == hashlib.sha256(PNG).hexdigest()
+    assert manifest["files"][audio]["size"] == len(MP3)
+    changes = json.loads((outdir / "media-changes.json").read_text())
+    assert sorted(changes["added"]) == [image, audio]
+
+    # Nothing to upload again until a file changes
+    ou_book.build("ouxml")
+    changes = json.loads((outdir / "media-changes.json").read_text())
+    assert changes["added"] == changes["changed"] == []
+
+
+def test_html_build_also_writes_ouxml(ou_book, monkeypatch):
+    audio = importlib.import_module("sphinxcontrib.ou-audio").Audio
+    runs = []
+    run = audio.run
+
+    def counted_run(self):
+        runs.append(self.env.docname)
+        return run(self)
+
+    monkeypatch.setattr(audio, "run", counted_run)
+    app = ou_book.build("html", ou_ouxml_outdir="ouxml")
+
+    assert (ou_book.outdir("html") / "sec1.html").exists()
+    _, item = read_item(ou_book)
+    assert item.find(".//MediaContent").get("src") == f"{ITEM}_media_clip.mp3"
+    # The documents were read, and their directives run, once for both outputs
+    assert runs == ["sec1"]
+    assert app.builder.name == "html"
+    assert app.env._builder_cls is type(app.builder)
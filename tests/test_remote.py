@@ -0,0 +1,94 @@
+"""Remote media checks, against an HTTP server on localhost."""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import asyncio
+import threading
+
+import pytest
+
+from sphinxcontrib_ou_media.remote import check_urls
+
+ETAG = '"v1"'
+
+
+class Handler(BaseHTTPRequestHandler):
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def respond(self, status, headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.requests.append(("HEAD", self.path, dict(self.headers)))
+        if self.path == "/ok":
+            self.respond(200, [("Content-Length", "1234"), ("ETag", ETAG)])
+        elif self.path == "/cached":
+            if self.headers.get("If-None-Match") == ETAG:
+                self.respond(304)
+            else:
+                self.respond(200, [("Content-Length", "99"), ("ETag", ETAG)])
+        elif self.path == "/no-head":
+            self.respond(405, [("Allow", "GET")])
+        else:
+            self.respond(404)
+
+    def do_GET(self):
+        self.requests.append(("GET", self.path, dict(self.headers)))
+        if self.path == "/no-head" and self.headers.get("Range") == "bytes=0-0":
+            self.respond(206, [("Content-Range", "bytes 0-0/5678"), ("Content-Length", "1")])
+            self.wfile.write(b"x")
+        else:
+            self.respond(404)
+
+
+@pytest.fixture
+def server():
+    Handler.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_ok_and_missing(server):
+    results = check_urls([f"{server}/ok", f"{server}/missing"], connections=2)
+    ok, missing = results[f"{server}/ok"], results[f"{server}/missing"]
+    assert ok["status"] == 200 and ok["error"] is None
+    assert ok["length"] == 1234 and ok["etag"] == ETAG
+    assert missing["status"] == 404 and missing["error"].startswith("404")
+
+
+def test_cached_etag_is_not_modified(server):
+    url = f"{server}/cached"
+    first = check_urls([url])
+    second = check_urls([url], cache=first)
+    assert second[url]["status"] == 304
+    assert second[url]["error"] is None
+    # The cached size is kept
+    assert second[url]["length"] == 99
+    assert Handler.requests[-1][2].get("If-None-Match") == ETAG
+
+
+def test_rejected_head_falls_back_to_get(server):
+    url = f"{server}/no-head"
+    result = check_urls([url])[url]
+    assert result["status"] == 206 and result["error"] is None
+    assert result["length"] == 5678
+    assert [(method, path) for method, path, _ in Handler.requests] == [
+        ("HEAD", "/no-head"), ("GET", "/no-head")
+    ]
+
+
+def test_check_from_a_running_event_loop(server):
+    async def check():
+        return check_urls([f"{server}/ok"])
+
+    assert asyncio.run(check())[f"{server}/ok"]["status"] == 200
@@ -0,0 +1,90 @@
+"""Fragment validation, reported against the source lines."""
+
+import pytest
+
+pytest.importorskip("xmlschema")
+
+CONF = """\
+extensions = ["sphinxcontrib_ou_media"]
+exclude_patterns = ["_build", "_tmp"]
+ou = {
+    "module_code": "TM129",
+    "block": 2,
+    "presentation": "J",
+    "validate": True,
+    "schema": "schema/ouxml.xsd",
+}
+"""
+
+# Sessions may only hold a title and paragraphs
+SCHEMA = """\
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <xs:element name="Item">
+    <xs:complexType>
+      <xs:sequence>
+        <xs:element name="CourseCode" type="xs:string"/>
+        <xs:element name="CourseTitle" type="xs:string"/>
+        <xs:element name="ItemID" type="xs:string"/>
+        <xs:element name="ItemTitle" type="xs:string"/>
+        <xs:element name="Unit">
+          <xs:complexType>
+            <xs:sequence>
+              <xs:element name="UnitID" type="xs:string"/>
+              <xs:element name="UnitTitle" type="xs:string"/>
+              <xs:element name="Session" type="Session" maxOccurs="unbounded"/>
+            </xs:sequence>
+          </xs:complexType>
+        </xs:element>
+      </xs:sequence>
+      <xs:anyAttribute processContents="skip"/>
+    </xs:complexType>
+  </xs:element>
+  <xs:complexType name="Session">
+    <xs:sequence>
+      <xs:element name="Title" type="xs:string"/>
+      <xs:element name="Paragraph" type="xs:string" minOccurs="0" maxOccurs="unbounded"/>
+    </xs:sequence>
+    <xs:anyAttribute processContents="skip"/>
+  </xs:complexType>
+</xs:schema>
+"""
+
+INDEX = """\
+Book
+====
+
+.. toctree::
+
+   valid
+   invalid
+"""
+
+VALID = """\
+Valid
+=====
+
+Just a paragraph.
+"""
+
+INVALID = """\
+Invalid
+=======
+
+A paragraph.
+
+* Lists are not allowed here.
+"""
+
+
+def test_schema_errors_are_reported_against_the_source_line(book):
+    book.write("conf.py", CONF)
+    book.write("schema/ouxml.xsd", SCHEMA)
+    book.write("index.rst", INDEX)
+    book.write("valid.rst", VALID)
+    book.write("invalid.rst", INVALID)
+    book.build("ouxml")
+
+    warnings = [line for line in book.warnings.getvalue().splitlines() if "ouxml:" in line]
+    assert len(warnings) == 1
+    assert f"{book.srcdir / 'invalid.rst'}:6: WARNING: ouxml:" in warnings[0]
+    assert "BulletedList" in warnings[0]
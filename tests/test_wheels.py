@@ -0,0 +1,78 @@
+"""Bundled Pyodide wheels, so snippets and their build need no network."""
+
+import json
+import re
+import socket
+import zipfile
+
+import pytest
+
+CONF = """\
+extensions = ["sphinxcontrib_ou_media"]
+exclude_patterns = ["_build", "_tmp"]
+ou_codestyle_wheel_dir = "wheels"
+"""
+
+INDEX = """\
+Book
+====
+
+.. ou-codestyle:: python
+   :type: thebelite
+
+   import robots
+   robots.go()
+"""
+
+WHEELS = {
+    "robots": {
+        "robots/__init__.py": "",
+        "robots-1.0.dist-info/METADATA": "Name: robots\nRequires-Dist: motors\n",
+    },
+    "motors": {"motors.py": "", "motors-1.0.dist-info/METADATA": "Name: motors\n"},
+    "piplite": {"piplite/__init__.py": "", "piplite-1.0.dist-info/METADATA": "Name: piplite\n"},
+}
+
+# Elements that load an asset, rather than link to a page
+REMOTE_ASSET = re.compile(r"<(?:script|link|img|iframe|audio|video|source)\b[^>]*\b(?:src|href)=\"https?://")
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    def refuse(*args, **kwargs):
+        raise OSError("network access is disabled in this test")
+
+    monkeypatch.setattr(socket.socket, "connect", refuse)
+    monkeypatch.setattr(socket, "getaddrinfo", refuse)
+
+
+def test_offline_build_bundles_snippet_imports(book, offline):
+    book.write("conf.py", CONF)
+    book.write("index.rst", INDEX)
+    (book.srcdir / "wheels").mkdir()
+    for name, files in WHEELS.items():
+        with zipfile.ZipFile(book.srcdir / "wheels" / f"{name}-1.0-py3-none-any.whl", "w") as whl:
+            for filename, text in files.items():
+                whl.writestr(filename, text)
+    book.build()
+
+    assert not REMOTE_ASSET.search(book.read("index.html"))
+    (snippet,) = (book.srcdir / "_tmp").glob("JL-*.zip")
+    with zipfile.ZipFile(snippet) as zipf:
+        names = set(zipf.namelist())
+        html = zipf.read("index.html").decode()
+        index = json.loads(zipf.read("pypi/all.json"))
+    assert not REMOTE_ASSET.search(html)
+
+    # The import and its dependency are installed from the bundle alone
+    settings = json.loads(
+        re.search(r'"@jupyterlite/pyodide-kernel-extension:kernel": (\{.*\})', html).group(1)
+    )
+    assert settings["disablePyPIFallback"] is True
+    assert settings["pipliteUrls"] == ["./pypi/all.json"]
+    assert settings["pipliteWheelUrl"] == "./pypi/piplite-1.0-py3-none-any.whl"
+    assert set(index) == {"robots", "motors", "piplite"}
+    assert {f"pypi/{name}-1.0-py3-none-any.whl" for name in WHEELS} <= names
+    # The runtime the page loads is in the bundle too
+    for asset in re.findall(r'(?:src|href)="\./([^"]+)"', html):
+        assert asset in names